@@ -11,7 +11,7 @@ class UserAdmin(BaseUserAdmin):
     search_fields = ('email', 'full_name')
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
-        ('Personal info', {'fields': ('full_name', 'preferred_voice')}),
+        ('Personal info', {'fields': ('full_name', 'preferred_voice', 'voice_profile')}),
         ('Permissions', {'fields': ('is_active', 'is_staff', 'is_superuser', 'is_verified', 'groups', 'user_permissions')}),
         ('Important dates', {'fields': ('last_login', 'created_at', 'updated_at')}),
     )
@@ -22,6 +22,7 @@ class UserAdmin(BaseUserAdmin):
         }),
     )
     filter_horizontal = ('groups', 'user_permissions')
+    raw_id_fields = ('voice_profile',)
 
 
 @admin.register(OTP)
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_user_accent_color_user_avatar_url_user_display_name_and_more'),
+        ('tts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='voice_profile',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='tts.voiceprofile'),
+        ),
+    ]
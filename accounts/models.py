@@ -41,10 +41,16 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_staff = models.BooleanField(default=False)
     is_verified = models.BooleanField(default=False)
 
-    # Deprecated TTS fields retained for backward compatibility (unused)
+    # Voice name for chat.views.message_speech; empty or unknown means the engine's default voice
     preferred_voice = models.CharField(max_length=100, blank=True, default='')
+    # Deprecated TTS fields retained for backward compatibility (unused); a provider's clone id
+    # cannot be turned into a VoiceProfile, so existing values are kept rather than dropped
     cloned_voice_id = models.CharField(max_length=100, blank=True, null=True)
     cloned_voice_provider = models.CharField(max_length=50, blank=True, null=True)
+    # The user's own cloned voice, used instead of preferred_voice when set
+    voice_profile = models.ForeignKey(
+        'tts.VoiceProfile', on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+    )
 
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
@@ -9,6 +9,8 @@ from django.utils import timezone
 from django.core.mail import send_mail
 from django.conf import settings
 
+from chat import metrics
+
 from .models import User, OTP
 
 
@@ -30,14 +32,16 @@ def register(request: HttpRequest) -> HttpResponse:
             type='email_verification',
             expiration_time=timezone.now() + timedelta(hours=1),
         )
+        metrics.OTPS_ISSUED.inc(type=otp.type)
         verify_link = request.build_absolute_uri(reverse('accounts:verify_email') + f'?email={email}&code={code}')
-        send_mail(
+        sent = send_mail(
             subject='Verify your account',
             message=f'Welcome {full_name or email}! Verify your account using this link: {verify_link}',
             from_email=settings.DEFAULT_FROM_EMAIL,
             recipient_list=[email],
             fail_silently=True,
         )
+        metrics.EMAILS_SENT.inc(kind='email_verification', outcome='sent' if sent else 'failed')
         return redirect('accounts:login')
     return render(request, 'accounts/register.html')
 
@@ -90,13 +94,15 @@ def forgot_password(request: HttpRequest) -> HttpResponse:
             type='password_reset',
             expiration_time=timezone.now() + timedelta(minutes=15),
         )
-        send_mail(
+        metrics.OTPS_ISSUED.inc(type='password_reset')
+        sent = send_mail(
             subject='Your password reset code',
             message=f'Use this OTP to reset your password: {code}',
             from_email=settings.DEFAULT_FROM_EMAIL,
             recipient_list=[email],
             fail_silently=True,
         )
+        metrics.EMAILS_SENT.inc(kind='password_reset', outcome='sent' if sent else 'failed')
         return redirect(reverse('accounts:verify_otp') + f'?email={email}')
     return render(request, 'accounts/forgot_password.html')
 
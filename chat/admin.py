@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Chat, Message
+from .models import BackgroundJob, Chat, Message
 
 
 @admin.register(Chat)
@@ -13,4 +13,10 @@ class ChatAdmin(admin.ModelAdmin):
 class MessageAdmin(admin.ModelAdmin):
     list_display = ('id', 'chat', 'role', 'created_at')
     search_fields = ('content',)
-    list_filter = ('role',)
\ No newline at end of file
+    list_filter = ('role',)
+
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'attempts', 'created_at', 'updated_at')
+    list_filter = ('kind', 'status')
@@ -1,6 +1,35 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_migrate
 
 
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'chat'
\ No newline at end of file
+    name = 'chat'
+
+    def ready(self):
+        # Register background job handlers
+        from . import tasks  # noqa: F401
+
+        from .instrumentation import install_query_hook
+        from .memory import on_memory_changed
+        from .models import UserMemory
+
+        # Charge every query to the request or job that ran it
+        connection_created.connect(install_query_hook)
+
+        post_save.connect(on_memory_changed, sender=UserMemory)
+        post_delete.connect(on_memory_changed, sender=UserMemory)
+        pre_migrate.connect(_detach_search_index, sender=self)
+        post_migrate.connect(_attach_search_index, sender=self)
+
+
+def _detach_search_index(using, **kwargs):
+    from . import search
+    search.detach(connections[using])
+
+
+def _attach_search_index(using, **kwargs):
+    from . import search
+    search.attach(connections[using])
@@ -0,0 +1,116 @@
+"""Async variants of the chat endpoints that wait on the LLM.
+
+Under ``ttss.asgi`` these views await the upstream call on the event loop
+instead of parking a thread from the sync-to-async pool for the whole
+generation, so one worker can hold many slow requests at once.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.shortcuts import aget_object_or_404
+from django.views.decorators.http import require_POST
+
+from . import llm, singleflight
+from .models import Chat
+from .views import (
+    DEFAULT_CHAT_MODEL,
+    _await_duplicate_turn,
+    _build_openai_payload,
+    _create_chat_with_title,
+    _drop_last_reply,
+    _finish_turn,
+    _idempotency_key,
+    _llm_error_response,
+    _parse_turn,
+    _start_turn,
+    _turn_meta,
+)
+
+# The database work is shared with the sync views; only the LLM call is awaited natively
+_abuild_openai_payload = sync_to_async(_build_openai_payload)
+_acreate_chat_with_title = sync_to_async(_create_chat_with_title)
+_adrop_last_reply = sync_to_async(_drop_last_reply)
+_afinish_turn = sync_to_async(_finish_turn)
+_astart_turn = sync_to_async(_start_turn)
+_aacquire = sync_to_async(singleflight.acquire)
+_acomplete = sync_to_async(singleflight.complete)
+_aabandon = sync_to_async(singleflight.abandon)
+
+
+@login_required
+@require_POST
+async def create_chat(request: HttpRequest) -> JsonResponse:
+    user = await request.auser()
+    text = request.POST.get('title', '')
+    model = (request.POST.get('model', '').strip() or DEFAULT_CHAT_MODEL)
+    chat = await _acreate_chat_with_title(user, text, model)
+    return JsonResponse({
+        'chat_id': chat.id,
+        'title': chat.title,
+        'model': chat.model,
+        'title_pending': bool(text.strip()),
+    })
+
+
+@login_required
+@require_POST
+async def send_message(request: HttpRequest) -> HttpResponse:
+    parsed = _parse_turn(request)
+    if isinstance(parsed, HttpResponse):
+        return parsed
+    user_text, chat_id_str, model = parsed
+    user = await request.auser()
+
+    idempotency_key = _idempotency_key(request)
+    key = singleflight.turn_key(user.id, chat_id_str, user_text, idempotency_key)
+    if await _aacquire(key, idempotent=bool(idempotency_key)):
+        try:
+            chat, created, payload = await _astart_turn(user, user_text, chat_id_str, model)
+            try:
+                assistant_text = await llm.achat_completion(payload)
+            except Exception as e:
+                await _aabandon(key, str(e))
+                return _llm_error_response(e)
+            message = await _afinish_turn(chat, assistant_text)
+            result = {**_turn_meta(chat, created), 'message_id': message.id, 'content': assistant_text}
+            await _acomplete(key, result, idempotent=bool(idempotency_key))
+        except BaseException as e:
+            await _aabandon(key, str(e))
+            raise
+        deduplicated = False
+    else:
+        # Waiting blocks, so it must not hold the thread shared by the other sync_to_async calls
+        result = await sync_to_async(_await_duplicate_turn, thread_sensitive=False)(key)
+        if isinstance(result, HttpResponse):
+            return result
+        deduplicated = True
+
+    return JsonResponse({
+        **{k: result[k] for k in ('chat_id', 'created', 'title', 'title_pending', 'model')},
+        'deduplicated': deduplicated,
+        'assistant': {
+            'role': 'assistant',
+            'content': result['content'],
+        },
+    })
+
+
+@login_required
+@require_POST
+async def regenerate_response(request: HttpRequest, chat_id: int) -> HttpResponse:
+    if not llm.is_configured():
+        return HttpResponseBadRequest('Server missing OPENAI_API_KEY')
+    user = await request.auser()
+    chat = await aget_object_or_404(Chat, id=chat_id, user=user)
+    model = chat.model or DEFAULT_CHAT_MODEL
+    if not await _adrop_last_reply(chat):
+        return HttpResponseBadRequest('No user message to regenerate from')
+
+    payload = await _abuild_openai_payload(model=model, chat=chat, user=user)
+    try:
+        assistant_text = await llm.achat_completion(payload)
+    except Exception as e:
+        return _llm_error_response(e)
+
+    await _afinish_turn(chat, assistant_text)
+    return JsonResponse({'assistant': {'role': 'assistant', 'content': assistant_text}})
@@ -0,0 +1,257 @@
+"""End-to-end benchmark of the chat endpoints.
+
+Requests are issued in-process through ``django.test.Client`` by a pool
+of worker threads, each logged in as one of the users created by
+:func:`chat.seed.seed`. Every request is timed and the SQL it ran is
+counted through a per-thread ``execute_wrapper``. Memory is measured in a
+separate single-threaded pass with ``tracemalloc``, so its overhead does
+not distort the timed phase. Upstream LLM calls go wherever
+``OPENAI_API_URL`` points, normally the ``stub_openai`` server.
+"""
+import itertools
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+
+from django.db import connection
+from django.test import Client
+
+from .models import Chat, Message
+
+ENDPOINTS = ('list_chats', 'get_chat', 'send_message', 'edit_message', 'regenerate_response', 'delete_chat')
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+@dataclass
+class Sample:
+    seconds: float
+    queries: int
+    query_seconds: float
+    status: int
+
+
+@dataclass
+class Workload:
+    """Per-user pools of object ids that the request builders draw from."""
+    clients: Dict[int, Client]
+    chats: Dict[int, List[int]]
+    user_messages: Dict[int, List[int]]
+    deletable: Dict[int, List[int]] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    counter: itertools.count = field(default_factory=itertools.count)
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def build_workload(users: List, rng: random.Random) -> Workload:
+    clients, chats, user_messages, deletable = {}, {}, {}, {}
+    for user in users:
+        client = Client()
+        client.force_login(user)
+        clients[user.id] = client
+        ids = list(Chat.objects.filter(user=user).order_by('id').values_list('id', flat=True))
+        rng.shuffle(ids)
+        # Keep a slice of each user's chats aside for delete_chat so the other endpoints never lose theirs
+        cut = max(1, len(ids) // 4) if len(ids) > 1 else 0
+        deletable[user.id], chats[user.id] = ids[:cut], ids[cut:] or ids
+        user_messages[user.id] = list(
+            Message.objects.filter(chat_id__in=chats[user.id], role='user').values_list('id', flat=True)[:1000]
+        )
+    return Workload(clients=clients, chats=chats, user_messages=user_messages, deletable=deletable)
+
+
+def _request_for(endpoint: str, user_id: int, workload: Workload, rng: random.Random) -> Tuple[str, str, Dict] | None:
+    """Return (method, path, data) for one request, or None when the user's pool is exhausted."""
+    n = next(workload.counter)
+    chats = workload.chats[user_id]
+    if endpoint == 'list_chats':
+        return 'get', '/chat/list/', {}
+    if endpoint == 'get_chat':
+        return 'get', f'/chat/api/chat/{rng.choice(chats)}/', {}
+    if endpoint == 'send_message':
+        # A unique text per request so coalescing and response caches do not short-circuit the turn
+        return 'post', '/chat/send/', {'chat_id': rng.choice(chats), 'message': f'Benchmark question {n}: how does it work?'}
+    if endpoint == 'edit_message':
+        if not workload.user_messages[user_id]:
+            return None
+        return 'post', f'/chat/message/{rng.choice(workload.user_messages[user_id])}/edit/', {'content': f'Edited text {n}'}
+    if endpoint == 'regenerate_response':
+        return 'post', f'/chat/chat/{rng.choice(chats)}/regenerate/', {}
+    if endpoint == 'delete_chat':
+        with workload.lock:
+            pool = workload.deletable[user_id]
+            if not pool:
+                return None
+            chat_id = pool.pop()
+        return 'post', f'/chat/chat/{chat_id}/delete/', {}
+    raise ValueError(f'Unknown endpoint {endpoint}')
+
+
+def _issue(client: Client, method: str, path: str, data: Dict) -> Sample:
+    counter = _QueryCounter()
+    with connection.execute_wrapper(counter):
+        started = time.perf_counter()
+        response = getattr(client, method)(path, data)
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)
+        seconds = time.perf_counter() - started
+    return Sample(seconds=seconds, queries=counter.count, query_seconds=counter.seconds, status=response.status_code)
+
+
+def run_endpoint(endpoint: str, workload: Workload, requests: int, concurrency: int, seed_value: int = 0) -> Tuple[List[Sample], float]:
+    """Issue ``requests`` calls to ``endpoint`` from ``concurrency`` threads. Returns (samples, wall seconds)."""
+    user_ids = sorted(workload.clients)
+    samples: List[Sample] = []
+    samples_lock = threading.Lock()
+
+    def worker(index: int) -> None:
+        rng = random.Random(f'{seed_value}:{endpoint}:{index}')
+        # Clients are not thread-safe; each thread gets its own copies sharing the logged-in sessions
+        clients: Dict[int, Client] = {}
+        try:
+            for i in range(index, requests, concurrency):
+                user_id = user_ids[i % len(user_ids)]
+                request = _request_for(endpoint, user_id, workload, rng)
+                if request is None:
+                    continue
+                client = clients.get(user_id)
+                if client is None:
+                    client = clients[user_id] = Client()
+                    client.cookies.load(workload.clients[user_id].cookies.output(header='', sep=';'))
+                try:
+                    sample = _issue(client, *request)
+                except Exception:
+                    sample = Sample(seconds=0.0, queries=0, query_seconds=0.0, status=0)
+                with samples_lock:
+                    samples.append(sample)
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f'bench-{endpoint}') as executor:
+        list(executor.map(worker, range(concurrency)))
+    return samples, time.perf_counter() - started
+
+
+def measure_memory(endpoint: str, workload: Workload, requests: int, seed_value: int = 0) -> Dict[str, float]:
+    """Peak and retained Python allocations per request, measured one request at a time."""
+    rng = random.Random(f'{seed_value}:{endpoint}:memory')
+    user_ids = sorted(workload.clients)
+    peaks, retained = [], []
+    tracemalloc.start()
+    try:
+        for i in range(requests):
+            user_id = user_ids[i % len(user_ids)]
+            request = _request_for(endpoint, user_id, workload, rng)
+            if request is None:
+                break
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            _issue(workload.clients[user_id], *request)
+            after, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(after - before)
+    finally:
+        tracemalloc.stop()
+    if not peaks:
+        return {}
+    return {
+        'peak_kib_mean': round(statistics.fmean(peaks) / 1024, 1),
+        'peak_kib_max': round(max(peaks) / 1024, 1),
+        'retained_kib_mean': round(statistics.fmean(retained) / 1024, 1),
+    }
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize(samples: List[Sample], wall_seconds: float) -> Dict[str, float]:
+    ok = [s for s in samples if 200 <= s.status < 400]
+    latencies = sorted(s.seconds * 1000 for s in ok)
+    summary = {
+        'requests': len(samples),
+        'errors': len(samples) - len(ok),
+        'error_rate': round((len(samples) - len(ok)) / len(samples), 4) if samples else 0.0,
+        'wall_seconds': round(wall_seconds, 3),
+        'throughput_rps': round(len(ok) / wall_seconds, 2) if wall_seconds else 0.0,
+        'latency_ms_mean': round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        'latency_ms_max': round(latencies[-1], 2) if latencies else 0.0,
+        'queries_mean': round(statistics.fmean(s.queries for s in ok), 2) if ok else 0.0,
+        'queries_max': max((s.queries for s in ok), default=0),
+        'query_ms_mean': round(statistics.fmean(s.query_seconds * 1000 for s in ok), 2) if ok else 0.0,
+    }
+    for pct in PERCENTILES:
+        summary[f'latency_ms_p{pct}'] = round(_percentile(latencies, pct), 2)
+    status_counts: Dict[str, int] = defaultdict(int)
+    for s in samples:
+        status_counts[str(s.status)] += 1
+    summary['status_counts'] = dict(status_counts)
+    return summary
+
+
+def compare(current: Dict, baseline: Dict, keys: Tuple[str, ...] = ('throughput_rps', 'latency_ms_p50', 'latency_ms_p95', 'latency_ms_p99', 'queries_mean')) -> Dict[str, Dict[str, float]]:
+    """Relative change (in percent) of selected metrics per endpoint against a previous run."""
+    changes: Dict[str, Dict[str, float]] = {}
+    for endpoint, metrics in current.get('endpoints', {}).items():
+        before = baseline.get('endpoints', {}).get(endpoint)
+        if not before:
+            continue
+        changes[endpoint] = {
+            key: round(100.0 * (metrics[key] - before[key]) / before[key], 1)
+            for key in keys if before.get(key)
+        }
+    return changes
+
+
+def run(
+    users: List,
+    endpoints: Tuple[str, ...],
+    requests: int,
+    concurrency: int,
+    memory_requests: int = 0,
+    seed_value: int = 0,
+    progress: Callable[[str], None] | None = None,
+) -> Dict[str, Dict]:
+    """Benchmark each endpoint in turn and return its summary, keyed by endpoint name."""
+    workload = build_workload(users, random.Random(seed_value))
+    results = {}
+    # delete_chat consumes chats, so it always runs last
+    for endpoint in sorted(endpoints, key=lambda e: e == 'delete_chat'):
+        samples, wall = run_endpoint(endpoint, workload, requests, concurrency, seed_value)
+        summary = summarize(samples, wall)
+        if memory_requests:
+            summary['memory'] = measure_memory(endpoint, workload, memory_requests, seed_value)
+        results[endpoint] = summary
+        if progress:
+            progress(
+                f'{endpoint:<20} {summary["throughput_rps"]:>8.1f} req/s  '
+                f'p50 {summary["latency_ms_p50"]:>8.1f} ms  p95 {summary["latency_ms_p95"]:>8.1f} ms  '
+                f'p99 {summary["latency_ms_p99"]:>8.1f} ms  {summary["queries_mean"]:>6.1f} queries  '
+                f'{summary["errors"]} errors ({summary["error_rate"]:.1%})'
+            )
+    return results
@@ -0,0 +1,100 @@
+"""Token-budgeted context window for chat completions.
+
+Instead of a fixed number of recent messages, the newest turns are packed
+until the model's budget is used up. Per-message token counts are cached
+on ``Message.token_count`` so each turn only estimates new messages.
+"""
+from typing import Dict, List
+
+from django.conf import settings
+
+from .models import Message
+from .pagination import keyset_filter
+from .tokens import MESSAGE_OVERHEAD, REPLY_PRIMING, estimate_tokens
+
+# Context window sizes in tokens
+MODEL_CONTEXT_LIMITS = {
+    'gpt-5': 400_000,
+    'gpt-4o': 128_000,
+    'gpt-4o-mini': 128_000,
+    'gpt-4-turbo': 128_000,
+    'gpt-4': 8_192,
+    'gpt-3.5-turbo': 16_385,
+}
+DEFAULT_CONTEXT_LIMIT = 8_192
+
+_FETCH_BATCH = 50
+
+
+def context_limit(model: str) -> int:
+    if model in MODEL_CONTEXT_LIMITS:
+        return MODEL_CONTEXT_LIMITS[model]
+    # Dated snapshots such as gpt-4o-2024-08-06 share their family's window
+    for name in sorted(MODEL_CONTEXT_LIMITS, key=len, reverse=True):
+        if model.startswith(name):
+            return MODEL_CONTEXT_LIMITS[name]
+    return DEFAULT_CONTEXT_LIMIT
+
+
+def history_budget(model: str, reserved_tokens: int = 0) -> int:
+    """Tokens available for chat history after the reply reserve and ``reserved_tokens``."""
+    window = context_limit(model) - settings.CHAT_REPLY_RESERVE_TOKENS
+    return max(0, min(window, settings.CHAT_CONTEXT_MAX_TOKENS) - reserved_tokens - REPLY_PRIMING)
+
+
+def _truncate_to_budget(content: str, budget: int) -> str:
+    """Keep the start of an oversized message so that it fits in ``budget`` tokens."""
+    low, high = 0, len(content)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(content[:mid]) + MESSAGE_OVERHEAD <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return content[:low]
+
+
+def build_context(chat, model: str, reserved_tokens: int = 0) -> List[Dict[str, str]]:
+    """Return the newest messages of ``chat`` (oldest first) that fit the model's budget.
+
+    Messages already folded into the chat's rolling summary are skipped. The
+    newest message is always included, truncated if it alone exceeds the budget.
+    """
+    budget = history_budget(model, reserved_tokens)
+    queryset = Message.objects.filter(chat=chat)
+    if chat.summarized_through_id is not None:
+        queryset = queryset.filter(id__gt=chat.summarized_through_id)
+    queryset = queryset.order_by('-created_at', '-id')
+
+    picked: List[Dict[str, str]] = []
+    stale: List[Message] = []
+    used = 0
+    page = queryset
+    done = False
+    while not done:
+        batch = list(page.values('id', 'role', 'content', 'token_count', 'created_at')[:_FETCH_BATCH])
+        if not batch:
+            break
+        # Keyset, not OFFSET: the next batch starts right after the oldest row of this one
+        page = queryset.filter(keyset_filter(['created_at', 'id'], [batch[-1]['created_at'], batch[-1]['id']], True))
+        for row in batch:
+            count = row['token_count']
+            if count is None:
+                count = estimate_tokens(row['content'])
+                stale.append(Message(id=row['id'], token_count=count))
+            cost = count + MESSAGE_OVERHEAD
+            if used + cost > budget:
+                if not picked:
+                    picked.append({'role': row['role'], 'content': _truncate_to_budget(row['content'], budget)})
+                done = True
+                break
+            picked.append({'role': row['role'], 'content': row['content']})
+            used += cost
+        if len(batch) < _FETCH_BATCH:
+            break
+
+    if stale:
+        # Rows written by bulk_create or before token counts existed
+        Message.objects.bulk_update(stale, ['token_count'])
+    picked.reverse()
+    return picked
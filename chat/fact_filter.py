@@ -0,0 +1,114 @@
+"""Local pre-filter that decides whether a message is worth GPT fact extraction.
+
+Cheap pattern rules settle the obvious cases (acknowledgements, code
+pastes, explicit "call me ..." statements); everything else is scored by a
+small logistic model whose weights ship in ``data/fact_filter.json``. No
+network calls are made. Decisions are counted so the savings can be
+reported, and exported as ``chat_fact_filter_decisions_total``.
+"""
+import json
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = Path(__file__).resolve().parent / 'data' / 'fact_filter.json'
+LOG_EVERY = 1000
+
+_ACKNOWLEDGEMENTS = {
+    'ok', 'okay', 'k', 'kk', 'thanks', 'thank you', 'thx', 'ty', 'cool', 'nice', 'great', 'yes', 'no',
+    'yep', 'nope', 'sure', 'lol', 'haha', 'hmm', 'hi', 'hello', 'hey', 'bye', 'good', 'awesome', 'got it',
+    'continue', 'go on', 'more', 'again', 'right', 'correct', 'perfect', 'alright', 'sounds good',
+}
+_FORCE_RE = re.compile(
+    r"\b(my name is|call me|call yourself|your name is|remember (that|this)|i(?:'m| am) \d{1,3} years old)\b",
+    re.IGNORECASE,
+)
+# "I'm Paul" / "I am Ada": a capitalised word right after "I am" is almost always a name
+_INTRODUCTION_RE = re.compile(r"\b[Ii](?:'m| am) [A-Z][a-z]+\b")
+_FIRST_PERSON_RE = re.compile(r"\b(i|i'm|im|i've|i'd|me|my|mine|myself|we|our|ours)\b", re.IGNORECASE)
+_CODE_RE = re.compile(r'```|^\s*(def|class|import|from|function|const|let|var|public|#include)\b|[;{}]\s*$', re.MULTILINE)
+_WORD_RE = re.compile(r"[a-z]+(?:'[a-z]+)?")
+_SPACE_RE = re.compile(r'\s+')
+
+_stats: Counter = Counter()
+_stats_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _model() -> Dict:
+    with open(MODEL_PATH, encoding='utf-8') as f:
+        model = json.load(f)
+    # Longest phrases first so overlapping phrases are scored once
+    model['phrases'] = sorted(model['phrase_weights'].items(), key=lambda kv: -len(kv[0]))
+    return model
+
+
+def _record(outcome: str) -> None:
+    metrics.FACT_FILTER_DECISIONS.inc(outcome=outcome)
+    with _stats_lock:
+        _stats['checked'] += 1
+        _stats[outcome] += 1
+        checked = _stats['checked']
+        if checked % LOG_EVERY == 0:
+            skipped = checked - _stats['extract']
+            logger.info('fact filter: %d checked, %d skipped (%.1f%% of extraction calls saved)',
+                        checked, skipped, 100.0 * skipped / checked)
+
+
+def stats() -> Dict[str, int]:
+    with _stats_lock:
+        return dict(_stats)
+
+
+def score(text: str) -> float:
+    """Probability-like score that ``text`` shares a personal fact."""
+    model = _model()
+    lowered = _SPACE_RE.sub(' ', text.lower()).strip()
+    logit = model['bias']
+
+    remaining = f' {lowered} '
+    for phrase, weight in model['phrases']:
+        if f' {phrase} ' in remaining:
+            logit += weight
+            remaining = remaining.replace(f' {phrase} ', ' ')
+
+    token_weights = model['token_weights']
+    for token in set(_WORD_RE.findall(lowered)):
+        logit += token_weights.get(token, 0.0)
+
+    features = model['feature_weights']
+    if lowered.endswith('?'):
+        logit += features['question']
+    if len(lowered) > 600:
+        logit += features['long_message']
+    if _CODE_RE.search(text):
+        logit += features['code_like']
+    return 1.0 / (1.0 + math.exp(-logit))
+
+
+def should_extract(text: str) -> bool:
+    """Return True if ``text`` should be sent to the LLM for fact extraction."""
+    normalized = _SPACE_RE.sub(' ', text.lower()).strip(' .!?,')
+    if not normalized or normalized in _ACKNOWLEDGEMENTS or len(normalized) < 4:
+        _record('skip_rule')
+        return False
+    if _FORCE_RE.search(text) or _INTRODUCTION_RE.search(text):
+        _record('extract')
+        return True
+    if not _FIRST_PERSON_RE.search(text) and not re.search(r'\byou(rself)?\b', normalized):
+        _record('skip_rule')
+        return False
+    if score(text) < _model()['threshold']:
+        _record('skip_model')
+        return False
+    _record('extract')
+    return True
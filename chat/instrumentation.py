@@ -0,0 +1,125 @@
+"""Per-request accounting of where time goes: database, upstream LLM, the rest.
+
+A :class:`Timings` record is made current for the duration of a request
+(see ``chat.middleware.RequestTimingMiddleware``) or background job, in a
+``ContextVar`` so it follows the work into ``sync_to_async`` threads and
+async views. Every database connection gets an execute wrapper that
+charges its queries to the current record. ``chat.llm`` charges upstream
+calls to the call site named by its ``site`` argument (``completion``,
+``title``, ``memory``, ``summary``).
+"""
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator
+
+logger = logging.getLogger('chat.timing')
+
+
+@dataclass
+class Timings:
+    started: float = field(default_factory=time.perf_counter)
+    db_queries: int = 0
+    db_seconds: float = 0.0
+    llm_seconds: Dict[str, float] = field(default_factory=lambda: defaultdict(float))
+    llm_calls: Counter = field(default_factory=Counter)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def wall_seconds(self) -> float:
+        return time.perf_counter() - self.started
+
+    def add_query(self, seconds: float) -> None:
+        with self.lock:
+            self.db_queries += 1
+            self.db_seconds += seconds
+
+    def add_llm(self, site: str, seconds: float, calls: int = 1) -> None:
+        with self.lock:
+            self.llm_seconds[site] += seconds
+            self.llm_calls[site] += calls
+
+    def as_dict(self) -> Dict:
+        with self.lock:
+            return {
+                'wall_ms': round(self.wall_seconds * 1000, 2),
+                'db_queries': self.db_queries,
+                'db_ms': round(self.db_seconds * 1000, 2),
+                'llm_ms': {site: round(s * 1000, 2) for site, s in self.llm_seconds.items()},
+                'llm_calls': dict(self.llm_calls),
+            }
+
+
+_current: contextvars.ContextVar[Timings | None] = contextvars.ContextVar('chat_timings', default=None)
+
+
+def current() -> Timings | None:
+    return _current.get()
+
+
+@contextmanager
+def activate(timings: Timings) -> Iterator[Timings]:
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def llm_call(site: str, count: bool = True) -> Iterator[None]:
+    """Charge the time spent in the block to upstream call site ``site``.
+
+    Pass ``count=False`` for the later parts of one call, such as reads from a stream.
+    """
+    timings = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.add_llm(site, time.perf_counter() - started, calls=1 if count else 0)
+
+
+def _record_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add_query(time.perf_counter() - started)
+
+
+def install_query_hook(sender, connection, **kwargs) -> None:
+    """``connection_created`` receiver: route every query on ``connection`` through the recorder.
+
+    The hook goes first in the list: ``connection.execute_wrapper()`` pops the last wrapper on
+    exit, and a connection opened inside such a block must not lose ours in its place.
+    """
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+def server_timing(timings: Timings) -> str:
+    """Render ``timings`` as a ``Server-Timing`` header value."""
+    with timings.lock:
+        parts = [
+            f'app;dur={timings.wall_seconds * 1000:.1f}',
+            f'db;dur={timings.db_seconds * 1000:.1f};desc="{timings.db_queries} queries"',
+        ]
+        for site, seconds in sorted(timings.llm_seconds.items()):
+            parts.append(f'llm-{site};dur={seconds * 1000:.1f};desc="{timings.llm_calls[site]} calls"')
+    return ', '.join(parts)
+
+
+def log(event: str, timings: Timings, **fields) -> None:
+    """Emit one JSON log line with ``fields`` and the accumulated timings."""
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({'event': event, **fields, **timings.as_dict()}, default=str))
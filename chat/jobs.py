@@ -0,0 +1,257 @@
+"""Tiny DB-backed job queue drained by an in-process thread pool.
+
+Jobs are persisted as ``BackgroundJob`` rows so nothing is lost if a worker
+process dies; the pool only speeds up pickup. Any process (or the
+``run_jobs`` management command) can claim a pending row, and claiming is
+a single conditional UPDATE so a job never runs twice concurrently.
+
+A claimed row holds a lease of ``CHAT_JOB_LEASE`` seconds. A row still
+'running' after that belonged to a worker that died mid-job; it is put
+back to pending by :func:`requeue_stale`, which ``run_pending`` calls
+first, or marked failed once it has used up its attempts.
+
+Kinds registered with :func:`register_batch` are not run one by one:
+pending jobs accumulate until ``size`` of them are queued or ``window``
+seconds pass, and the handler then receives all their payloads at once.
+
+A failed job is retried up to ``MAX_ATTEMPTS`` times, each time after
+twice the previous delay (starting at ``CHAT_JOB_RETRY_DELAY`` seconds),
+so a handler that keeps failing does not spin on the queue. The retry is
+armed on a timer in the failing process; ``run_pending`` (and so the
+``run_jobs`` command) also picks up any job whose delay has passed.
+"""
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Dict, List
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import instrumentation
+from .models import BackgroundJob
+
+MAX_ATTEMPTS = 3
+
+HANDLERS: Dict[str, Callable] = {}
+
+
+@dataclass
+class _BatchKind:
+    handler: Callable[[List[Dict]], None]
+    size: int
+    window: float
+    queued: int = 0
+    timer: threading.Timer | None = None
+
+
+BATCH_HANDLERS: Dict[str, _BatchKind] = {}
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+_batch_lock = threading.Lock()
+
+
+def register(kind: str):
+    """Register ``func`` as the handler for jobs of ``kind``. Payload keys become kwargs."""
+    def decorator(func: Callable) -> Callable:
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def register_batch(kind: str, size: int, window: float):
+    """Register ``func`` to receive the payloads of up to ``size`` jobs of ``kind`` per call."""
+    def decorator(func: Callable) -> Callable:
+        BATCH_HANDLERS[kind] = _BatchKind(handler=func, size=size, window=window)
+        return func
+    return decorator
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'CHAT_JOB_WORKERS', 2),
+                    thread_name_prefix='chat-jobs',
+                )
+                # Pick up anything left behind by a previous process
+                _executor.submit(run_pending)
+    return _executor
+
+
+def enqueue(kind: str, **payload) -> BackgroundJob:
+    """Persist a job and hand it to the worker pool once the transaction commits."""
+    job = BackgroundJob.objects.create(kind=kind, payload=payload)
+    if kind in BATCH_HANDLERS:
+        transaction.on_commit(lambda: _note_batch_job(kind))
+    else:
+        transaction.on_commit(lambda: _get_executor().submit(run_job, job.id))
+    return job
+
+
+def _note_batch_job(kind: str) -> None:
+    """Flush the batch once it is full, or arm the window timer for the first job in it."""
+    batch = BATCH_HANDLERS[kind]
+    with _batch_lock:
+        batch.queued += 1
+        if batch.queued >= batch.size:
+            batch.queued = 0
+            if batch.timer is not None:
+                batch.timer.cancel()
+                batch.timer = None
+            _get_executor().submit(run_batch, kind)
+        elif batch.timer is None:
+            batch.timer = threading.Timer(batch.window, _flush_batch_window, args=[kind])
+            batch.timer.daemon = True
+            batch.timer.start()
+
+
+def _flush_batch_window(kind: str) -> None:
+    batch = BATCH_HANDLERS[kind]
+    with _batch_lock:
+        batch.queued = 0
+        batch.timer = None
+    _get_executor().submit(run_batch, kind)
+
+
+def _claim(job_id: int) -> bool:
+    return bool(
+        BackgroundJob.objects
+        .filter(id=job_id, status='pending', run_after__lte=timezone.now())
+        .update(status='running', attempts=F('attempts') + 1, updated_at=timezone.now())
+    )
+
+
+def _finish(jobs: List[BackgroundJob], error: str | None, retryable: bool = True) -> None:
+    if error is None:
+        BackgroundJob.objects.filter(id__in=[j.id for j in jobs]).update(
+            status='done', last_error='', updated_at=timezone.now(),
+        )
+        return
+    for job in jobs:
+        if not (retryable and job.attempts < MAX_ATTEMPTS):
+            BackgroundJob.objects.filter(id=job.id).update(status='failed', last_error=error, updated_at=timezone.now())
+            continue
+        delay = retry_delay(job.attempts)
+        BackgroundJob.objects.filter(id=job.id).update(
+            status='pending', last_error=error, run_after=timezone.now() + timedelta(seconds=delay),
+            updated_at=timezone.now(),
+        )
+        if job.kind in BATCH_HANDLERS:
+            timer = threading.Timer(delay, _note_batch_job, args=[job.kind])
+        else:
+            timer = threading.Timer(delay, lambda job_id=job.id: _get_executor().submit(run_job, job_id))
+        timer.daemon = True
+        timer.start()
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds to wait before the next try of a job that has failed ``attempts`` times."""
+    return settings.CHAT_JOB_RETRY_DELAY * 2 ** (attempts - 1)
+
+
+def run_job(job_id: int) -> bool:
+    """Claim and run one pending job. Returns False if another worker got it first."""
+    try:
+        if not _claim(job_id):
+            return False
+
+        job = BackgroundJob.objects.get(id=job_id)
+        handler = HANDLERS.get(job.kind)
+        if handler is None and job.kind in BATCH_HANDLERS:
+            handler = lambda **payload: BATCH_HANDLERS[job.kind].handler([payload])  # noqa: E731
+        timings = instrumentation.Timings()
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for job kind '{job.kind}'")
+            with instrumentation.activate(timings):
+                handler(**job.payload)
+        except Exception:
+            _finish([job], traceback.format_exc(), retryable=handler is not None)
+            instrumentation.log('job', timings, kind=job.kind, jobs=1, ok=False)
+            return True
+
+        _finish([job], None)
+        instrumentation.log('job', timings, kind=job.kind, jobs=1, ok=True)
+        return True
+    finally:
+        close_old_connections()
+
+
+def run_batch(kind: str) -> int:
+    """Claim up to one batch of pending ``kind`` jobs and run them together. Returns the batch size."""
+    batch = BATCH_HANDLERS[kind]
+    try:
+        candidates = list(
+            BackgroundJob.objects
+            .filter(kind=kind, status='pending', run_after__lte=timezone.now())
+            .order_by('created_at')
+            .values_list('id', flat=True)[:batch.size]
+        )
+        claimed = [job_id for job_id in candidates if _claim(job_id)]
+        if not claimed:
+            return 0
+
+        jobs = list(BackgroundJob.objects.filter(id__in=claimed).order_by('created_at'))
+        timings = instrumentation.Timings()
+        try:
+            with instrumentation.activate(timings):
+                batch.handler([job.payload for job in jobs])
+        except Exception:
+            _finish(jobs, traceback.format_exc())
+            instrumentation.log('job', timings, kind=kind, jobs=len(jobs), ok=False)
+        else:
+            _finish(jobs, None)
+            instrumentation.log('job', timings, kind=kind, jobs=len(jobs), ok=True)
+        return len(jobs)
+    finally:
+        close_old_connections()
+
+
+def requeue_stale(older_than: float | None = None) -> int:
+    """Reclaim jobs claimed more than ``older_than`` seconds ago (``CHAT_JOB_LEASE`` by default).
+
+    A job with attempts left goes back to pending; one without is marked failed, so a job
+    that takes its worker down with it cannot do so forever. Returns how many were requeued.
+    """
+    lease = settings.CHAT_JOB_LEASE if older_than is None else older_than
+    stale = BackgroundJob.objects.filter(status='running', updated_at__lt=timezone.now() - timedelta(seconds=lease))
+    stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status='failed', last_error='Worker lost while running the job', updated_at=timezone.now(),
+    )
+    return stale.update(status='pending', updated_at=timezone.now())
+
+
+def wake() -> None:
+    """Have the worker pool look for pending jobs, such as ones :func:`requeue_stale` just reclaimed."""
+    transaction.on_commit(lambda: _get_executor().submit(run_pending))
+
+
+def run_pending(limit: int | None = None) -> int:
+    """Run pending jobs oldest first in the calling thread, after requeueing stale ones. Returns how many were run."""
+    requeue_stale()
+    ran = 0
+    for kind in BATCH_HANDLERS:
+        while limit is None or ran < limit:
+            count = run_batch(kind)
+            if not count:
+                break
+            ran += count
+
+    ids = (
+        BackgroundJob.objects
+        .filter(status='pending', run_after__lte=timezone.now())
+        .exclude(kind__in=list(BATCH_HANDLERS))
+        .order_by('created_at')
+        .values_list('id', flat=True)
+    )
+    if limit is not None:
+        ids = ids[:max(0, limit - ran)]
+    return ran + sum(1 for job_id in list(ids) if run_job(job_id))
@@ -0,0 +1,279 @@
+"""Pooled HTTP client for the OpenAI chat completions API.
+
+Every call goes through one keep-alive ``requests.Session`` per worker
+process, so repeated calls reuse warm TCP/TLS connections instead of
+paying a fresh handshake each time. Async views use the ``a``-prefixed
+helpers, which share one ``httpx.AsyncClient`` per event loop.
+
+Calls are retried, circuit-broken and optionally hedged as described in
+``chat.resilience``; when the upstream is down they raise
+:class:`UpstreamUnavailable`. Latency, outcome and token usage of every
+call are recorded in ``chat.metrics``.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import AsyncIterator, Dict, Iterator
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import instrumentation, metrics, resilience
+from .resilience import UpstreamUnavailable  # noqa: F401  (re-exported for views)
+
+_sessions: Dict[int, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def is_configured() -> bool:
+    return bool(settings.OPENAI_API_KEY)
+
+
+def get_session() -> requests.Session:
+    """Return this process's shared session, building it on first use (and after a fork)."""
+    pid = os.getpid()
+    session = _sessions.get(pid)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(pid)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=settings.LLM_POOL_SIZE,
+                    max_retries=0,
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({
+                    'Authorization': f'Bearer {settings.OPENAI_API_KEY}',
+                    'Content-Type': 'application/json',
+                    'Connection': 'keep-alive',
+                })
+                # Sessions inherited from a parent process must not be shared
+                _sessions.clear()
+                _sessions[pid] = session
+    return session
+
+
+def _timeout(read_timeout: float | None) -> tuple:
+    return (settings.LLM_CONNECT_TIMEOUT, read_timeout or settings.LLM_READ_TIMEOUT)
+
+
+@contextmanager
+def _observed(payload: Dict, site: str) -> Iterator[None]:
+    """Record one logical call (all its retries, to the end of any stream) in the metrics."""
+    model = payload.get('model') or 'default'
+    metrics.LLM_IN_FLIGHT.inc(model=model)
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    except (GeneratorExit, asyncio.CancelledError):
+        outcome = 'cancelled'
+        raise
+    except UpstreamUnavailable:
+        outcome = 'unavailable'
+        raise
+    finally:
+        metrics.LLM_IN_FLIGHT.dec(model=model)
+        metrics.LLM_REQUESTS.inc(model=model, site=site, outcome=outcome)
+        metrics.LLM_LATENCY.observe(time.perf_counter() - started, model=model, site=site)
+
+
+def _count_usage(payload: Dict, usage: Dict | None) -> None:
+    if not usage:
+        return
+    model = payload.get('model') or 'default'
+    for kind in ('prompt', 'completion'):
+        if usage.get(f'{kind}_tokens'):
+            metrics.LLM_TOKENS.inc(usage[f'{kind}_tokens'], model=model, kind=kind)
+
+
+def _stream_body(payload: Dict) -> str:
+    # Ask for the usage chunk at the end of the stream so streamed tokens are counted too
+    return json.dumps({**payload, 'stream': True, 'stream_options': {'include_usage': True}})
+
+
+def _post_completion(payload: Dict, read_timeout: float | None) -> str:
+    resp = get_session().post(
+        settings.OPENAI_API_URL,
+        data=json.dumps(payload),
+        timeout=_timeout(read_timeout),
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    _count_usage(payload, data.get('usage'))
+    return data['choices'][0]['message']['content']
+
+
+def chat_completion(payload: Dict, read_timeout: float | None = None, site: str = 'completion') -> str:
+    """Run a non-streaming completion and return the assistant message content.
+
+    ``site`` names the caller in request timings (see ``chat.instrumentation``).
+    """
+    with _observed(payload, site), instrumentation.llm_call(site):
+        return resilience.call(
+            payload.get('model'),
+            lambda: resilience.hedged(lambda: _post_completion(payload, read_timeout)),
+        )
+
+
+def _open_stream(payload: Dict, read_timeout: float | None) -> requests.Response:
+    resp = get_session().post(
+        settings.OPENAI_API_URL,
+        data=_stream_body(payload),
+        timeout=_timeout(read_timeout),
+        stream=True,
+    )
+    try:
+        resp.raise_for_status()
+    except requests.HTTPError:
+        resp.close()
+        raise
+    return resp
+
+
+_DONE = object()
+
+
+def _stream_delta(payload: Dict, line: str):
+    """The content delta in one SSE line, ``_DONE`` at the end of the stream, else None."""
+    if not line or not line.startswith('data:'):
+        return None
+    data = line[len('data:'):].strip()
+    if data == '[DONE]':
+        return _DONE
+    chunk = json.loads(data)
+    _count_usage(payload, chunk.get('usage'))
+    choices = chunk.get('choices') or []
+    return (choices[0].get('delta') or {}).get('content') if choices else None
+
+
+def _timed_lines(lines: Iterator[str], site: str) -> Iterator[str]:
+    """Charge only the time spent waiting on the upstream, not on the consumer, to ``site``."""
+    while True:
+        with instrumentation.llm_call(site, count=False):
+            line = next(lines, None)
+        if line is None:
+            return
+        yield line
+
+
+def stream_chat_completion(payload: Dict, read_timeout: float | None = None,
+                           site: str = 'completion') -> Iterator[str]:
+    """Yield content deltas from a streamed completion as they arrive.
+
+    Only opening the stream is retried; a failure after the first delta is raised as is.
+    """
+    with _observed(payload, site):
+        with instrumentation.llm_call(site):
+            resp = resilience.call(payload.get('model'), lambda: _open_stream(payload, read_timeout))
+        with resp:
+            try:
+                for line in _timed_lines(resp.iter_lines(decode_unicode=True), site):
+                    delta = _stream_delta(payload, line)
+                    if delta is _DONE:
+                        break
+                    if delta:
+                        yield delta
+            except requests.RequestException:
+                resilience.breaker_for(payload.get('model')).record_failure()
+                raise
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return the shared async client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            headers={
+                'Authorization': f'Bearer {settings.OPENAI_API_KEY}',
+                'Content-Type': 'application/json',
+            },
+            limits=httpx.Limits(
+                max_connections=settings.LLM_ASYNC_POOL_SIZE,
+                max_keepalive_connections=settings.LLM_ASYNC_POOL_SIZE,
+            ),
+            timeout=httpx.Timeout(settings.LLM_READ_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def _async_timeout(read_timeout: float | None) -> httpx.Timeout:
+    return httpx.Timeout(read_timeout or settings.LLM_READ_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT)
+
+
+async def _apost_completion(payload: Dict, read_timeout: float | None) -> str:
+    resp = await get_async_client().post(
+        settings.OPENAI_API_URL,
+        content=json.dumps(payload),
+        timeout=_async_timeout(read_timeout),
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    _count_usage(payload, data.get('usage'))
+    return data['choices'][0]['message']['content']
+
+
+async def achat_completion(payload: Dict, read_timeout: float | None = None, site: str = 'completion') -> str:
+    """Async counterpart of :func:`chat_completion`."""
+    with _observed(payload, site), instrumentation.llm_call(site):
+        return await resilience.acall(
+            payload.get('model'),
+            lambda: resilience.ahedged(lambda: _apost_completion(payload, read_timeout)),
+        )
+
+
+async def _aopen_stream(payload: Dict, read_timeout: float | None) -> httpx.Response:
+    client = get_async_client()
+    request = client.build_request(
+        'POST',
+        settings.OPENAI_API_URL,
+        content=_stream_body(payload),
+        timeout=_async_timeout(read_timeout),
+    )
+    resp = await client.send(request, stream=True)
+    try:
+        resp.raise_for_status()
+    except httpx.HTTPStatusError:
+        await resp.aclose()
+        raise
+    return resp
+
+
+async def astream_chat_completion(payload: Dict, read_timeout: float | None = None,
+                                  site: str = 'completion') -> AsyncIterator[str]:
+    """Async counterpart of :func:`stream_chat_completion`."""
+    with _observed(payload, site):
+        with instrumentation.llm_call(site):
+            resp = await resilience.acall(payload.get('model'), lambda: _aopen_stream(payload, read_timeout))
+        lines = resp.aiter_lines()
+        try:
+            while True:
+                with instrumentation.llm_call(site, count=False):
+                    try:
+                        line = await lines.__anext__()
+                    except StopAsyncIteration:
+                        break
+                delta = _stream_delta(payload, line)
+                if delta is _DONE:
+                    break
+                if delta:
+                    yield delta
+        except httpx.TransportError:
+            resilience.breaker_for(payload.get('model')).record_failure()
+            raise
+        finally:
+            await resp.aclose()
@@ -0,0 +1,306 @@
+"""Content-addressed cache for deterministic LLM calls.
+
+Entries are keyed by a SHA-256 over the model, the normalised messages
+and the sampling parameters, so repeated title generation or fact
+extraction over the same text never reaches the API twice. Runs of
+whitespace in message text are collapsed before hashing, so "Hello  there"
+and "Hello there" share an entry. Case is kept: extraction reads names and
+acronyms from it, so "IBM" and "ibm" are different requests.
+
+The backend is chosen by ``LLM_CACHE_BACKEND``:
+
+``locmem``
+    Per-process LRU dict; fastest, but not shared between workers.
+``file``
+    One file per entry under ``LLM_CACHE_DIR``; shared by every process on
+    the host. Reads touch the file's mtime, which drives LRU eviction.
+``db``
+    ``LLMCacheEntry`` rows; shared by every process using the database.
+
+Every backend expires entries after ``LLM_CACHE_TTL`` seconds and evicts
+the least recently used ones beyond ``LLM_CACHE_MAX_ENTRIES``. An empty
+backend name disables caching. Hits and misses are counted per namespace
+and exported as ``chat_cache_requests_total{cache="llm"}``.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import llm, metrics
+from .models import LLMCacheEntry
+
+logger = logging.getLogger(__name__)
+
+LOG_EVERY = 1000
+
+# Payload keys that do not change the response and so stay out of the key
+_UNKEYED_PARAMS = {'model', 'messages', 'stream', 'user', 'n'}
+_SPACE_RE = re.compile(r'\s+')
+
+_stats: Counter = Counter()
+_stats_lock = threading.Lock()
+
+
+def _normalize(text: str) -> str:
+    return _SPACE_RE.sub(' ', text).strip()
+
+
+def make_key(model: str, messages: List[Dict], **params) -> str:
+    """Return the cache key for a completion request."""
+    canonical = {
+        'model': model,
+        'messages': [{'role': m['role'], 'content': _normalize(m.get('content') or '')} for m in messages],
+        'params': {k: v for k, v in params.items() if k not in _UNKEYED_PARAMS},
+    }
+    blob = json.dumps(canonical, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+def payload_key(payload: Dict) -> str:
+    params = {k: v for k, v in payload.items() if k not in ('model', 'messages')}
+    return make_key(payload['model'], payload['messages'], **params)
+
+
+class LocMemBackend:
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class FileBackend:
+    # Pruning lists the whole directory, so it only runs every N writes
+    PRUNE_EVERY = 100
+
+    def __init__(self, ttl: float, max_entries: int, directory: str):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f'{key}.json'
+
+    def get(self, key: str) -> str | None:
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+        if entry['expires_at'] < time.time():
+            path.unlink(missing_ok=True)
+            return None
+        # The mtime records the last use and drives LRU pruning
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry['value']
+
+    def set(self, key: str, value: str) -> None:
+        # Write-then-rename so concurrent readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'expires_at': time.time() + self.ttl, 'value': value}, f)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self.PRUNE_EVERY == 0
+        if due:
+            self.prune()
+
+    def prune(self) -> None:
+        entries = []
+        # Nothing is read back here: an entry untouched for a whole TTL has expired anyway
+        stale_before = time.time() - self.ttl
+        for path in self.directory.glob('*.json'):
+            try:
+                mtime = path.stat().st_mtime
+            except OSError:
+                continue
+            if mtime < stale_before:
+                path.unlink(missing_ok=True)
+            else:
+                entries.append((mtime, path))
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            path.unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        for path in self.directory.glob('*.json'):
+            path.unlink(missing_ok=True)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.directory.glob('*.json'))
+
+
+class DatabaseBackend:
+    PRUNE_EVERY = 100
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        now = timezone.now()
+        entry = LLMCacheEntry.objects.filter(key=key, expires_at__gt=now).values_list('value', flat=True).first()
+        if entry is not None:
+            LLMCacheEntry.objects.filter(key=key).update(last_used_at=now)
+        return entry
+
+    def set(self, key: str, value: str) -> None:
+        now = timezone.now()
+        LLMCacheEntry.objects.update_or_create(
+            key=key,
+            defaults={'value': value, 'expires_at': now + timedelta(seconds=self.ttl), 'last_used_at': now},
+        )
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self.PRUNE_EVERY == 0
+        if due:
+            self.prune()
+
+    def prune(self) -> None:
+        LLMCacheEntry.objects.filter(expires_at__lte=timezone.now()).delete()
+        cutoff = (
+            LLMCacheEntry.objects
+            .order_by('-last_used_at')
+            .values_list('last_used_at', flat=True)[self.max_entries:self.max_entries + 1]
+            .first()
+        )
+        if cutoff is not None:
+            LLMCacheEntry.objects.filter(last_used_at__lte=cutoff).delete()
+
+    def clear(self) -> None:
+        LLMCacheEntry.objects.all().delete()
+
+    def __len__(self) -> int:
+        return LLMCacheEntry.objects.count()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the configured backend, or None when caching is disabled."""
+    global _backend
+    if _backend is None:
+        name = settings.LLM_CACHE_BACKEND
+        if not name:
+            return None
+        with _backend_lock:
+            if _backend is None:
+                ttl, max_entries = settings.LLM_CACHE_TTL, settings.LLM_CACHE_MAX_ENTRIES
+                if name == 'locmem':
+                    _backend = LocMemBackend(ttl, max_entries)
+                elif name == 'file':
+                    _backend = FileBackend(ttl, max_entries, settings.LLM_CACHE_DIR)
+                elif name == 'db':
+                    _backend = DatabaseBackend(ttl, max_entries)
+                else:
+                    raise ValueError(f"Unknown LLM_CACHE_BACKEND '{name}'")
+    return _backend
+
+
+def _record(namespace: str, hit: bool) -> None:
+    metrics.CACHE_REQUESTS.inc(cache='llm', namespace=namespace, result='hit' if hit else 'miss')
+    with _stats_lock:
+        _stats[f'{namespace}.hits' if hit else f'{namespace}.misses'] += 1
+        _stats['lookups'] += 1
+        lookups = _stats['lookups']
+        if lookups % LOG_EVERY == 0:
+            hits = sum(v for k, v in _stats.items() if k.endswith('.hits'))
+            logger.info('llm cache: %d lookups, %d hits (%.1f%% hit rate)', lookups, hits, 100.0 * hits / lookups)
+
+
+def get(key: str, namespace: str = 'default') -> str | None:
+    backend = get_backend()
+    if backend is None:
+        return None
+    try:
+        value = backend.get(key)
+    except Exception:
+        logger.exception('llm cache read failed')
+        value = None
+    _record(namespace, value is not None)
+    return value
+
+
+def set(key: str, value: str) -> None:
+    backend = get_backend()
+    if backend is None:
+        return
+    try:
+        backend.set(key, value)
+    except Exception:
+        # A broken cache must never fail the call it was meant to speed up
+        logger.exception('llm cache write failed')
+
+
+def cached_chat_completion(payload: Dict, read_timeout: float | None = None, namespace: str = 'default') -> str:
+    """``llm.chat_completion`` that answers repeated requests from the cache."""
+    key = payload_key(payload)
+    value = get(key, namespace)
+    if value is None:
+        value = llm.chat_completion(payload, read_timeout=read_timeout, site=namespace)
+        set(key, value)
+    return value
+
+
+def stats() -> Dict[str, float]:
+    """Hit/miss counters for this process, with a hit rate per namespace."""
+    with _stats_lock:
+        counts = dict(_stats)
+    result: Dict[str, float] = dict(counts)
+    for name in {k.rsplit('.', 1)[0] for k in counts if '.' in k}:
+        hits, misses = counts.get(f'{name}.hits', 0), counts.get(f'{name}.misses', 0)
+        result[f'{name}.hit_rate'] = hits / (hits + misses) if hits + misses else 0.0
+    return result
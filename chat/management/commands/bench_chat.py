@@ -0,0 +1,157 @@
+import json
+import os
+import platform
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from chat import bench, seed
+from chat.stub_server import Distribution, StubConfig, make_server
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed users, chats and messages, then drive the chat endpoints at a given concurrency against '
+        'a local LLM stub and report throughput, latency percentiles, query counts and memory per endpoint.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--chats-per-user', type=int, default=20)
+        parser.add_argument('--messages-per-chat', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument(
+            '--endpoints', default=','.join(bench.ENDPOINTS),
+            help=f'Comma-separated subset of: {", ".join(bench.ENDPOINTS)}.',
+        )
+        parser.add_argument(
+            '--memory-requests', type=int, default=20,
+            help='Requests per endpoint in the single-threaded tracemalloc pass (0 skips it).',
+        )
+        parser.add_argument(
+            '--llm-url', default='',
+            help='Use this OpenAI-compatible URL instead of starting an in-process stub.',
+        )
+        parser.add_argument('--stub-latency', default='lognormal:300,0.5', help='Stub time to first byte (ms).')
+        parser.add_argument('--stub-tokens-per-second', type=float, default=0, help='Stub streaming rate.')
+        parser.add_argument('--output', default='', help='Write the results as JSON to this file.')
+        parser.add_argument('--compare', default='', help='Print the change against a previous --output file.')
+        parser.add_argument('--prefix', default='benche', help='Email prefix of the seeded users.')
+        parser.add_argument('--reuse', action='store_true', help='Reuse data seeded by a previous --keep run.')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data afterwards.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        endpoints = tuple(e.strip() for e in options['endpoints'].split(',') if e.strip())
+        unknown = set(endpoints) - set(bench.ENDPOINTS)
+        if unknown:
+            raise CommandError(f'Unknown endpoint(s): {", ".join(sorted(unknown))}')
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+        if connection.vendor == 'sqlite' and options['concurrency'] > 1:
+            # SQLite has one writer at a time; the write endpoints measure lock waits, and without
+            # IMMEDIATE transactions concurrent writers fail outright with "database is locked"
+            db_options = connection.settings_dict.get('OPTIONS', {})
+            if str(db_options.get('transaction_mode', '')).upper() != 'IMMEDIATE':
+                self.stderr.write(self.style.WARNING(
+                    'SQLite without transaction_mode=IMMEDIATE: concurrent writes will fail with '
+                    '"database is locked". Configure it in DATABASES or use --concurrency 1.'
+                ))
+            else:
+                self.stderr.write(self.style.WARNING(
+                    f'SQLite serializes writers: write endpoints at concurrency {options["concurrency"]} '
+                    'mostly measure waiting for the database lock.'
+                ))
+
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        prefix = options['prefix']
+        if not options['reuse']:
+            seed.cleanup(prefix)
+            started = time.perf_counter()
+            seed.seed(
+                options['users'], options['chats_per_user'], options['messages_per_chat'],
+                prefix=prefix, seed_value=options['seed'], progress=self.stdout.write,
+            )
+            self.stdout.write(f'Seeding took {time.perf_counter() - started:.1f}s')
+        users = list(
+            get_user_model().objects
+            .filter(email__startswith=f'{prefix}-', email__endswith=f'@{seed.BENCH_EMAIL_DOMAIN}')
+            .order_by('id')
+        )
+        if not users:
+            raise CommandError('No seeded users found; run without --reuse first.')
+
+        server = None
+        llm_url = options['llm_url']
+        if not llm_url:
+            server = make_server('127.0.0.1', 0, StubConfig(
+                latency=Distribution(options['stub_latency']),
+                tokens_per_second=options['stub_tokens_per_second'],
+                seed=options['seed'],
+            ))
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            llm_url = f'http://127.0.0.1:{server.server_address[1]}/v1/chat/completions'
+
+        try:
+            with override_settings(OPENAI_API_URL=llm_url, OPENAI_API_KEY=settings.OPENAI_API_KEY or 'bench'):
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f'\n== {len(users)} users, {options["requests"]} requests per endpoint, '
+                    f'concurrency {options["concurrency"]}, LLM at {llm_url} =='
+                ))
+                results = bench.run(
+                    users, endpoints, options['requests'], options['concurrency'],
+                    memory_requests=options['memory_requests'], seed_value=options['seed'],
+                    progress=self.stdout.write,
+                )
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+            if not options['keep']:
+                seed.cleanup(prefix)
+
+        report = {
+            'timestamp': timezone.now().isoformat(),
+            'config': {
+                key: options[key] for key in (
+                    'users', 'chats_per_user', 'messages_per_chat', 'requests', 'concurrency',
+                    'memory_requests', 'stub_latency', 'stub_tokens_per_second', 'seed',
+                )
+            },
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'database': connection.vendor,
+                'cpus': os.cpu_count(),
+                'external_llm': bool(options['llm_url']),
+            },
+            'endpoints': results,
+        }
+        failing = {name: summary for name, summary in results.items() if summary['errors']}
+        for name, summary in failing.items():
+            self.stderr.write(self.style.ERROR(
+                f'{name}: {summary["errors"]} of {summary["requests"]} requests failed '
+                f'({summary["error_rate"]:.1%}), statuses {summary["status_counts"]}'
+            ))
+        if failing:
+            self.stderr.write(self.style.ERROR('Latency and throughput above only count successful requests.'))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+        if baseline is not None:
+            self.stdout.write(self.style.MIGRATE_HEADING('\n== change vs baseline (%) =='))
+            for endpoint, changes in bench.compare(report, baseline).items():
+                self.stdout.write(f'{endpoint:<20} ' + '  '.join(f'{k} {v:+.1f}' for k, v in changes.items()))
@@ -0,0 +1,108 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from chat import search, seed
+from chat.models import Chat, Message
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a large synthetic dataset and compare query plans and timings of the hot chat '
+        'queries with and without the composite indexes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--chats-per-user', type=int, default=100)
+        parser.add_argument('--messages-per-chat', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=50, help='Timed executions per query.')
+        parser.add_argument('--search', default='python dja', help='Query for the full-text search case.')
+        parser.add_argument('--prefix', default='benchq', help='Email prefix of the seeded users.')
+        parser.add_argument('--reuse', action='store_true', help='Reuse data seeded by a previous --keep run.')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data afterwards.')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if not options['reuse']:
+            seed.cleanup(prefix)
+            started = time.perf_counter()
+            seed.seed(
+                options['users'], options['chats_per_user'], options['messages_per_chat'],
+                prefix=prefix, progress=self.stdout.write,
+            )
+            self.stdout.write(f'Seeding took {time.perf_counter() - started:.1f}s')
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        chat = Chat.objects.filter(user__email__startswith=f'{prefix}-').order_by('id').first()
+        if chat is None:
+            self.stderr.write('No seeded data found; run without --reuse first.')
+            return
+        queries = {
+            'recent context': lambda: Message.objects.filter(chat=chat).order_by('-created_at')[:20].values('role', 'content'),
+            'latest user message': lambda: Message.objects.filter(chat=chat, role='user').order_by('-created_at')[:1],
+            'chat list': lambda: Chat.objects.filter(user_id=chat.user_id).order_by('-pinned', '-updated_at').values('id', 'title'),
+        }
+
+        try:
+            self._report('with composite indexes', queries, options['repeat'])
+            self._report_search(chat.user_id, options['search'], options['repeat'])
+            # DDL is transactional on SQLite and PostgreSQL, so the drop is rolled back
+            with transaction.atomic():
+                self._drop_composite_indexes()
+                self._report('without composite indexes', queries, options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            if not options['keep']:
+                seed.cleanup(prefix)
+
+    def _drop_composite_indexes(self):
+        with connection.cursor() as cursor:
+            for model in (Chat, Message):
+                for index in model._meta.indexes:
+                    cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+
+    def _explain(self, queryset, label):
+        return self._explain_sql(*queryset.query.sql_with_params(), label)
+
+    def _explain_sql(self, sql, params, label):
+        prefix = 'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite' else 'EXPLAIN'
+        with connection.cursor() as cursor:
+            # The label keeps sqlite3's statement cache from replaying the plan of the other phase
+            cursor.execute(f'{prefix} {sql} /* {label} */', params)
+            return [str(row[-1]) for row in cursor.fetchall()]
+
+    def _report(self, label, queries, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\n== {label} =='))
+        for name, build in queries.items():
+            self.stdout.write(self.style.SUCCESS(name))
+            for line in self._explain(build(), label):
+                self.stdout.write(f'  {line}')
+            started = time.perf_counter()
+            for _ in range(repeat):
+                list(build())
+            elapsed_ms = (time.perf_counter() - started) * 1000 / repeat
+            self.stdout.write(f'  avg {elapsed_ms:.3f} ms over {repeat} runs')
+
+    def _report_search(self, user_id, query, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\n== full-text search for {query!r} =='))
+        prepared = search.search_sql(user_id, query, limit=20)
+        if prepared is None or connection.vendor not in ('sqlite', 'postgresql'):
+            self.stdout.write(f'  no search index on {connection.vendor}; skipped')
+            return
+        for line in self._explain_sql(*prepared, 'search'):
+            self.stdout.write(f'  {line}')
+        started = time.perf_counter()
+        for _ in range(repeat):
+            results, _has_more = search.search_messages(user_id, query, limit=20)
+        elapsed_ms = (time.perf_counter() - started) * 1000 / repeat
+        self.stdout.write(f'  {len(results)} results, avg {elapsed_ms:.3f} ms over {repeat} runs')
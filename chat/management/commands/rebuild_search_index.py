@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from chat import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text message search index from chat_message.'
+
+    def handle(self, *args, **options):
+        search.attach(connection)
+        search.rebuild(connection)
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
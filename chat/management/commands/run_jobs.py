@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat import jobs
+
+
+class Command(BaseCommand):
+    help = 'Drain the background job queue (memory extraction, title generation, ...).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new jobs instead of exiting.')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between polls with --loop.')
+        parser.add_argument(
+            '--requeue-stale', type=int, default=0, metavar='MINUTES',
+            help='Reset jobs stuck in "running" for longer than this back to pending (otherwise CHAT_JOB_LEASE).',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            if options['requeue_stale']:
+                stale = jobs.requeue_stale(older_than=options['requeue_stale'] * 60)
+                if stale:
+                    self.stdout.write(f'Requeued {stale} stale job(s)')
+            ran = jobs.run_pending()
+            if ran:
+                self.stdout.write(f'Ran {ran} job(s)')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
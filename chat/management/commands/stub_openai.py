@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.stub_server import Distribution, StubConfig, make_server
+
+
+def _distribution(spec: str) -> Distribution:
+    try:
+        return Distribution(spec)
+    except ValueError as e:
+        raise CommandError(str(e))
+
+
+class Command(BaseCommand):
+    help = (
+        'Run a local OpenAI-compatible /v1/chat/completions server with configurable latency, '
+        'token rate and error injection, for offline load tests.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument(
+            '--latency', default='lognormal:300,0.5',
+            help='Time to first byte in ms: fixed:MS, uniform:LO,HI, normal:MEAN,SD, exp:MEAN or lognormal:MEDIAN,SIGMA.',
+        )
+        parser.add_argument('--reply-tokens', default='uniform:40,200', help='Reply length in tokens (same syntax).')
+        parser.add_argument('--tokens-per-second', type=float, default=60.0, help='Streaming rate; 0 streams at once.')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with an error.')
+        parser.add_argument('--error-status', default='500,503,429', help='Comma-separated statuses to inject.')
+        parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After sent with injected 429/503.')
+        parser.add_argument('--disconnect-rate', type=float, default=0.0, help='Fraction of streams cut off midway.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            statuses = tuple(int(s) for s in options['error_status'].split(',') if s.strip())
+        except ValueError:
+            raise CommandError('--error-status must be a comma-separated list of integers')
+        config = StubConfig(
+            latency=_distribution(options['latency']),
+            reply_tokens=_distribution(options['reply_tokens']),
+            tokens_per_second=options['tokens_per_second'],
+            error_rate=options['error_rate'],
+            error_statuses=statuses or (500,),
+            retry_after=options['retry_after'],
+            disconnect_rate=options['disconnect_rate'],
+            seed=options['seed'],
+        )
+        server = make_server(options['host'], options['port'], config)
+        host, port = server.server_address[:2]
+        self.stdout.write(f'Stub OpenAI server listening on http://{host}:{port}')
+        self.stdout.write(f'  OPENAI_API_URL=http://{host}:{port}/v1/chat/completions')
+        self.stdout.write(f'  latency {config.latency.spec} ms, reply {config.reply_tokens.spec} tokens, '
+                          f'{config.tokens_per_second:g} tok/s, error rate {config.error_rate:g}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
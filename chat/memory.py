@@ -0,0 +1,110 @@
+"""Cached view of each user's ``UserMemory`` and the system prompt rendered from it.
+
+Lookups go through a small in-process LRU keyed by ``(user_id, version)``,
+backed by Django's cache framework. The version lives in the shared cache
+and is bumped whenever a ``UserMemory`` row is saved or deleted, so every
+process stops using its stale entry on the next lookup.
+
+With the default local-memory cache the version is per process, and a
+bump in one process (say ``run_jobs`` extracting facts) is never seen by
+the others. There, a version only lives for ``CHAT_MEMORY_LOCAL_TTL``
+seconds, after which the memory is read from the database again. That
+bounds how stale another process can be. Configure a shared ``CACHES``
+backend (Redis, Memcached) to get immediate invalidation everywhere.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from . import metrics
+from .models import UserMemory
+
+DEFAULT_BOT_NAME = "Assistant"
+DEFAULT_BOT_PERSONALITY = "Friendly, helpful, remembers previous conversations, understanding and very intelligent."
+
+_VERSION_KEY = 'chat:memory:version:{user_id}'
+_DATA_KEY = 'chat:memory:data:{user_id}:{version}'
+
+
+@dataclass(frozen=True)
+class MemorySnapshot:
+    data: Dict
+    memory_text: str
+    system_prompt: str
+
+
+_local: "OrderedDict[tuple, MemorySnapshot]" = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _render(data: Dict) -> MemorySnapshot:
+    if data:
+        memory_text = f"Here is what you know about this user: {json.dumps(data)}"
+    else:
+        memory_text = "You have no stored personal facts about this user yet."
+    bot_name = data.get('bot_name') or DEFAULT_BOT_NAME
+    system_prompt = (
+        f"You are {bot_name}, an AI assistant. "
+        f"Your personality: {DEFAULT_BOT_PERSONALITY}\n"
+        f"{memory_text}\n"
+    )
+    return MemorySnapshot(data=data, memory_text=memory_text, system_prompt=system_prompt)
+
+
+def _version_timeout() -> float | None:
+    # A version no other process can bump must expire by itself
+    return settings.CHAT_MEMORY_LOCAL_TTL if isinstance(caches['default'], LocMemCache) else None
+
+
+def _current_version(user_id: int) -> int:
+    key = _VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        # A fresh timestamp can never collide with entries cached under an evicted version
+        cache.add(key, time.time_ns(), timeout=_version_timeout())
+        version = cache.get(key)
+    return version
+
+
+def get_snapshot(user_id: int) -> MemorySnapshot:
+    version = _current_version(user_id)
+    local_key = (user_id, version)
+    with _local_lock:
+        snapshot = _local.get(local_key)
+        if snapshot is not None:
+            _local.move_to_end(local_key)
+            metrics.CACHE_REQUESTS.inc(cache='memory', namespace='local', result='hit')
+            return snapshot
+
+    data_key = _DATA_KEY.format(user_id=user_id, version=version)
+    data = cache.get(data_key)
+    metrics.CACHE_REQUESTS.inc(cache='memory', namespace='shared', result='miss' if data is None else 'hit')
+    if data is None:
+        data = UserMemory.objects.filter(user_id=user_id).values_list('memory_data', flat=True).first() or {}
+        cache.set(data_key, data, timeout=settings.CHAT_MEMORY_CACHE_TTL)
+
+    snapshot = _render(data)
+    with _local_lock:
+        _local[local_key] = snapshot
+        _local.move_to_end(local_key)
+        while len(_local) > settings.CHAT_MEMORY_LOCAL_CACHE_SIZE:
+            _local.popitem(last=False)
+    return snapshot
+
+
+def invalidate(user_id: int) -> None:
+    cache.set(_VERSION_KEY.format(user_id=user_id), time.time_ns(), timeout=_version_timeout())
+    with _local_lock:
+        for key in [k for k in _local if k[0] == user_id]:
+            del _local[key]
+
+
+def on_memory_changed(sender, instance, **kwargs) -> None:
+    invalidate(instance.user_id)
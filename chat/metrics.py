@@ -0,0 +1,388 @@
+"""Aggregate operational metrics, served at ``/metrics`` in the Prometheus text format.
+
+Each process appends its samples to its own memory-mapped file under
+``CHAT_METRICS_DIR``. There is one writer per file, so an update only
+needs this process's thread lock. A scrape merges the files of every
+process, which makes the numbers the same whichever gunicorn worker
+answers. Counters and histograms outlive the process that wrote them:
+the scrape folds files left behind by exited workers into one archive
+file, under an exclusive ``flock``. Gauges describe live state, so a
+dead process's gauge file is discarded. A process does the same when it
+first writes, so files of dead workers are gone before a new worker can
+reuse their pid and add its samples to them.
+
+Empty ``CHAT_METRICS_DIR`` on deploy (a tmpfs is ideal). Otherwise
+counters carry on from the previous release, which is harmless but
+keeps old label sets around.
+
+Cache hit rates are exported as hit and miss counters, to be divided at
+query time.
+"""
+import fcntl
+import glob
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_INITIAL_SIZE = 64 * 1024
+_HEADER = struct.Struct('<Q')   # bytes of the file in use
+_KEY_LEN = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+
+_ARCHIVE = 'archive.db'
+_LOCK_FILE = 'metrics.lock'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+def _padded(length: int) -> int:
+    """Key length rounded up so the value that follows is 8-byte aligned."""
+    return length + (8 - (_KEY_LEN.size + length) % 8) % 8
+
+
+def _entries(buf, used: int) -> Iterator[Tuple[str, float, int]]:
+    """Yield (key, value, value offset) for every entry in the first ``used`` bytes of ``buf``."""
+    pos = _HEADER.size
+    while pos + _KEY_LEN.size <= used:
+        (length,) = _KEY_LEN.unpack_from(buf, pos)
+        value_at = pos + _KEY_LEN.size + _padded(length)
+        if value_at + _VALUE.size > used:
+            break
+        key = bytes(buf[pos + _KEY_LEN.size:pos + _KEY_LEN.size + length]).decode('utf-8')
+        yield key, _VALUE.unpack_from(buf, value_at)[0], value_at
+        pos = value_at + _VALUE.size
+
+
+class MmapStore:
+    """An append-only map of sample keys to float64 values in one memory-mapped file.
+
+    Only one process may write a given file. An entry is written in full
+    before the header counts it, and values are aligned 8-byte words, so
+    readers in other processes can copy the file at any time without locking.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < _INITIAL_SIZE:
+            self._file.truncate(_INITIAL_SIZE)
+            size = _INITIAL_SIZE
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._used = _HEADER.unpack_from(self._map, 0)[0]
+        if not self._used:
+            self._used = _HEADER.size
+            _HEADER.pack_into(self._map, 0, self._used)
+        self._offsets = {key: offset for key, _, offset in _entries(self._map, self._used)}
+
+    def _offset(self, key: str) -> int:
+        offset = self._offsets.get(key)
+        if offset is not None:
+            return offset
+        encoded = key.encode('utf-8')
+        needed = _KEY_LEN.size + _padded(len(encoded)) + _VALUE.size
+        if self._used + needed > len(self._map):
+            size = max(2 * len(self._map), self._used + needed)
+            self._map.close()
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), size)
+        _KEY_LEN.pack_into(self._map, self._used, len(encoded))
+        self._map[self._used + _KEY_LEN.size:self._used + _KEY_LEN.size + len(encoded)] = encoded
+        offset = self._used + _KEY_LEN.size + _padded(len(encoded))
+        _VALUE.pack_into(self._map, offset, 0.0)
+        self._used = offset + _VALUE.size
+        _HEADER.pack_into(self._map, 0, self._used)
+        self._offsets[key] = offset
+        return offset
+
+    def add(self, key: str, amount: float) -> None:
+        offset = self._offset(key)
+        _VALUE.pack_into(self._map, offset, _VALUE.unpack_from(self._map, offset)[0] + amount)
+
+    def close(self) -> None:
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+
+
+def read_file(path: str) -> List[Tuple[str, float]]:
+    """Copy the entries out of a store file written by any process."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    if len(data) < _HEADER.size:
+        return []
+    used = min(_HEADER.unpack_from(data, 0)[0], len(data))
+    return [(key, value) for key, value, _ in _entries(data, used)]
+
+
+# This process's stores, keyed by kind ('counter' or 'gauge'); rebuilt after a fork
+_stores: Dict[str, MmapStore] = {}
+_stores_pid: int | None = None
+_stores_lock = threading.Lock()
+_disabled = False
+
+
+def _directory() -> str:
+    return settings.CHAT_METRICS_DIR
+
+
+def _add(kind: str, keys: List[str], amount: float) -> None:
+    global _stores_pid, _disabled
+    if _disabled:
+        return
+    with _stores_lock:
+        pid = os.getpid()
+        if _stores_pid != pid:
+            # Stores inherited from a parent belong to the parent's files
+            _stores.clear()
+            _stores_pid = pid
+        store = _stores.get(kind)
+        try:
+            if store is None:
+                directory = _directory()
+                os.makedirs(directory, exist_ok=True)
+                path = os.path.join(directory, f'{kind}_{pid}.db')
+                # A file under this pid was left by an earlier process that had the same pid
+                _compact(directory, stale=[path])
+                store = _stores[kind] = MmapStore(path)
+            for key in keys:
+                store.add(key, amount)
+        except OSError:
+            # Metrics must never fail the request they describe
+            logger.exception('metrics store unavailable; metrics disabled in this process')
+            _disabled = True
+
+
+_registry: Dict[str, '_Metric'] = {}
+
+
+class _Metric:
+    type = ''
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._keys: Dict[tuple, List[str]] = {}
+        _registry[name] = self
+
+    def _labels(self, labels: Dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} takes labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _key(self, sample: str, values: tuple, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        return json.dumps([self.name, sample, [*zip(self.labelnames, values), *extra]])
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        values = self._labels(labels)
+        keys = self._keys.get(values)
+        if keys is None:
+            keys = self._keys[values] = [self._key(self.name, values)]
+        _add(self.kind, keys, amount)
+
+
+class Gauge(Counter):
+    """A value summed across live processes, such as the number of requests in flight."""
+    type = 'gauge'
+    kind = 'gauge'
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value: float, **labels) -> None:
+        values = self._labels(labels)
+        keys = self._keys.get(values)
+        if keys is None:
+            keys = self._keys[values] = [
+                self._key(f'{self.name}_bucket', values, (('le', _format(bound)),)) for bound in self.buckets
+            ] + [self._key(f'{self.name}_count', values), self._key(f'{self.name}_sum', values)]
+        # Buckets are cumulative: the observation counts in every bucket at or above it
+        first = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        _add(self.kind, keys[first:-1], 1.0)
+        _add(self.kind, keys[-1:], value)
+
+
+HTTP_REQUESTS = Counter(
+    'chat_http_requests_total', 'HTTP requests by view, method and status.', ('view', 'method', 'status'),
+)
+HTTP_LATENCY = Histogram(
+    'chat_http_request_duration_seconds', 'HTTP request latency by view, to the last byte for streams.', ('view',),
+)
+HTTP_IN_FLIGHT = Gauge('chat_http_requests_in_flight', 'HTTP requests being served.')
+LLM_REQUESTS = Counter(
+    'chat_llm_requests_total', 'Upstream LLM calls by model, call site and outcome.', ('model', 'site', 'outcome'),
+)
+LLM_LATENCY = Histogram(
+    'chat_llm_request_duration_seconds', 'Upstream LLM call latency, including retries, to the end of the stream.',
+    ('model', 'site'), buckets=LLM_BUCKETS,
+)
+LLM_IN_FLIGHT = Gauge('chat_llm_requests_in_flight', 'Upstream LLM calls in progress.', ('model',))
+LLM_TOKENS = Counter('chat_llm_tokens_total', 'Tokens reported by the upstream, by model and kind.', ('model', 'kind'))
+CACHE_REQUESTS = Counter(
+    'chat_cache_requests_total', 'Cache lookups by cache, namespace and result (hit or miss).',
+    ('cache', 'namespace', 'result'),
+)
+FACT_FILTER_DECISIONS = Counter(
+    'chat_fact_filter_decisions_total',
+    'Fact-extraction pre-filter decisions by outcome (extract, skip_rule, skip_model).', ('outcome',),
+)
+TTS_FIRST_AUDIO = Histogram(
+    'chat_tts_first_audio_seconds', 'Time from the first complete sentence of a text to its audio being ready.',
+    ('engine',), buckets=(0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0, 5.0),
+)
+TTS_WORKERS = Gauge('chat_tts_workers', 'Speech synthesis worker processes.')
+TTS_WORKERS_BUSY = Gauge('chat_tts_workers_busy', 'Speech synthesis worker processes running a job.')
+TTS_QUEUE_DEPTH = Gauge('chat_tts_queue_depth', 'Speech synthesis jobs waiting for a worker, by priority.', ('priority',))
+TTS_QUEUE_WAIT = Histogram(
+    'chat_tts_queue_wait_seconds', 'Time speech synthesis jobs spent queued, by priority.', ('priority',),
+)
+TTS_JOBS = Counter(
+    'chat_tts_jobs_total', 'Speech synthesis jobs by priority and outcome (ok, error, cancelled, rejected).',
+    ('priority', 'outcome'),
+)
+OTPS_ISSUED = Counter('chat_otps_issued_total', 'One-time codes issued, by type.', ('type',))
+EMAILS_SENT = Counter('chat_emails_sent_total', 'Emails handed to the mail backend, by kind and outcome.', ('kind', 'outcome'))
+
+
+def _format(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _pid_files(directory: str, kind: str) -> List[Tuple[int, str]]:
+    files = []
+    for path in glob.glob(os.path.join(directory, f'{kind}_*.db')):
+        try:
+            files.append((int(os.path.basename(path)[len(kind) + 1:-3]), path))
+        except ValueError:
+            continue
+    return files
+
+
+@contextmanager
+def _locked(directory: str, mode: int) -> Iterator[None]:
+    with open(os.path.join(directory, _LOCK_FILE), 'a') as lock:
+        fcntl.flock(lock, mode)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _compact(directory: str, stale: List[str] = ()) -> None:
+    """Fold counter files of exited processes, and ``stale`` ones, into the archive and drop their gauges."""
+    for pid, path in _pid_files(directory, 'gauge'):
+        if not _alive(pid) or path in stale:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    dead = [path for pid, path in _pid_files(directory, 'counter') if not _alive(pid) or path in stale]
+    if not dead:
+        return
+    with _locked(directory, fcntl.LOCK_EX):
+        archive = MmapStore(os.path.join(directory, _ARCHIVE))
+        try:
+            for path in dead:
+                # Another scrape may have folded it in while this one waited for the lock
+                if not os.path.exists(path):
+                    continue
+                for key, value in read_file(path):
+                    archive.add(key, value)
+                os.remove(path)
+        finally:
+            archive.close()
+
+
+def collect() -> Dict[str, Dict[Tuple[str, tuple], float]]:
+    """Merge every process's samples: {metric name: {(sample name, labels): value}}."""
+    directory = _directory()
+    if not os.path.isdir(directory):
+        return {}
+    _compact(directory)
+    merged: Dict[str, Dict[Tuple[str, tuple], float]] = {}
+    with _locked(directory, fcntl.LOCK_SH):
+        paths = [os.path.join(directory, _ARCHIVE)]
+        paths += [path for _, path in _pid_files(directory, 'counter')]
+        paths += [path for pid, path in _pid_files(directory, 'gauge') if _alive(pid)]
+        for path in paths:
+            for key, value in read_file(path):
+                name, sample, labels = json.loads(key)
+                samples = merged.setdefault(name, {})
+                sample_key = (sample, tuple(tuple(pair) for pair in labels))
+                samples[sample_key] = samples.get(sample_key, 0.0) + value
+    return merged
+
+
+def _sort_key(item) -> tuple:
+    (sample, labels), _ = item
+    le = dict(labels).get('le')
+    rest = tuple(pair for pair in labels if pair[0] != 'le')
+    suffix = 0 if sample.endswith('_bucket') else 1 if sample.endswith('_sum') else 2
+    return rest, suffix, float(le) if le is not None else 0.0
+
+
+def render() -> str:
+    """Every registered metric in the text exposition format (version 0.0.4)."""
+    merged = collect()
+    lines = []
+    for name, metric in sorted(_registry.items()):
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.type}')
+        for (sample, labels), value in sorted(merged.get(name, {}).items(), key=_sort_key):
+            rendered = ','.join(f'{label}="{_escape(str(v))}"' for label, v in labels)
+            lines.append(f'{sample}{{{rendered}}} {_format(value)}' if rendered else f'{sample} {_format(value)}')
+    return '\n'.join(lines) + '\n'
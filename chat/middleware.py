@@ -0,0 +1,115 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import instrumentation, metrics
+
+
+class RequestTimingMiddleware:
+    """Time each request and report wall, DB and upstream LLM time plus bytes in and out.
+
+    The totals go out as a ``Server-Timing`` header (when ``CHAT_SERVER_TIMING``
+    is on) and as one JSON line on the ``chat.timing`` logger, and feed the
+    request counters and latency histograms in ``chat.metrics``. Streaming
+    responses send their header before the body exists, so it only covers the
+    work done up to the first byte; the log line and metrics are recorded
+    once the stream ends and cover everything.
+
+    A ``FileResponse`` is left unwrapped so the server can still send its
+    file with ``wsgi.file_wrapper`` (sendfile); it is recorded when the
+    server closes it, with ``Content-Length`` as the bytes sent.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = instrumentation.Timings()
+        metrics.HTTP_IN_FLIGHT.inc()
+        try:
+            with instrumentation.activate(timings):
+                response = self.get_response(request)
+        except BaseException:
+            metrics.HTTP_IN_FLIGHT.dec()
+            raise
+        return self._finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = instrumentation.Timings()
+        metrics.HTTP_IN_FLIGHT.inc()
+        try:
+            with instrumentation.activate(timings):
+                response = await self.get_response(request)
+        except BaseException:
+            metrics.HTTP_IN_FLIGHT.dec()
+            raise
+        return self._finish(request, response, timings)
+
+    def _finish(self, request, response, timings: instrumentation.Timings):
+        if settings.CHAT_SERVER_TIMING:
+            response['Server-Timing'] = instrumentation.server_timing(timings)
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'view': request.resolver_match.view_name if request.resolver_match else None,
+            'status': response.status_code,
+            'bytes_in': int(request.META.get('CONTENT_LENGTH') or 0),
+        }
+        if not response.streaming:
+            _record(timings, fields, bytes_out=len(response.content))
+        elif getattr(response, 'file_to_stream', None) is not None:
+            # Replacing streaming_content would drop file_to_stream, and with it the sendfile path
+            bytes_out = int(response.get('Content-Length') or 0)
+            response._resource_closers.append(lambda: _record(timings, fields, bytes_out=bytes_out, streamed=True))
+        elif response.is_async:
+            response.streaming_content = self._ameasure_stream(response.streaming_content, timings, fields)
+        else:
+            response.streaming_content = self._measure_stream(response.streaming_content, timings, fields)
+        return response
+
+    @staticmethod
+    def _measure_stream(content, timings, fields):
+        sent = 0
+        try:
+            iterator = iter(content)
+            while True:
+                # Keep the record current while the view's generator runs
+                with instrumentation.activate(timings):
+                    chunk = next(iterator, None)
+                if chunk is None:
+                    break
+                sent += len(chunk)
+                yield chunk
+        finally:
+            _record(timings, fields, bytes_out=sent, streamed=True)
+
+    @staticmethod
+    async def _ameasure_stream(content, timings, fields):
+        sent = 0
+        try:
+            iterator = content.__aiter__()
+            while True:
+                with instrumentation.activate(timings):
+                    try:
+                        chunk = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        break
+                sent += len(chunk)
+                yield chunk
+        finally:
+            _record(timings, fields, bytes_out=sent, streamed=True)
+
+
+def _record(timings: instrumentation.Timings, fields: dict, **extra) -> None:
+    """Log the finished request and count it in the metrics."""
+    metrics.HTTP_IN_FLIGHT.dec()
+    # Unresolved paths (404s) share one label so scanners cannot blow up the series count
+    view = fields['view'] or '<unresolved>'
+    metrics.HTTP_REQUESTS.inc(view=view, method=fields['method'], status=fields['status'])
+    metrics.HTTP_LATENCY.observe(timings.wall_seconds, view=view)
+    instrumentation.log('request', timings, **fields, **extra)
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-17 05:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_backgroundjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['user', 'pinned', 'updated_at'], name='chat_user_pinned_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat', 'created_at'], name='message_chat_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat', 'role', 'created_at'], name='message_chat_role_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_message_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='token_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_message_token_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='summarized_through_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
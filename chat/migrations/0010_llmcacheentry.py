@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_chat_rolling_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('value', models.TextField()),
+                ('expires_at', models.DateTimeField()),
+                ('last_used_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_used_at'], name='chat_llmcac_last_us_52d802_idx'), models.Index(fields=['expires_at'], name='chat_llmcac_expires_3306bb_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:56
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0010_llmcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backgroundjob',
+            name='run_after',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
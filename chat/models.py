@@ -1,5 +1,8 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+
+from .tokens import estimate_tokens
 
 
 class Chat(models.Model):
@@ -7,9 +10,18 @@ class Chat(models.Model):
     title = models.CharField(max_length=255)
     model = models.CharField(max_length=100, default='gpt-4o-mini')
     pinned = models.BooleanField(default=False)
+    # Rolling summary of every message up to and including summarized_through_id
+    summary = models.TextField(blank=True, default='')
+    summarized_through_id = models.BigIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # list_chats: filter by user, order by -pinned, -updated_at
+            models.Index(fields=['user', 'pinned', 'updated_at'], name='chat_user_pinned_updated_idx'),
+        ]
+
     def __str__(self) -> str:
         return f"{self.title} ({self.user.email})"
 
@@ -42,11 +54,71 @@ class Message(models.Model):
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='messages')
     role = models.CharField(max_length=10, choices=ROLE_CHOICES)
     content = models.TextField()
+    # Estimated prompt tokens for content, cached for the context builder
+    token_count = models.PositiveIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Recent-context window: filter by chat, order by -created_at
+            models.Index(fields=['chat', 'created_at'], name='message_chat_created_idx'),
+            # Latest user/assistant message lookups in regenerate_response
+            models.Index(fields=['chat', 'role', 'created_at'], name='message_chat_role_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content' in update_fields:
+            self.token_count = estimate_tokens(self.content)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'token_count'}
+        super().save(*args, **kwargs)
+
+    def __str__(self) -> str:
+        return f"{self.role} @ {self.created_at:%Y-%m-%d %H:%M}"
+
+
+class BackgroundJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    # Not claimed before this time; pushed back exponentially after each failed attempt
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.kind} #{self.id} ({self.status})"
+
+
+class LLMCacheEntry(models.Model):
+    """A cached completion for the ``db`` backend of ``chat.llm_cache``."""
+    key = models.CharField(max_length=64, unique=True)
+    value = models.TextField()
+    expires_at = models.DateTimeField()
+    last_used_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['last_used_at']),
+            models.Index(fields=['expires_at']),
+        ]
 
     def __str__(self) -> str:
-        return f"{self.role} @ {self.created_at:%Y-%m-%d %H:%M}"
\ No newline at end of file
+        return self.key
@@ -0,0 +1,61 @@
+"""Keyset (cursor) pagination helpers.
+
+Cursors are opaque, URL-safe tokens wrapping the sort-key values of a row,
+so the next page is an index range scan instead of an OFFSET scan.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import List
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str, size: int) -> List:
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor('Malformed cursor') from e
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor('Malformed cursor')
+    return values
+
+
+def parse_datetime_value(value) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor('Malformed cursor') from e
+
+
+def page_size(raw: str | None, default: int = DEFAULT_PAGE_SIZE) -> int:
+    try:
+        size = int(raw) if raw else default
+    except ValueError:
+        size = default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def keyset_filter(fields: List[str], values: List, descending: bool) -> Q:
+    """Build ``(f1, f2, ...) < (v1, v2, ...)`` (or ``>``) as an OR of prefix-equality terms."""
+    lookup = 'lt' if descending else 'gt'
+    condition = Q()
+    for i, field in enumerate(fields):
+        term = Q(**{f'{field}__{lookup}': values[i]})
+        for prev_field, prev_value in zip(fields[:i], values[:i]):
+            term &= Q(**{prev_field: prev_value})
+        condition |= term
+    return condition
@@ -0,0 +1,272 @@
+"""Retries, circuit breaking and request hedging for upstream LLM calls.
+
+Each call goes through a per-model :class:`CircuitBreaker`. After
+``LLM_BREAKER_THRESHOLD`` consecutive upstream failures (5xx, connection
+errors, timeouts) the breaker opens, and for ``LLM_BREAKER_COOLDOWN``
+seconds calls fail immediately with :class:`UpstreamUnavailable` instead
+of pinning a worker on a dying upstream. The first call after the
+cooldown is let through as a probe and closes the breaker again if it
+succeeds. Breaker state is per process.
+
+429 and 5xx responses and failed connects are retried up to
+``LLM_MAX_RETRIES`` times with full-jitter exponential backoff. A
+``Retry-After`` header sets the minimum wait, and when it asks for more
+than ``LLM_RETRY_AFTER_MAX`` seconds the call gives up right away. Read
+timeouts are not retried because the upstream already spent the whole
+read timeout on them.
+
+With ``LLM_HEDGE_AFTER`` set, a non-streaming call that has not answered
+after that many seconds is sent a second time, and the first response to
+arrive wins.
+"""
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Dict, TypeVar
+
+import httpx
+import requests
+from django.conf import settings
+
+T = TypeVar('T')
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class UpstreamUnavailable(Exception):
+    """The upstream is failing or the breaker is open; ``retry_after`` is a hint in seconds."""
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, threshold: int, cooldown: float):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing_since: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            return 'open' if time.monotonic() - self.opened_at < self.cooldown else 'half-open'
+
+    def before_call(self) -> None:
+        """Raise ``UpstreamUnavailable`` unless a call may go through now."""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            now = time.monotonic()
+            remaining = self.opened_at + self.cooldown - now
+            if remaining > 0:
+                raise UpstreamUnavailable(f'Upstream for {self.name} is unavailable', retry_after=remaining)
+            # Half-open: one probe at a time; a probe that never reported back is replaced after a cooldown
+            if self._probing_since is not None and now - self._probing_since < self.cooldown:
+                raise UpstreamUnavailable(f'Upstream for {self.name} is recovering', retry_after=1)
+            self._probing_since = now
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing_since = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probing_since is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._probing_since = None
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(model: str | None) -> CircuitBreaker:
+    name = model or 'default'
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(
+                name, CircuitBreaker(name, settings.LLM_BREAKER_THRESHOLD, settings.LLM_BREAKER_COOLDOWN),
+            )
+    return breaker
+
+
+def _status(exc: Exception) -> int | None:
+    return getattr(getattr(exc, 'response', None), 'status_code', None)
+
+
+def is_upstream_failure(exc: Exception) -> bool:
+    """True for errors that say the upstream is unhealthy rather than that the request was bad."""
+    status = _status(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS and status != 429
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout, httpx.TransportError))
+
+
+def is_retryable(exc: Exception) -> bool:
+    status = _status(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    if isinstance(exc, requests.ConnectionError):
+        return True
+    return isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError))
+
+
+def retry_after(exc: Exception) -> float | None:
+    """Seconds requested by the response's ``Retry-After`` header, if any."""
+    response = getattr(exc, 'response', None)
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_delay(exc: Exception, attempt: int) -> float | None:
+    """How long to wait before retrying ``exc``, or None to give up."""
+    if attempt >= settings.LLM_MAX_RETRIES or not is_retryable(exc):
+        return None
+    backoff = random.uniform(0, min(settings.LLM_BACKOFF_MAX, settings.LLM_BACKOFF_BASE * 2 ** attempt))
+    requested = retry_after(exc)
+    if requested is not None:
+        if requested > settings.LLM_RETRY_AFTER_MAX:
+            return None
+        return max(requested, backoff)
+    return backoff
+
+
+def _give_up(exc: Exception, breaker: CircuitBreaker) -> Exception:
+    if is_retryable(exc) or is_upstream_failure(exc):
+        hint = retry_after(exc)
+        if hint is None and breaker.opened_at is not None:
+            hint = breaker.cooldown
+        return UpstreamUnavailable(f'Upstream error: {exc}', retry_after=hint)
+    return exc
+
+
+def _record(breaker: CircuitBreaker, exc: Exception | None) -> None:
+    if exc is None or not is_upstream_failure(exc):
+        # Any answer other than a server failure means the upstream is alive
+        breaker.record_success()
+    else:
+        breaker.record_failure()
+
+
+def call(model: str | None, func: Callable[[], T]) -> T:
+    """Run ``func`` under the model's breaker, retrying transient failures."""
+    breaker = breaker_for(model)
+    attempt = 0
+    while True:
+        breaker.before_call()
+        try:
+            result = func()
+        except Exception as exc:
+            _record(breaker, exc)
+            delay = _retry_delay(exc, attempt)
+            if delay is None:
+                raise _give_up(exc, breaker) from exc
+            time.sleep(delay)
+            attempt += 1
+            continue
+        _record(breaker, None)
+        return result
+
+
+async def acall(model: str | None, func: Callable[[], Awaitable[T]]) -> T:
+    """Async counterpart of :func:`call`."""
+    breaker = breaker_for(model)
+    attempt = 0
+    while True:
+        breaker.before_call()
+        try:
+            result = await func()
+        except Exception as exc:
+            _record(breaker, exc)
+            delay = _retry_delay(exc, attempt)
+            if delay is None:
+                raise _give_up(exc, breaker) from exc
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        _record(breaker, None)
+        return result
+
+
+_hedge_executor: ThreadPoolExecutor | None = None
+_hedge_executor_lock = threading.Lock()
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_executor_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(
+                    max_workers=settings.LLM_POOL_SIZE, thread_name_prefix='llm-hedge',
+                )
+    return _hedge_executor
+
+
+def hedged(func: Callable[[], T]) -> T:
+    """Run ``func``, starting a second copy if the first is slower than ``LLM_HEDGE_AFTER``."""
+    delay = settings.LLM_HEDGE_AFTER
+    if not delay:
+        return func()
+    executor = _get_hedge_executor()
+    first = executor.submit(func)
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+    # The losing request cannot be interrupted; it finishes in the background and is discarded
+    pending = {first, executor.submit(func)}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = error or future.exception()
+    raise error
+
+
+async def ahedged(func: Callable[[], Awaitable[T]]) -> T:
+    """Async counterpart of :func:`hedged`; the losing request is cancelled."""
+    delay = settings.LLM_HEDGE_AFTER
+    if not delay:
+        return await func()
+    first = asyncio.ensure_future(func())
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result()
+    pending = {first, asyncio.ensure_future(func())}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
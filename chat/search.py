@@ -0,0 +1,249 @@
+"""Full-text search over message content.
+
+On SQLite an FTS5 table indexes every message together with an ``owner``
+token (``u<user_id>``), so a search intersects the user's posting list with
+the query terms instead of ranking every match in the database and
+filtering afterwards. Triggers on ``chat_message`` keep it in sync, which
+also covers ``bulk_create`` and queryset ``update()``/``delete()``.
+
+The source view and triggers reference ``chat_chat``, which SQLite rejects
+while a migration rebuilds that table, so they are dropped before every
+``migrate`` run and recreated afterwards (see ``ChatConfig.ready``). The
+FTS table and its data stay in place throughout.
+
+On PostgreSQL a GIN expression index over ``to_tsvector`` serves the same
+queries. The user's chat ids are looked up first and passed in as an
+array, so the planner can intersect the GIN match with the ``chat_id``
+index rather than ranking every user's matches and filtering afterwards.
+Other backends fall back to an unindexed ``icontains`` scan.
+"""
+import html
+import re
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from django.db import connection as default_connection
+from django.utils.dateparse import parse_datetime
+
+from .models import Chat, Message
+
+FTS_TABLE = 'chat_message_fts'
+FTS_SOURCE_VIEW = 'chat_message_fts_source'
+PG_INDEX = 'chat_message_content_fts_idx'
+PG_CONFIG = 'english'
+
+# Private-use markers survive html.escape and are swapped for <mark> tags afterwards
+_HIT_START = '\ue000'
+_HIT_END = '\ue001'
+_ELLIPSIS = '…'
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_SQLITE_TABLE = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        content, owner,
+        content='{FTS_SOURCE_VIEW}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+"""
+
+_SQLITE_VIEW = f"""
+    CREATE VIEW IF NOT EXISTS {FTS_SOURCE_VIEW} AS
+    SELECT m.id AS id, m.content AS content, 'u' || c.user_id AS owner
+    FROM chat_message m JOIN chat_chat c ON c.id = m.chat_id
+"""
+
+_SQLITE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON chat_message BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, content, owner)
+        SELECT new.id, new.content, 'u' || user_id FROM chat_chat WHERE id = new.chat_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON chat_message BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content, owner)
+        SELECT 'delete', old.id, old.content, 'u' || user_id FROM chat_chat WHERE id = old.chat_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF content ON chat_message BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content, owner)
+        SELECT 'delete', old.id, old.content, 'u' || user_id FROM chat_chat WHERE id = old.chat_id;
+        INSERT INTO {FTS_TABLE}(rowid, content, owner)
+        SELECT new.id, new.content, 'u' || user_id FROM chat_chat WHERE id = new.chat_id;
+    END
+    """,
+]
+
+
+def _sqlite_table_exists(cursor) -> bool:
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+    return cursor.fetchone() is not None
+
+
+def create_index(connection=default_connection) -> None:
+    """Create the index itself; run from a migration."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(_SQLITE_TABLE)
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON chat_message "
+                f"USING GIN (to_tsvector('{PG_CONFIG}', content))"
+            )
+
+
+def attach(connection=default_connection) -> None:
+    """Create the SQLite source view and sync triggers, populating an empty index (idempotent)."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        if not _sqlite_table_exists(cursor):
+            return
+        cursor.execute(_SQLITE_VIEW)
+        for sql in _SQLITE_TRIGGERS:
+            cursor.execute(sql)
+        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {FTS_TABLE}_docsize)')
+        indexed = cursor.fetchone()[0]
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM chat_message)')
+        if not indexed and cursor.fetchone()[0]:
+            rebuild(connection)
+
+
+def detach(connection=default_connection) -> None:
+    """Drop the SQLite view and triggers so migrations can rebuild chat tables."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for suffix in ('ai', 'ad', 'au'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+        cursor.execute(f'DROP VIEW IF EXISTS {FTS_SOURCE_VIEW}')
+
+
+def rebuild(connection=default_connection) -> None:
+    """Reindex every message from scratch."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def uninstall(connection=default_connection) -> None:
+    detach(connection)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'DROP INDEX IF EXISTS {PG_INDEX}')
+
+
+def _fts5_query(query: str, user_id: int) -> str | None:
+    """Turn free text into a safe FTS5 expression: all terms required, last one as a prefix."""
+    terms = _TOKEN_RE.findall(query)
+    if not terms:
+        return None
+    phrases = [f'"{t}"' for t in terms[:-1]] + [f'"{terms[-1]}"*']
+    return f'owner:u{int(user_id)} AND content:({" AND ".join(phrases)})'
+
+
+def _snippet_html(snippet: str) -> str:
+    return html.escape(snippet).replace(_HIT_START, '<mark>').replace(_HIT_END, '</mark>')
+
+
+def _fallback_snippet(content: str, query: str, width: int = 80) -> str:
+    pos = content.lower().find(query.lower())
+    if pos < 0:
+        return content[:width * 2]
+    start = max(0, pos - width)
+    end = pos + len(query) + width
+    snippet = content[start:pos] + _HIT_START + content[pos:pos + len(query)] + _HIT_END + content[pos + len(query):end]
+    return (_ELLIPSIS if start else '') + snippet + (_ELLIPSIS if end < len(content) else '')
+
+
+def _created_at(value) -> datetime:
+    # Raw SQL on SQLite bypasses the ORM's converters: the value is the stored text, or a naive
+    # datetime where sqlite3 recognizes the column type, and SQLite stores UTC
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if settings.USE_TZ and value is not None and value.tzinfo is None:
+        value = value.replace(tzinfo=dt_timezone.utc)
+    return value
+
+
+def search_sql(user_id: int, query: str, limit: int, offset: int = 0,
+               connection=default_connection) -> Tuple[str, List] | None:
+    """The indexed search query and its parameters, or None if nothing can match.
+
+    Only for SQLite and PostgreSQL. Fetches ``limit + 1`` rows, to tell whether more exist.
+    """
+    if connection.vendor == 'sqlite':
+        match = _fts5_query(query, user_id)
+        if match is None:
+            return None
+        sql = f"""
+            SELECT m.id, m.chat_id, c.title, m.role, m.created_at,
+                   snippet({FTS_TABLE}, 0, %s, %s, %s, 16) AS snippet,
+                   bm25({FTS_TABLE}, 1.0, 0.0) AS rank
+            FROM {FTS_TABLE}
+            JOIN chat_message m ON m.id = {FTS_TABLE}.rowid
+            JOIN chat_chat c ON c.id = m.chat_id
+            WHERE {FTS_TABLE} MATCH %s
+            ORDER BY rank
+            LIMIT %s OFFSET %s
+        """
+        return sql, [_HIT_START, _HIT_END, _ELLIPSIS, match, limit + 1, offset]
+    chat_ids = list(Chat.objects.using(connection.alias).filter(user_id=user_id).values_list('id', flat=True))
+    if not chat_ids:
+        return None
+    sql = f"""
+        SELECT m.id, m.chat_id, c.title, m.role, m.created_at,
+               ts_headline('{PG_CONFIG}', m.content, q,
+                           'StartSel=' || %s || ', StopSel=' || %s || ', MaxFragments=1, MaxWords=24'),
+               ts_rank(to_tsvector('{PG_CONFIG}', m.content), q) AS rank
+        FROM chat_message m
+        JOIN chat_chat c ON c.id = m.chat_id,
+             websearch_to_tsquery('{PG_CONFIG}', %s) q
+        WHERE m.chat_id = ANY(%s) AND to_tsvector('{PG_CONFIG}', m.content) @@ q
+        ORDER BY rank DESC
+        LIMIT %s OFFSET %s
+    """
+    return sql, [_HIT_START, _HIT_END, query, chat_ids, limit + 1, offset]
+
+
+def search_messages(user_id: int, query: str, limit: int, offset: int = 0,
+                    connection=default_connection) -> Tuple[List[Dict], bool]:
+    """Return up to ``limit`` ranked hits for ``query`` among the user's messages, and whether more exist."""
+    query = query.strip()
+    if not query:
+        return [], False
+
+    if connection.vendor in ('sqlite', 'postgresql'):
+        prepared = search_sql(user_id, query, limit, offset, connection)
+        if prepared is None:
+            return [], False
+        with connection.cursor() as cursor:
+            cursor.execute(*prepared)
+            rows = cursor.fetchall()
+    else:
+        rows = (
+            Message.objects
+            .filter(chat__user_id=user_id, content__icontains=query)
+            .order_by('-created_at')
+            .values_list('id', 'chat_id', 'chat__title', 'role', 'created_at', 'content')[offset:offset + limit + 1]
+        )
+        rows = [(*r[:5], _fallback_snippet(r[5], query), None) for r in rows]
+
+    results = [
+        {
+            'message_id': message_id,
+            'chat_id': chat_id,
+            'chat_title': title,
+            'role': role,
+            'created_at': _created_at(created_at),
+            'snippet_html': _snippet_html(snippet or ''),
+            'rank': rank,
+        }
+        for message_id, chat_id, title, role, created_at, snippet, rank in rows[:limit]
+    ]
+    return results, len(rows) > limit
@@ -0,0 +1,84 @@
+"""Synthetic data generator for benchmarks.
+
+Creates throwaway users (``<prefix>-N@bench.invalid``) with chats and
+alternating user/assistant messages using batched ``bulk_create`` so that
+millions of rows can be seeded in reasonable time.
+"""
+import random
+from typing import Callable, List
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+
+from .models import Chat, Message
+
+BENCH_EMAIL_DOMAIN = 'bench.invalid'
+
+_WORDS = (
+    'the quick brown fox jumps over lazy dog python django model query index '
+    'voice speech audio memory chat title summary token stream cache latency '
+    'hello thanks please explain how why what when where would could should'
+).split()
+
+
+def _sentence(rng: random.Random, min_words: int = 4, max_words: int = 40) -> str:
+    return ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(min_words, max_words))).capitalize() + '.'
+
+
+def seed(
+    users: int,
+    chats_per_user: int,
+    messages_per_chat: int,
+    prefix: str = 'bench',
+    batch_size: int = 5000,
+    seed_value: int = 0,
+    password: str | None = None,
+    progress: Callable[[str], None] | None = None,
+) -> List:
+    """Create ``users`` users, each with chats and messages. Returns the users."""
+    rng = random.Random(seed_value)
+    User = get_user_model()
+    hashed = make_password(password) if password else make_password(None)
+
+    created_users = User.objects.bulk_create([
+        User(email=f'{prefix}-{i}@{BENCH_EMAIL_DOMAIN}', password=hashed, is_verified=True)
+        for i in range(users)
+    ], batch_size=batch_size)
+    # SQLite and older backends do not return primary keys from bulk_create
+    created_users = list(User.objects.filter(email__endswith=f'@{BENCH_EMAIL_DOMAIN}', email__startswith=f'{prefix}-'))
+
+    for user in created_users:
+        chats = Chat.objects.bulk_create([
+            Chat(user=user, title=_sentence(rng, 2, 6)[:255], pinned=rng.random() < 0.05)
+            for _ in range(chats_per_user)
+        ], batch_size=batch_size)
+        if chats and chats[0].pk is None:
+            chats = list(Chat.objects.filter(user=user).order_by('id'))
+
+        pending: List[Message] = []
+        total = 0
+        for chat in chats:
+            for n in range(messages_per_chat):
+                pending.append(Message(
+                    chat=chat,
+                    role='user' if n % 2 == 0 else 'assistant',
+                    content=_sentence(rng) if n % 2 == 0 else ' '.join(_sentence(rng) for _ in range(3)),
+                ))
+                if len(pending) >= batch_size:
+                    Message.objects.bulk_create(pending, batch_size=batch_size)
+                    total += len(pending)
+                    pending = []
+        if pending:
+            Message.objects.bulk_create(pending, batch_size=batch_size)
+            total += len(pending)
+        if progress:
+            progress(f'Seeded {user.email}: {len(chats)} chats, {total} messages')
+    return created_users
+
+
+def cleanup(prefix: str = 'bench') -> None:
+    """Delete every user created by :func:`seed` with ``prefix`` and all their data."""
+    users = get_user_model().objects.filter(email__startswith=f'{prefix}-', email__endswith=f'@{BENCH_EMAIL_DOMAIN}')
+    Message.objects.filter(chat__user__in=users).delete()
+    Chat.objects.filter(user__in=users).delete()
+    users.delete()
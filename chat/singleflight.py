@@ -0,0 +1,133 @@
+"""Single-flight coalescing of duplicate chat turns.
+
+A double-click or a client retry sends the same turn twice while the first
+one is still waiting on the model. Each turn is keyed by (user, chat,
+content hash, idempotency key); the first request to :func:`acquire` a key
+runs the turn, and every identical request that arrives meanwhile blocks
+in :func:`wait` for its result instead of storing another ``Message`` and
+paying for another completion.
+
+Followers in the same process wait on an event. Followers in other
+processes poll the Django cache, which also holds a lock entry so only one
+process leads; configure a shared ``CACHES`` backend when running several
+workers.
+
+Only a client that sent an idempotency key gets its finished turn replayed:
+the result is kept for ``CHAT_IDEMPOTENCY_TTL`` seconds, so a retry after
+completion returns the stored reply. Without a key only requests that
+arrive while the turn is still running are coalesced; sending the same
+text again afterwards ("yes", "continue") is a new turn. The result is
+still kept for a short grace period, but only for pollers that were
+already waiting on it.
+"""
+import hashlib
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict
+
+from django.conf import settings
+from django.core.cache import cache
+
+_LOCK_KEY = 'chat:flight:lock:{key}'
+_RESULT_KEY = 'chat:flight:result:{key}'
+_ERROR_KEY = 'chat:flight:error:{key}'
+
+POLL_INTERVAL = 0.05
+# Long enough for pollers in other processes to pick the result up
+RESULT_GRACE = 5
+
+
+class FlightFailed(Exception):
+    """The leading request failed, so the duplicates waiting on it fail the same way."""
+
+
+class FlightTimeout(Exception):
+    """The leading request did not finish within ``CHAT_SINGLEFLIGHT_WAIT`` seconds."""
+
+
+@dataclass
+class _Flight:
+    done: threading.Event = field(default_factory=threading.Event)
+    started: float = field(default_factory=time.monotonic)
+    result: Dict | None = None
+    error: str | None = None
+
+
+_flights: Dict[str, _Flight] = {}
+_flights_lock = threading.Lock()
+
+
+def turn_key(user_id: int, chat_id: str | int | None, content: str, idempotency_key: str = '') -> str:
+    """Return the flight key for a user turn; a missing ``chat_id`` means "start a new chat"."""
+    raw = '\0'.join([str(user_id), str(chat_id or 'new'), content, idempotency_key])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def acquire(key: str, idempotent: bool = False) -> bool:
+    """Try to lead the flight for ``key``. Returns False if it is running, or if ``idempotent`` and it has a result."""
+    with _flights_lock:
+        flight = _flights.get(key)
+        # A leader that never finished (e.g. a stream nobody read) stops blocking the key eventually
+        if flight is not None and time.monotonic() - flight.started < settings.CHAT_SINGLEFLIGHT_WAIT:
+            return False
+        if idempotent and cache.get(_RESULT_KEY.format(key=key)) is not None:
+            return False
+        if not cache.add(_LOCK_KEY.format(key=key), 1, timeout=settings.CHAT_SINGLEFLIGHT_WAIT):
+            return False
+        cache.delete(_ERROR_KEY.format(key=key))
+        # A previous turn with the same text is not this one's result
+        cache.delete(_RESULT_KEY.format(key=key))
+        _flights[key] = _Flight()
+        return True
+
+
+def complete(key: str, result: Dict, idempotent: bool = False) -> None:
+    """Publish the leader's result to every waiting duplicate and release the flight."""
+    retain = settings.CHAT_IDEMPOTENCY_TTL if idempotent else RESULT_GRACE
+    cache.set(_RESULT_KEY.format(key=key), result, timeout=retain)
+    cache.delete(_LOCK_KEY.format(key=key))
+    with _flights_lock:
+        flight = _flights.pop(key, None)
+    if flight is not None:
+        flight.result = result
+        flight.done.set()
+
+
+def abandon(key: str, error: str) -> None:
+    """Release a failed flight; current waiters fail with ``error`` and later requests may retry."""
+    cache.set(_ERROR_KEY.format(key=key), error, timeout=RESULT_GRACE)
+    cache.delete(_LOCK_KEY.format(key=key))
+    with _flights_lock:
+        flight = _flights.pop(key, None)
+    if flight is not None:
+        flight.error = error
+        flight.done.set()
+
+
+def wait(key: str, timeout: float | None = None) -> Dict:
+    """Block until the leader of ``key`` finishes and return its result."""
+    timeout = settings.CHAT_SINGLEFLIGHT_WAIT if timeout is None else timeout
+    with _flights_lock:
+        flight = _flights.get(key)
+    if flight is not None:
+        if not flight.done.wait(timeout):
+            raise FlightTimeout('Duplicate request is still in progress')
+        if flight.error is not None:
+            raise FlightFailed(flight.error)
+        return flight.result
+
+    # Led by another process (or just finished here): poll the shared cache
+    deadline = time.monotonic() + timeout
+    while True:
+        result = cache.get(_RESULT_KEY.format(key=key))
+        if result is not None:
+            return result
+        error = cache.get(_ERROR_KEY.format(key=key))
+        if error is not None:
+            raise FlightFailed(error)
+        if cache.get(_LOCK_KEY.format(key=key)) is None:
+            raise FlightFailed('The original request did not complete')
+        if time.monotonic() >= deadline:
+            raise FlightTimeout('Duplicate request is still in progress')
+        time.sleep(POLL_INTERVAL)
@@ -0,0 +1,307 @@
+"""Local stand-in for the OpenAI chat completions API, for offline load tests.
+
+Speaks enough of ``POST /v1/chat/completions`` (plain and ``stream``)
+for every call site in this app: title generation gets a short title,
+batched fact extraction gets a JSON object keyed by message id, and
+``response_format: json_object`` always gets valid JSON. Replies are
+derived from a hash of the request, so the same request always produces
+the same text. Latency and errors are sampled from a generator seeded by
+the request and how many times it has been seen, so a retry can succeed
+where the first attempt failed and a load test is still reproducible.
+
+Latency and reply length are distributions written as ``kind:args``:
+``fixed:MS``, ``uniform:LO,HI``, ``normal:MEAN,SD``, ``exp:MEAN`` or
+``lognormal:MEDIAN,SIGMA`` (milliseconds for latency, tokens for length).
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+from .tokens import estimate_tokens
+
+_WORDS = (
+    'the a model request cache latency stream token voice audio memory chat answer question '
+    'system user reply context window budget queue worker thread process index query result '
+    'simple fast quiet careful clear useful small large first next last because while'
+).split()
+
+_NAME_RE = re.compile(r"\b(?i:my name is|call me|i am|i'm)\s+([A-Z][a-z]+)")
+_CITY_RE = re.compile(r"\bi live in\s+([A-Z][a-zA-Z]+)", re.IGNORECASE)
+_AGE_RE = re.compile(r"\bi(?:'m| am)\s+(\d{1,3})\s+years? old", re.IGNORECASE)
+_LIKE_RE = re.compile(r"\bi (?:love|like|enjoy)\s+([a-z][a-z ]{1,30}?)(?:[.,!]|$)", re.IGNORECASE)
+
+
+class Distribution:
+    """A sampled quantity parsed from ``kind:arg[,arg]``."""
+
+    KINDS = ('fixed', 'uniform', 'normal', 'exp', 'lognormal')
+
+    def __init__(self, spec: str):
+        kind, _, args = spec.partition(':')
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown distribution '{kind}' (expected one of {', '.join(self.KINDS)})")
+        try:
+            self.args = [float(a) for a in args.split(',')] if args else []
+        except ValueError:
+            raise ValueError(f"Bad distribution arguments in '{spec}'") from None
+        expected = 1 if kind in ('fixed', 'exp') else 2
+        if len(self.args) != expected:
+            raise ValueError(f"'{kind}' takes {expected} argument(s), got '{spec}'")
+        self.kind = kind
+        self.spec = spec
+
+    def sample(self, rng: random.Random) -> float:
+        a = self.args
+        if self.kind == 'fixed':
+            value = a[0]
+        elif self.kind == 'uniform':
+            value = rng.uniform(a[0], a[1])
+        elif self.kind == 'normal':
+            value = rng.gauss(a[0], a[1])
+        elif self.kind == 'exp':
+            value = rng.expovariate(1.0 / a[0]) if a[0] else 0.0
+        else:
+            value = a[0] * rng.lognormvariate(0.0, a[1])
+        return max(0.0, value)
+
+
+@dataclass
+class StubConfig:
+    latency: Distribution = field(default_factory=lambda: Distribution('lognormal:300,0.5'))
+    reply_tokens: Distribution = field(default_factory=lambda: Distribution('uniform:40,200'))
+    tokens_per_second: float = 60.0
+    error_rate: float = 0.0
+    error_statuses: Tuple[int, ...] = (500, 503, 429)
+    retry_after: float = 1.0
+    disconnect_rate: float = 0.0
+    seed: int = 0
+
+
+class StubState:
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self.stats: Counter = Counter()
+        self.seen: Counter = Counter()
+        self.lock = threading.Lock()
+
+    def count(self, *keys: str, amount: int = 1) -> None:
+        with self.lock:
+            for key in keys:
+                self.stats[key] += amount
+
+
+def _words(rng: random.Random, n: int) -> str:
+    return ' '.join(rng.choice(_WORDS) for _ in range(n))
+
+
+def _sentences(rng: random.Random, tokens: int) -> str:
+    out: List[str] = []
+    remaining = max(1, tokens)
+    while remaining > 0:
+        n = min(remaining, rng.randint(6, 18))
+        out.append(_words(rng, n).capitalize() + '.')
+        remaining -= n
+    return ' '.join(out)
+
+
+def _facts(text: str) -> Dict[str, str]:
+    facts = {}
+    if m := _NAME_RE.search(text):
+        facts['name'] = m.group(1)
+    if m := _CITY_RE.search(text):
+        facts['location'] = m.group(1)
+    if m := _AGE_RE.search(text):
+        facts['age'] = m.group(1)
+    if m := _LIKE_RE.search(text):
+        facts['interests'] = m.group(1).strip()
+    return facts
+
+
+def build_reply(body: Dict, rng: random.Random, config: StubConfig) -> str:
+    """Produce a deterministic reply shaped like what the calling prompt expects."""
+    messages = body.get('messages') or []
+    system = ' '.join(m.get('content') or '' for m in messages if m.get('role') == 'system').lower()
+    last_user = next((m.get('content') or '' for m in reversed(messages) if m.get('role') == 'user'), '')
+
+    if 'title generator' in system:
+        words = re.findall(r'[A-Za-z]+', last_user)[:5] or ['New', 'conversation']
+        return ' '.join(w.capitalize() for w in words)
+    if 'fact extraction' in system:
+        try:
+            items = json.loads(last_user)
+        except ValueError:
+            items = None
+        if isinstance(items, list):
+            return json.dumps({str(it.get('id')): _facts(it.get('message') or '') for it in items if isinstance(it, dict)})
+        return json.dumps(_facts(last_user))
+    if (body.get('response_format') or {}).get('type') == 'json_object':
+        return json.dumps({'result': _words(rng, 5)})
+    if 'summary' in system:
+        return _sentences(rng, min(250, int(config.reply_tokens.sample(rng))))
+    return _sentences(rng, int(config.reply_tokens.sample(rng)))
+
+
+def _request_rng(raw: bytes, seed: int, attempt: int = 0) -> random.Random:
+    digest = hashlib.sha256(b'%d:%d:' % (seed, attempt) + raw).digest()
+    return random.Random(int.from_bytes(digest[:8], 'little'))
+
+
+def _chunks(text: str) -> List[str]:
+    """Split ``text`` into roughly token-sized pieces that concatenate back to it."""
+    return re.findall(r'\S+\s*|\s+', text) or ['']
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = 'StubOpenAI/1.0'
+    protocol_version = 'HTTP/1.1'
+    state: StubState
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, obj: Dict, headers: Dict[str, str] | None = None) -> None:
+        data = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip('/') in ('/health', '/v1/health'):
+            self._send_json(200, {'ok': True})
+        elif self.path.rstrip('/') == '/v1/models':
+            self._send_json(200, {'object': 'list', 'data': [
+                {'id': name, 'object': 'model', 'owned_by': 'stub'} for name in ('gpt-4o-mini', 'gpt-4o')
+            ]})
+        elif self.path.rstrip('/') == '/stats':
+            with self.state.lock:
+                self._send_json(200, dict(self.state.stats))
+        else:
+            self._send_json(404, {'error': {'message': 'Not found'}})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/v1/chat/completions':
+            self._send_json(404, {'error': {'message': 'Not found'}})
+            return
+        raw = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        try:
+            body = json.loads(raw or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'Invalid JSON body', 'type': 'invalid_request_error'}})
+            return
+
+        config = self.state.config
+        digest = hashlib.sha256(raw).hexdigest()
+        with self.state.lock:
+            if len(self.state.seen) > 100_000:
+                self.state.seen.clear()
+            attempt = self.state.seen[digest]
+            self.state.seen[digest] += 1
+        rng = _request_rng(raw, config.seed)
+        timing_rng = _request_rng(raw, config.seed, attempt + 1)
+        self.state.count('requests')
+
+        time.sleep(config.latency.sample(timing_rng) / 1000.0)
+
+        if timing_rng.random() < config.error_rate:
+            status = timing_rng.choice(config.error_statuses)
+            self.state.count('errors', f'errors.{status}')
+            headers = {'Retry-After': f'{config.retry_after:g}'} if status in (429, 503) else None
+            self._send_json(status, {'error': {'message': f'Injected {status}', 'type': 'stub_error'}}, headers)
+            return
+
+        reply = build_reply(body, rng, config)
+        prompt_tokens = sum(estimate_tokens(m.get('content') or '') + 4 for m in body.get('messages') or [])
+        completion_tokens = estimate_tokens(reply)
+        self.state.count('prompt_tokens', amount=prompt_tokens)
+        self.state.count('completion_tokens', amount=completion_tokens)
+        completion_id = 'chatcmpl-stub-' + digest[:24]
+        model = body.get('model') or 'gpt-4o-mini'
+
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        }
+        if body.get('stream'):
+            include_usage = (body.get('stream_options') or {}).get('include_usage')
+            self._stream(reply, completion_id, model, timing_rng, usage if include_usage else None)
+            return
+
+        self.state.count('completions')
+        self._send_json(200, {
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': reply},
+                'finish_reason': 'stop',
+            }],
+            'usage': usage,
+        })
+
+    def _stream(self, reply: str, completion_id: str, model: str, rng: random.Random,
+                usage: Dict | None = None) -> None:
+        config = self.state.config
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        # No Content-Length: close the connection to end the body
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta: Dict | None, finish_reason: str | None = None, usage: Dict | None = None) -> None:
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [] if delta is None else [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+            }
+            if usage is not None:
+                chunk['usage'] = usage
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode('utf-8'))
+            self.wfile.flush()
+
+        interval = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+        disconnect_at = None
+        if rng.random() < config.disconnect_rate:
+            self.state.count('disconnects')
+            disconnect_at = rng.randint(0, max(0, len(_chunks(reply)) - 1))
+        try:
+            event({'role': 'assistant', 'content': ''})
+            for i, piece in enumerate(_chunks(reply)):
+                if i == disconnect_at:
+                    return
+                if interval:
+                    time.sleep(interval)
+                event({'content': piece})
+            event({}, finish_reason='stop')
+            if usage is not None:
+                # Like the real API with stream_options.include_usage: a final chunk with no choices
+                event(None, usage=usage)
+            self.wfile.write(b'data: [DONE]\n\n')
+            self.wfile.flush()
+            self.state.count('streams')
+        except (BrokenPipeError, ConnectionResetError):
+            self.state.count('client_disconnects')
+
+
+def make_server(host: str, port: int, config: StubConfig) -> ThreadingHTTPServer:
+    handler = type('BoundStubHandler', (StubHandler,), {'state': StubState(config)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
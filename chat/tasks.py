@@ -0,0 +1,212 @@
+"""Background job handlers for work that should not block a chat turn."""
+import json
+from collections import defaultdict
+from typing import Dict, List
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from . import jobs, llm, llm_cache, memory
+from .models import Chat, Message, UserMemory
+
+
+def _generate_title_with_ai(text: str) -> str:
+    """Generate a short, descriptive chat title from the first user message."""
+    if not text.strip():
+        return "New Chat"
+
+    payload = {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {
+                "role": "system",
+                "content": (
+                    "You are a title generator. Create a short, descriptive title (max 6 words) "
+                    "based on the provided conversation start. "
+                    "Do not use quotes or punctuation at the start or end."
+                )
+            },
+            {"role": "user", "content": text}
+        ],
+        "temperature": 0.3
+    }
+
+    try:
+        title = llm_cache.cached_chat_completion(payload, read_timeout=15, namespace='title').strip()
+        return title if title else "New Chat"
+    except Exception as e:
+        print(f"Title generation failed: {e}")
+        return "New Chat"
+
+
+_EXTRACTION_PROMPT = (
+    "You are a fact extraction assistant. "
+    "You receive a JSON array of user messages, each with an \"id\". For every message, extract any "
+    "personal information the user is sharing about themselves "
+    "(e.g., name, age, location, interests, preferences, dislikes). "
+    "Respond only in JSON: an object mapping each message id (as a string) to an object of key-value "
+    "pairs, do not include explanations. Use an empty object for messages without personal info."
+)
+
+
+_EXTRACTION_MODEL = "gpt-4o-mini"
+_EXTRACTION_PARAMS = {"temperature": 0, "response_format": {"type": "json_object"}}
+
+
+def _extraction_cache_key(message: str) -> str:
+    # Keyed per message, not per batch, so a message hits no matter what it was batched with
+    return llm_cache.make_key(
+        _EXTRACTION_MODEL,
+        [{"role": "system", "content": _EXTRACTION_PROMPT}, {"role": "user", "content": message}],
+        **_EXTRACTION_PARAMS,
+    )
+
+
+def _extract_facts_uncached(messages: List[str]) -> List[Dict]:
+    payload = {
+        "model": _EXTRACTION_MODEL,
+        "messages": [
+            {"role": "system", "content": _EXTRACTION_PROMPT},
+            {"role": "user", "content": json.dumps([{"id": str(i), "message": m} for i, m in enumerate(messages)])},
+        ],
+        **_EXTRACTION_PARAMS,
+    }
+    results = json.loads(llm.chat_completion(payload, read_timeout=30, site='memory'))
+    facts = []
+    for i in range(len(messages)):
+        item = results.get(str(i)) if isinstance(results, dict) else None
+        facts.append(item if isinstance(item, dict) else {})
+    return facts
+
+
+def _extract_facts_batch(messages: List[str]) -> List[Dict]:
+    """Extract personal facts from several messages, with one completion call for the cache misses."""
+    keys = [_extraction_cache_key(m) for m in messages]
+    facts: List[Dict | None] = []
+    for key in keys:
+        cached = llm_cache.get(key, namespace='extract_memory')
+        facts.append(json.loads(cached) if cached is not None else None)
+
+    # Identical messages in one batch are extracted once
+    misses: Dict[str, List[int]] = defaultdict(list)
+    for i, f in enumerate(facts):
+        if f is None:
+            misses[keys[i]].append(i)
+    if misses:
+        positions = list(misses.values())
+        for indexes, extracted in zip(positions, _extract_facts_uncached([messages[p[0]] for p in positions])):
+            for i in indexes:
+                facts[i] = extracted
+            llm_cache.set(keys[indexes[0]], json.dumps(extracted))
+    return facts
+
+
+@jobs.register_batch(
+    'extract_memory',
+    size=settings.CHAT_MEMORY_BATCH_SIZE,
+    window=settings.CHAT_MEMORY_BATCH_WINDOW,
+)
+def extract_memory(payloads: List[Dict]) -> None:
+    """Extract facts for a batch of (user_id, message) jobs and write each user's memory once."""
+    payloads = [p for p in payloads if p.get('message')]
+    if not payloads:
+        return
+
+    facts_per_message = _extract_facts_batch([p['message'] for p in payloads])
+
+    # Later messages win when the same user states a fact twice in one batch
+    new_facts: Dict[int, Dict] = defaultdict(dict)
+    for payload, facts in zip(payloads, facts_per_message):
+        for k, v in facts.items():
+            if v:
+                new_facts[payload['user_id']][k] = v
+
+    changed = {
+        user_id: facts for user_id, facts in new_facts.items()
+        if any(memory.get_snapshot(user_id).data.get(k) != v for k, v in facts.items())
+    }
+    if not changed:
+        return
+
+    existing = {m.user_id: m for m in UserMemory.objects.filter(user_id__in=changed)}
+    to_update = []
+    for user_id, user_memory in existing.items():
+        user_memory.memory_data.update(changed[user_id])
+        to_update.append(user_memory)
+    if to_update:
+        UserMemory.objects.bulk_update(to_update, ['memory_data'])
+
+    valid_users = set(get_user_model().objects.filter(id__in=changed).values_list('id', flat=True))
+    UserMemory.objects.bulk_create(
+        [UserMemory(user_id=user_id, memory_data=facts) for user_id, facts in changed.items()
+         if user_id not in existing and user_id in valid_users],
+        ignore_conflicts=True,
+    )
+
+    # Bulk writes skip the post_save receivers that normally invalidate the cache
+    for user_id in changed:
+        memory.invalidate(user_id)
+
+
+@jobs.register('generate_title')
+def generate_title(chat_id: int, text: str, placeholder: str) -> None:
+    title = _generate_title_with_ai(text)
+    # Only replace the placeholder; never clobber a title the user set meanwhile
+    Chat.objects.filter(id=chat_id, title=placeholder).update(title=title)
+
+
+def _format_transcript(messages) -> str:
+    lines = []
+    for m in messages:
+        content = m['content']
+        if len(content) > 2000:
+            content = content[:2000] + ' [...]'
+        lines.append(f"{m['role'].capitalize()}: {content}")
+    return '\n'.join(lines)
+
+
+@jobs.register('summarize_chat')
+def summarize_chat(chat_id: int) -> None:
+    """Fold messages older than the verbatim tail into the chat's rolling summary."""
+    chat = Chat.objects.filter(id=chat_id).first()
+    if chat is None:
+        return
+
+    pending = Message.objects.filter(chat=chat)
+    if chat.summarized_through_id is not None:
+        pending = pending.filter(id__gt=chat.summarized_through_id)
+    pending = list(pending.order_by('created_at', 'id').values('id', 'role', 'content'))
+    to_fold = pending[:-settings.CHAT_SUMMARY_KEEP_RECENT] if settings.CHAT_SUMMARY_KEEP_RECENT else pending
+    if not to_fold:
+        return
+
+    payload = {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {
+                "role": "system",
+                "content": (
+                    "You maintain a running summary of a conversation between a user and an assistant. "
+                    "Update the existing summary with the new messages. Keep names, facts, decisions, "
+                    "preferences and open questions; drop pleasantries. Write at most 250 words of plain prose."
+                )
+            },
+            {
+                "role": "user",
+                "content": (
+                    f"Existing summary:\n{chat.summary or '(none yet)'}\n\n"
+                    f"New messages:\n{_format_transcript(to_fold)}"
+                )
+            },
+        ],
+        "temperature": 0.2,
+    }
+    summary = llm.chat_completion(payload, read_timeout=60, site='summary').strip()
+    if not summary:
+        return
+
+    # Skip the write if another run already advanced the summary
+    Chat.objects.filter(id=chat.id, summarized_through_id=chat.summarized_through_id).update(
+        summary=summary,
+        summarized_through_id=to_fold[-1]['id'],
+    )
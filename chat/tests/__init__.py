@@ -0,0 +1,4 @@
+import logging
+
+# Keep the per-request log lines out of the test output
+logging.getLogger('chat.timing').setLevel(logging.WARNING)
@@ -0,0 +1,64 @@
+"""Shared fixtures: a signed-in user, and the stub OpenAI server (see ``chat.stub_server``) to talk to."""
+import json
+import threading
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from chat import memory, resilience, singleflight
+from chat.stub_server import Distribution, StubConfig, make_server
+
+
+def stub_config(**overrides) -> StubConfig:
+    """A stub that answers at once, with short replies."""
+    options = {'latency': Distribution('fixed:0'), 'reply_tokens': Distribution('fixed:20'), 'tokens_per_second': 0}
+    return StubConfig(**{**options, **overrides})
+
+
+def ndjson(response):
+    """The events of a streamed NDJSON response."""
+    body = b''.join(response.streaming_content).decode('utf-8')
+    return [json.loads(line) for line in body.splitlines() if line]
+
+
+class ChatTestCase(TestCase):
+    """A test case whose upstream LLM calls go to a stub server started for the class."""
+    stub = stub_config()
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = make_server('127.0.0.1', 0, cls.stub)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+        cls.stub_state = cls.server.RequestHandlerClass.state
+        upstream = override_settings(
+            OPENAI_API_KEY='test',
+            OPENAI_API_URL=f'http://127.0.0.1:{cls.server.server_port}/v1/chat/completions',
+            LLM_BACKOFF_BASE=0.01,
+            LLM_BACKOFF_MAX=0.05,
+            LLM_HEDGE_AFTER=0,
+            TTS_PREGENERATE=False,
+        )
+        upstream.enable()
+        cls.addClassCleanup(upstream.disable)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email='ada@example.com', password='secret')
+
+    def setUp(self):
+        cache.clear()
+        memory._local.clear()
+        resilience._breakers.clear()
+        singleflight._flights.clear()
+        with self.stub_state.lock:
+            self.stub_state.stats.clear()
+            self.stub_state.seen.clear()
+        self.client.force_login(self.user)
+
+    def upstream_calls(self) -> int:
+        with self.stub_state.lock:
+            return self.stub_state.stats['requests']
@@ -0,0 +1,85 @@
+from asgiref.sync import async_to_sync
+from django.urls import reverse
+
+from chat.models import Chat, Message
+
+from .base import ChatTestCase, stub_config
+
+
+class AsyncViewTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.async_client.force_login(self.user)
+
+    async def test_send_message(self):
+        response = await self.async_client.post(reverse('chat:async_send_message'), {'message': 'Hello from ASGI'})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['created'])
+        self.assertFalse(data['deduplicated'])
+        self.assertTrue(data['assistant']['content'])
+        roles = [role async for role in Message.objects.filter(chat_id=data['chat_id']).order_by('id')
+                 .values_list('role', flat=True)]
+        self.assertEqual(roles, ['user', 'assistant'])
+
+    def test_send_matches_the_sync_view(self):
+        sync = self.client.post(reverse('chat:send_message'), {'message': 'Same shape please'}).json()
+        native = async_to_sync(self.async_client.post)(
+            reverse('chat:async_send_message'), {'message': 'Same shape please'},
+        ).json()
+
+        self.assertEqual(sync.keys(), native.keys())
+
+    async def test_create_chat(self):
+        response = await self.async_client.post(reverse('chat:async_create_chat'), {'title': 'Planning a trip'})
+
+        data = response.json()
+        self.assertTrue(data['title_pending'])
+        self.assertTrue(await Chat.objects.filter(id=data['chat_id'], user=self.user).aexists())
+
+    async def test_regenerate_replaces_the_last_reply(self):
+        chat = await Chat.objects.acreate(user=self.user, title='t', model='gpt-4o-mini')
+        await Message.objects.acreate(chat=chat, role='user', content='Write me a haiku')
+        old = await Message.objects.acreate(chat=chat, role='assistant', content='An old reply')
+
+        response = await self.async_client.post(reverse('chat:async_regenerate_response', args=[chat.id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(await Message.objects.filter(id=old.id).aexists())
+        reply = await Message.objects.aget(chat=chat, role='assistant')
+        self.assertEqual(reply.content, response.json()['assistant']['content'])
+
+    async def test_regenerate_needs_a_user_message(self):
+        chat = await Chat.objects.acreate(user=self.user, title='t', model='gpt-4o-mini')
+
+        response = await self.async_client.post(reverse('chat:async_regenerate_response', args=[chat.id]))
+
+        self.assertEqual(response.status_code, 400)
+
+    async def test_other_users_chats_are_not_found(self):
+        response = await self.async_client.post(reverse('chat:async_regenerate_response', args=[999999]))
+
+        self.assertEqual(response.status_code, 404)
+
+    async def test_requires_login(self):
+        await self.async_client.alogout()
+
+        response = await self.async_client.post(reverse('chat:async_send_message'), {'message': 'Hi'})
+
+        self.assertEqual(response.status_code, 302)
+
+
+class AsyncUpstreamErrorTests(ChatTestCase):
+    # Longer than LLM_RETRY_AFTER_MAX, so the call gives up without retrying
+    stub = stub_config(error_rate=1.0, error_statuses=(503,), retry_after=30)
+
+    def setUp(self):
+        super().setUp()
+        self.async_client.force_login(self.user)
+
+    async def test_unavailable_upstream_is_a_503(self):
+        response = await self.async_client.post(reverse('chat:async_send_message'), {'message': 'Anyone there?'})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '30')
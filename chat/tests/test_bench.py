@@ -0,0 +1,93 @@
+import random
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase
+
+from chat import bench, seed
+from chat.models import Chat, Message
+
+from .base import ChatTestCase
+
+
+def sample(ms, status=200, queries=3):
+    return bench.Sample(seconds=ms / 1000, queries=queries, query_seconds=0.001, status=status)
+
+
+class SummarizeTests(SimpleTestCase):
+    def test_latency_percentiles_interpolate(self):
+        summary = bench.summarize([sample(ms) for ms in range(1, 101)], wall_seconds=2)
+
+        self.assertEqual(summary['latency_ms_p50'], 50.5)
+        self.assertEqual(summary['latency_ms_p99'], 99.01)
+        self.assertEqual(summary['latency_ms_max'], 100)
+        self.assertEqual(summary['throughput_rps'], 50)
+        self.assertEqual(summary['queries_mean'], 3)
+
+    def test_errors_are_counted_but_not_timed(self):
+        samples = [sample(10), sample(20, status=302), sample(5000, status=500), sample(0, status=0)]
+
+        summary = bench.summarize(samples, wall_seconds=1)
+
+        self.assertEqual(summary['errors'], 2)
+        self.assertEqual(summary['error_rate'], 0.5)
+        self.assertEqual(summary['latency_ms_max'], 20)
+        self.assertEqual(summary['status_counts'], {'200': 1, '302': 1, '500': 1, '0': 1})
+
+    def test_no_samples(self):
+        summary = bench.summarize([], wall_seconds=0)
+
+        self.assertEqual((summary['requests'], summary['error_rate'], summary['latency_ms_p95']), (0, 0.0, 0.0))
+
+    def test_compare_reports_relative_change(self):
+        baseline = {'endpoints': {'get_chat': {'throughput_rps': 100, 'latency_ms_p50': 10, 'queries_mean': 0}}}
+        current = {'endpoints': {
+            'get_chat': {'throughput_rps': 150, 'latency_ms_p50': 8, 'queries_mean': 2},
+            'new_endpoint': {'throughput_rps': 1},
+        }}
+
+        changes = bench.compare(current, baseline, keys=('throughput_rps', 'latency_ms_p50', 'queries_mean'))
+
+        # A zero baseline has no relative change, and new endpoints have no baseline
+        self.assertEqual(changes, {'get_chat': {'throughput_rps': 50.0, 'latency_ms_p50': -20.0}})
+
+
+class WorkloadTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = seed.seed(users=2, chats_per_user=4, messages_per_chat=4, prefix='test')
+        self.workload = bench.build_workload(self.users, random.Random(0))
+
+    def test_seeded_data(self):
+        self.assertEqual(len(self.users), 2)
+        self.assertEqual(Chat.objects.filter(user__in=self.users).count(), 8)
+        self.assertEqual(Message.objects.filter(chat__user__in=self.users).count(), 32)
+
+    def test_deletable_chats_are_kept_apart(self):
+        for user in self.users:
+            deletable, chats = self.workload.deletable[user.id], self.workload.chats[user.id]
+            self.assertEqual(len(deletable), 1)
+            self.assertFalse(set(deletable) & set(chats))
+
+    def test_every_endpoint_answers(self):
+        rng = random.Random(0)
+        user_id = self.users[0].id
+        for endpoint in bench.ENDPOINTS:
+            with self.subTest(endpoint=endpoint):
+                request = bench._request_for(endpoint, user_id, self.workload, rng)
+                result = bench._issue(self.workload.clients[user_id], *request)
+                self.assertEqual(result.status, 200)
+                self.assertGreater(result.queries, 0)
+        # The one deletable chat is gone now
+        self.assertIsNone(bench._request_for('delete_chat', user_id, self.workload, rng))
+
+    def test_memory_pass(self):
+        result = bench.measure_memory('list_chats', self.workload, requests=2)
+
+        self.assertEqual(set(result), {'peak_kib_mean', 'peak_kib_max', 'retained_kib_mean'})
+        self.assertGreater(result['peak_kib_max'], 0)
+
+    def test_cleanup_removes_only_seeded_users(self):
+        seed.cleanup(prefix='test')
+
+        self.assertFalse(Chat.objects.filter(user__in=self.users).exists())
+        self.assertEqual(list(get_user_model().objects.values_list('email', flat=True)), [self.user.email])
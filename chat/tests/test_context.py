@@ -0,0 +1,96 @@
+from datetime import datetime, timezone
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from chat import context
+from chat.models import Chat, Message
+from chat.tokens import MESSAGE_OVERHEAD, estimate_message_tokens, estimate_tokens
+
+
+class TokenEstimateTests(SimpleTestCase):
+    def test_short_words_are_one_token(self):
+        self.assertEqual(estimate_tokens(''), 0)
+        self.assertEqual(estimate_tokens('the cat sat'), 3)
+        # Longer words split about every four characters
+        self.assertEqual(estimate_tokens('tokenization'), 3)
+
+    def test_underscores_are_counted(self):
+        self.assertEqual(estimate_tokens('snake_case_name'), estimate_tokens('snake case name') + 2)
+        self.assertGreater(estimate_tokens('____'), 0)
+
+    def test_non_latin_text_is_about_a_token_per_character(self):
+        self.assertEqual(estimate_tokens('日本語'), 3)
+
+    def test_message_overhead(self):
+        self.assertEqual(estimate_message_tokens('hi'), 1 + MESSAGE_OVERHEAD)
+
+
+class ContextLimitTests(SimpleTestCase):
+    def test_known_and_dated_models(self):
+        self.assertEqual(context.context_limit('gpt-5'), 400_000)
+        self.assertEqual(context.context_limit('gpt-4o-2024-08-06'), 128_000)
+        self.assertEqual(context.context_limit('gpt-4-0613'), 8_192)
+        self.assertEqual(context.context_limit('mystery'), context.DEFAULT_CONTEXT_LIMIT)
+
+    @override_settings(CHAT_CONTEXT_MAX_TOKENS=8000, CHAT_REPLY_RESERVE_TOKENS=1000)
+    def test_history_budget(self):
+        self.assertEqual(context.history_budget('gpt-4o', reserved_tokens=100), 8000 - 100 - 3)
+        # The model's own window is smaller than the configured cap
+        self.assertEqual(context.history_budget('gpt-4'), 8192 - 1000 - 3)
+
+
+class BuildContextTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email='ada@example.com', password='secret')
+
+    def setUp(self):
+        self.chat = Chat.objects.create(user=self.user, title='t')
+
+    def add(self, *contents):
+        return [Message.objects.create(chat=self.chat, role='user', content=c) for c in contents]
+
+    @override_settings(CHAT_CONTEXT_MAX_TOKENS=1000, CHAT_REPLY_RESERVE_TOKENS=0)
+    def test_keeps_the_newest_messages_that_fit(self):
+        self.add('old ' * 1200, 'middle message', 'newest message')
+
+        picked = context.build_context(self.chat, 'gpt-4o')
+
+        self.assertEqual([m['content'] for m in picked], ['middle message', 'newest message'])
+
+    @override_settings(CHAT_CONTEXT_MAX_TOKENS=50, CHAT_REPLY_RESERVE_TOKENS=0)
+    def test_truncates_an_oversized_newest_message(self):
+        self.add('word ' * 500)
+
+        picked = context.build_context(self.chat, 'gpt-4o')
+
+        self.assertEqual(len(picked), 1)
+        self.assertLessEqual(estimate_message_tokens(picked[0]['content']), context.history_budget('gpt-4o'))
+        self.assertTrue(picked[0]['content'].startswith('word word'))
+
+    def test_skips_summarized_messages(self):
+        first, second = self.add('already summarized', 'still verbatim')
+        Chat.objects.filter(id=self.chat.id).update(summarized_through_id=first.id)
+        self.chat.refresh_from_db()
+
+        picked = context.build_context(self.chat, 'gpt-4o')
+
+        self.assertEqual([m['content'] for m in picked], ['still verbatim'])
+
+    def test_pages_through_long_histories_in_order(self):
+        count = context._FETCH_BATCH * 2 + 7
+        Message.objects.bulk_create([Message(chat=self.chat, role='user', content=f'm{n}') for n in range(count)])
+        # Equal timestamps, so batches are only kept apart by the id tie-breaker
+        Message.objects.filter(chat=self.chat).update(created_at=datetime(2024, 1, 1, tzinfo=timezone.utc))
+
+        picked = context.build_context(self.chat, 'gpt-4o')
+
+        self.assertEqual([m['content'] for m in picked], [f'm{n}' for n in range(count)])
+
+    def test_fills_in_missing_token_counts(self):
+        Message.objects.bulk_create([Message(chat=self.chat, role='user', content='counted later')])
+
+        context.build_context(self.chat, 'gpt-4o')
+
+        self.assertEqual(Message.objects.get(chat=self.chat).token_count, estimate_tokens('counted later'))
@@ -0,0 +1,102 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+
+from chat import jobs, llm_cache, memory, tasks
+from chat.models import BackgroundJob, UserMemory
+
+from .base import ChatTestCase
+
+
+class BatchedExtractionTests(ChatTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = get_user_model().objects.create_user(email='grace@example.com', password='secret')
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(llm_cache, '_backend', llm_cache.LocMemBackend(60, 100))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def facts(self, user):
+        return UserMemory.objects.get(user=user).memory_data
+
+    def test_one_call_for_several_users(self):
+        tasks.extract_memory([
+            {'user_id': self.user.id, 'message': 'My name is Ada'},
+            {'user_id': self.other.id, 'message': 'I live in Paris'},
+        ])
+
+        self.assertEqual(self.upstream_calls(), 1)
+        self.assertEqual(self.facts(self.user), {'name': 'Ada'})
+        self.assertEqual(self.facts(self.other), {'location': 'Paris'})
+
+    def test_updates_existing_memory_and_invalidates_it(self):
+        UserMemory.objects.create(user=self.user, memory_data={'location': 'Rome'})
+        memory.get_snapshot(self.user.id)
+
+        tasks.extract_memory([{'user_id': self.user.id, 'message': 'My name is Ada'}])
+
+        self.assertEqual(self.facts(self.user), {'location': 'Rome', 'name': 'Ada'})
+        self.assertEqual(memory.get_snapshot(self.user.id).data, {'location': 'Rome', 'name': 'Ada'})
+
+    def test_later_messages_win(self):
+        tasks.extract_memory([
+            {'user_id': self.user.id, 'message': 'I live in Paris'},
+            {'user_id': self.user.id, 'message': 'Actually I live in Lisbon'},
+        ])
+
+        self.assertEqual(self.facts(self.user), {'location': 'Lisbon'})
+
+    def test_messages_are_cached_one_by_one(self):
+        tasks.extract_memory([{'user_id': self.user.id, 'message': 'My name is Ada'}])
+
+        # Batched with something new, the known message is still a cache hit
+        tasks.extract_memory([
+            {'user_id': self.other.id, 'message': 'My name is Ada'},
+            {'user_id': self.other.id, 'message': 'I live in Oslo'},
+        ])
+
+        self.assertEqual(self.upstream_calls(), 2)
+        self.assertEqual(self.facts(self.other), {'name': 'Ada', 'location': 'Oslo'})
+
+    def test_unknown_users_are_skipped(self):
+        tasks.extract_memory([{'user_id': 999999, 'message': 'My name is Nobody'}])
+
+        self.assertFalse(UserMemory.objects.exists())
+
+    @mock.patch('chat.jobs.threading.Timer')
+    def test_pending_jobs_run_as_one_batch(self, timer):
+        for text in ('My name is Ada', 'I live in Paris', 'I am 36 years old'):
+            jobs.enqueue('extract_memory', user_id=self.user.id, message=text)
+
+        self.assertEqual(jobs.run_batch('extract_memory'), 3)
+
+        self.assertEqual(self.upstream_calls(), 1)
+        self.assertEqual(self.facts(self.user), {'name': 'Ada', 'location': 'Paris', 'age': '36'})
+        self.assertFalse(BackgroundJob.objects.exclude(status='done').exists())
+
+
+class BatchWindowTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.batch = jobs._BatchKind(handler=lambda payloads: None, size=3, window=2.0)
+        patcher = mock.patch.dict(jobs.BATCH_HANDLERS, {'test_batch': self.batch})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch('chat.jobs._get_executor')
+    @mock.patch('chat.jobs.threading.Timer')
+    def test_first_job_arms_the_window_and_a_full_batch_flushes(self, timer, executor):
+        jobs._note_batch_job('test_batch')
+        timer.assert_called_once_with(2.0, jobs._flush_batch_window, args=['test_batch'])
+        executor.return_value.submit.assert_not_called()
+
+        jobs._note_batch_job('test_batch')
+        jobs._note_batch_job('test_batch')
+
+        executor.return_value.submit.assert_called_once_with(jobs.run_batch, 'test_batch')
+        timer.return_value.cancel.assert_called_once()
+        self.assertEqual(self.batch.queued, 0)
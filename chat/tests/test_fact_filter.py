@@ -0,0 +1,59 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.urls import reverse
+
+from chat import fact_filter, metrics
+from chat.models import BackgroundJob
+
+from .base import ChatTestCase
+
+
+class FactFilterTests(SimpleTestCase):
+    def assertDecision(self, text, extract, outcome):
+        with mock.patch.object(metrics.FACT_FILTER_DECISIONS, 'inc') as inc:
+            self.assertIs(fact_filter.should_extract(text), extract, text)
+        inc.assert_called_once_with(outcome=outcome)
+
+    def test_acknowledgements_are_skipped_by_rule(self):
+        for text in ('ok', 'Thanks!', 'got it.', 'hmm'):
+            self.assertDecision(text, False, 'skip_rule')
+
+    def test_explicit_statements_are_extracted(self):
+        for text in ('My name is Ada', "I'm Paul, nice to meet you", 'Call me Grace', "I'm 34 years old"):
+            self.assertDecision(text, True, 'extract')
+
+    def test_messages_without_first_person_are_skipped(self):
+        self.assertDecision('What is the capital of France?', False, 'skip_rule')
+
+    def test_the_model_scores_the_rest(self):
+        self.assertDecision('I love hiking in the mountains', True, 'extract')
+        self.assertDecision('Can you help me write an email?', False, 'skip_model')
+
+    def test_code_and_questions_score_lower(self):
+        statement = 'I keep my notes in a file'
+        self.assertLess(fact_filter.score(statement + '?'), fact_filter.score(statement))
+        self.assertLess(fact_filter.score(f'```\n{statement}\n```'), fact_filter.score(statement))
+
+    def test_decisions_are_counted(self):
+        before = fact_filter.stats()
+
+        fact_filter.should_extract('ok')
+        fact_filter.should_extract('My name is Ada')
+
+        after = fact_filter.stats()
+        self.assertEqual(after['checked'] - before.get('checked', 0), 2)
+        self.assertEqual(after['skip_rule'] - before.get('skip_rule', 0), 1)
+        self.assertEqual(after['extract'] - before.get('extract', 0), 1)
+
+
+class SendMessageFilterTests(ChatTestCase):
+    def test_small_talk_queues_no_extraction(self):
+        self.client.post(reverse('chat:send_message'), {'message': 'thanks'})
+
+        self.assertFalse(BackgroundJob.objects.filter(kind='extract_memory').exists())
+
+    def test_personal_facts_queue_extraction(self):
+        self.client.post(reverse('chat:send_message'), {'message': 'My name is Ada'})
+
+        self.assertTrue(BackgroundJob.objects.filter(kind='extract_memory', payload__message='My name is Ada').exists())
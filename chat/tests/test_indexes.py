@@ -0,0 +1,33 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from chat.models import Chat, Message
+
+
+class HotQueryIndexTests(TestCase):
+    def index_columns(self, table):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+        return {name: c['columns'] for name, c in constraints.items() if c['index']}
+
+    def test_indexes_exist(self):
+        self.assertEqual(self.index_columns('chat_chat')['chat_user_pinned_updated_idx'],
+                         ['user_id', 'pinned', 'updated_at'])
+        messages = self.index_columns('chat_message')
+        self.assertEqual(messages['message_chat_created_idx'], ['chat_id', 'created_at'])
+        self.assertEqual(messages['message_chat_role_created_idx'], ['chat_id', 'role', 'created_at'])
+
+    @skipUnless(connection.vendor == 'sqlite', 'plans are checked on SQLite')
+    def test_chat_list_uses_its_index(self):
+        plan = Chat.objects.filter(user_id=1).order_by('-pinned', '-updated_at', '-id').explain()
+
+        self.assertIn('chat_user_pinned_updated_idx', plan)
+
+    @skipUnless(connection.vendor == 'sqlite', 'plans are checked on SQLite')
+    def test_latest_reply_lookup_uses_its_index(self):
+        plan = Message.objects.filter(chat_id=1, role='assistant').order_by('-created_at').explain()
+
+        self.assertIn('message_chat_role_created_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
@@ -0,0 +1,138 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from chat import jobs
+from chat.models import BackgroundJob, Chat
+
+from .base import ChatTestCase
+
+
+def _fail(**payload):
+    raise RuntimeError('boom')
+
+
+@mock.patch('chat.jobs.threading.Timer')
+class JobQueueTests(ChatTestCase):
+    def test_send_message_defers_title_and_memory_work(self, timer):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('chat:send_message'), {'message': 'My name is Ada and I live in Paris'})
+
+        self.assertEqual(response.status_code, 200)
+        # Only the reply itself was generated during the request
+        self.assertEqual(self.upstream_calls(), 1)
+        self.assertEqual(
+            sorted(BackgroundJob.objects.values_list('kind', flat=True)), ['extract_memory', 'generate_title'],
+        )
+        self.assertEqual(len(callbacks), 2)
+
+    def test_generate_title_replaces_the_placeholder(self, timer):
+        chat = Chat.objects.create(user=self.user, title='favourite colours', model='gpt-4o-mini')
+        job = jobs.enqueue('generate_title', chat_id=chat.id, text='favourite colours', placeholder='favourite colours')
+
+        self.assertTrue(jobs.run_job(job.id))
+
+        chat.refresh_from_db()
+        self.assertEqual(chat.title, 'Favourite Colours')
+        self.assertEqual(BackgroundJob.objects.get(id=job.id).status, 'done')
+
+    def test_generate_title_keeps_a_title_the_user_set(self, timer):
+        chat = Chat.objects.create(user=self.user, title='Renamed', model='gpt-4o-mini')
+        job = jobs.enqueue('generate_title', chat_id=chat.id, text='favourite colours', placeholder='favourite colours')
+
+        jobs.run_job(job.id)
+
+        chat.refresh_from_db()
+        self.assertEqual(chat.title, 'Renamed')
+
+    def test_a_job_runs_once(self, timer):
+        chat = Chat.objects.create(user=self.user, title='x', model='gpt-4o-mini')
+        job = jobs.enqueue('generate_title', chat_id=chat.id, text='x', placeholder='x')
+
+        self.assertTrue(jobs.run_job(job.id))
+        self.assertFalse(jobs.run_job(job.id))
+
+    @override_settings(CHAT_JOB_RETRY_DELAY=5)
+    def test_retry_delay_doubles(self, timer):
+        self.assertEqual([jobs.retry_delay(n) for n in (1, 2, 3)], [5, 10, 20])
+
+    @override_settings(CHAT_JOB_RETRY_DELAY=5)
+    def test_failed_job_is_retried_after_a_delay(self, timer):
+        with mock.patch.dict(jobs.HANDLERS, {'test_fail': _fail}):
+            job = jobs.enqueue('test_fail')
+            before = timezone.now()
+            jobs.run_job(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'pending')
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('boom', job.last_error)
+        self.assertGreaterEqual(job.run_after, before + timedelta(seconds=5))
+        self.assertEqual(timer.call_args.args[0], 5)
+        timer.return_value.start.assert_called_once()
+        # Not due yet, so a sweep leaves it alone
+        self.assertEqual(jobs.run_pending(), 0)
+
+    def test_job_fails_for_good_after_max_attempts(self, timer):
+        with mock.patch.dict(jobs.HANDLERS, {'test_fail': _fail}):
+            job = jobs.enqueue('test_fail')
+            BackgroundJob.objects.filter(id=job.id).update(attempts=jobs.MAX_ATTEMPTS - 1)
+            jobs.run_job(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, jobs.MAX_ATTEMPTS)
+        timer.assert_not_called()
+
+    def test_unknown_kind_is_not_retried(self, timer):
+        job = jobs.enqueue('no_such_kind')
+
+        jobs.run_job(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('No handler registered', job.last_error)
+
+    def test_run_pending_runs_due_jobs_oldest_first(self, timer):
+        ran = []
+        with mock.patch.dict(jobs.HANDLERS, {'test_record': lambda n: ran.append(n)}):
+            for n in range(3):
+                jobs.enqueue('test_record', n=n)
+            later = jobs.enqueue('test_record', n=99)
+            BackgroundJob.objects.filter(id=later.id).update(run_after=timezone.now() + timedelta(hours=1))
+
+            self.assertEqual(jobs.run_pending(), 3)
+
+        self.assertEqual(ran, [0, 1, 2])
+
+    @override_settings(CHAT_JOB_LEASE=60)
+    def test_jobs_of_dead_workers_are_reclaimed(self, timer):
+        ran = []
+        with mock.patch.dict(jobs.HANDLERS, {'test_record': lambda n: ran.append(n)}):
+            lost, busy, doomed = (jobs.enqueue('test_record', n=n) for n in range(3))
+            claimed_at = {lost.id: timezone.now() - timedelta(minutes=5), busy.id: timezone.now(),
+                          doomed.id: timezone.now() - timedelta(minutes=5)}
+            for job_id, updated_at in claimed_at.items():
+                BackgroundJob.objects.filter(id=job_id).update(
+                    status='running', attempts=jobs.MAX_ATTEMPTS if job_id == doomed.id else 1, updated_at=updated_at,
+                )
+
+            self.assertEqual(jobs.run_pending(), 1)
+
+        self.assertEqual(ran, [0])
+        statuses = dict(BackgroundJob.objects.values_list('id', 'status'))
+        self.assertEqual(statuses, {lost.id: 'done', busy.id: 'running', doomed.id: 'failed'})
+        self.assertEqual(BackgroundJob.objects.get(id=lost.id).attempts, 2)
+        self.assertIn('Worker lost', BackgroundJob.objects.get(id=doomed.id).last_error)
+
+    def test_requeue_stale_takes_a_custom_age(self, timer):
+        job = jobs.enqueue('test_record', n=0)
+        claimed_at = timezone.now() - timedelta(minutes=5)
+        BackgroundJob.objects.filter(id=job.id).update(status='running', updated_at=claimed_at)
+
+        self.assertEqual(jobs.requeue_stale(older_than=600), 0)
+        self.assertEqual(jobs.requeue_stale(older_than=60), 1)
+        self.assertEqual(BackgroundJob.objects.get(id=job.id).status, 'pending')
@@ -0,0 +1,50 @@
+from unittest import mock
+
+from django.conf import settings
+from django.test import override_settings
+from django.urls import reverse
+
+from chat import llm
+
+from .base import ChatTestCase
+
+PAYLOAD = {'model': 'gpt-4o-mini', 'messages': [{'role': 'user', 'content': 'Hello'}]}
+
+
+class PooledClientTests(ChatTestCase):
+    def test_session_is_shared(self):
+        self.assertIs(llm.get_session(), llm.get_session())
+
+    def test_new_process_gets_its_own_session(self):
+        parent = llm.get_session()
+        with mock.patch('chat.llm.os.getpid', return_value=-1):
+            child = llm.get_session()
+            # The parent's session is dropped, not shared with the child
+            self.assertEqual(llm._sessions, {-1: child})
+        self.assertIsNot(child, parent)
+
+    def test_calls_reuse_one_connection(self):
+        replies = [llm.chat_completion({**PAYLOAD, 'messages': [{'role': 'user', 'content': f'Hi {n}'}]})
+                   for n in range(3)]
+
+        self.assertTrue(all(replies))
+        pools = llm.get_session().get_adapter(settings.OPENAI_API_URL).poolmanager.pools
+        self.assertEqual(sum(pools[key].num_connections for key in pools.keys()), 1)
+        self.assertEqual(self.upstream_calls(), 3)
+
+    def test_stream_yields_the_reply_in_pieces(self):
+        deltas = list(llm.stream_chat_completion(PAYLOAD))
+
+        self.assertGreater(len(deltas), 1)
+        self.assertTrue(''.join(deltas).endswith('.'))
+
+    async def test_async_client_is_shared_per_loop(self):
+        self.assertIs(llm.get_async_client(), llm.get_async_client())
+        self.assertTrue(await llm.achat_completion(PAYLOAD))
+
+    @override_settings(OPENAI_API_KEY='')
+    def test_send_without_a_key_is_rejected(self):
+        response = self.client.post(reverse('chat:send_message'), {'message': 'Hello'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.upstream_calls(), 0)
@@ -0,0 +1,177 @@
+import os
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from chat import llm_cache, tasks
+from chat.models import LLMCacheEntry
+
+from .base import ChatTestCase
+
+
+def _messages(text):
+    return [{'role': 'user', 'content': text}]
+
+
+class MakeKeyTests(SimpleTestCase):
+    def test_whitespace_is_normalized(self):
+        self.assertEqual(
+            llm_cache.make_key('gpt-4o', _messages('Hello  there\n')),
+            llm_cache.make_key('gpt-4o', _messages('Hello there')),
+        )
+
+    def test_case_is_kept(self):
+        # Extraction reads names and acronyms, so these must not share cached facts
+        self.assertNotEqual(tasks._extraction_cache_key('I work at IBM'), tasks._extraction_cache_key('i work at ibm'))
+
+    def test_different_wording_model_or_params_miss(self):
+        key = llm_cache.make_key('gpt-4o', _messages('hello there'), temperature=0)
+        self.assertNotEqual(key, llm_cache.make_key('gpt-4o', _messages('hello here'), temperature=0))
+        self.assertNotEqual(key, llm_cache.make_key('gpt-4o-mini', _messages('hello there'), temperature=0))
+        self.assertNotEqual(key, llm_cache.make_key('gpt-4o', _messages('hello there'), temperature=1))
+
+    def test_unkeyed_params_are_ignored(self):
+        payload = {'model': 'gpt-4o', 'messages': _messages('hi'), 'temperature': 0}
+        self.assertEqual(llm_cache.payload_key(payload), llm_cache.payload_key({**payload, 'stream': False, 'n': 1}))
+
+
+class LocMemBackendTests(SimpleTestCase):
+    def test_entries_expire(self):
+        backend = llm_cache.LocMemBackend(ttl=0.05, max_entries=10)
+        backend.set('k', 'v')
+        self.assertEqual(backend.get('k'), 'v')
+
+        time.sleep(0.1)
+
+        self.assertIsNone(backend.get('k'))
+        self.assertEqual(len(backend), 0)
+
+    def test_least_recently_used_is_evicted(self):
+        backend = llm_cache.LocMemBackend(ttl=60, max_entries=2)
+        backend.set('a', '1')
+        backend.set('b', '2')
+        backend.get('a')
+
+        backend.set('c', '3')
+
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual((backend.get('a'), backend.get('c')), ('1', '3'))
+
+
+class FileBackendTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+
+    def test_round_trip_and_expiry(self):
+        backend = llm_cache.FileBackend(ttl=60, max_entries=10, directory=self.directory)
+        backend.set('k', 'välue')
+        self.assertEqual(backend.get('k'), 'välue')
+        self.assertEqual(os.listdir(self.directory), ['k.json'])
+
+        backend.ttl = -1
+        backend.set('k', 'v')
+        self.assertIsNone(backend.get('k'))
+        self.assertEqual(len(backend), 0)
+
+    def test_prune_keeps_the_most_recently_used(self):
+        backend = llm_cache.FileBackend(ttl=60, max_entries=2, directory=self.directory)
+        now = time.time()
+        for age, key in enumerate(('c', 'b', 'a')):
+            backend.set(key, key)
+            os.utime(backend._path(key), (now - age, now - age))
+
+        backend.prune()
+
+        self.assertEqual(sorted(os.listdir(self.directory)), ['b.json', 'c.json'])
+
+    def test_prune_runs_every_so_many_writes(self):
+        backend = llm_cache.FileBackend(ttl=60, max_entries=1, directory=self.directory)
+        with mock.patch.object(backend, 'PRUNE_EVERY', 3), mock.patch.object(backend, 'prune') as prune:
+            for n in range(6):
+                backend.set(str(n), 'v')
+
+        self.assertEqual(prune.call_count, 2)
+
+
+class DatabaseBackendTests(TestCase):
+    def test_round_trip_and_expiry(self):
+        backend = llm_cache.DatabaseBackend(ttl=60, max_entries=10)
+        backend.set('k', 'v')
+        self.assertEqual(backend.get('k'), 'v')
+
+        LLMCacheEntry.objects.filter(key='k').update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertIsNone(backend.get('k'))
+
+    def test_prune_drops_expired_and_least_recently_used(self):
+        backend = llm_cache.DatabaseBackend(ttl=60, max_entries=2)
+        now = timezone.now()
+        for age, key in enumerate(('c', 'b', 'a')):
+            backend.set(key, key)
+            LLMCacheEntry.objects.filter(key=key).update(last_used_at=now - timedelta(seconds=age))
+        backend.set('gone', 'v')
+        LLMCacheEntry.objects.filter(key='gone').update(expires_at=now - timedelta(seconds=1))
+
+        backend.prune()
+
+        self.assertEqual(sorted(LLMCacheEntry.objects.values_list('key', flat=True)), ['b', 'c'])
+
+
+class CachedCompletionTests(ChatTestCase):
+    payload = {'model': 'gpt-4o-mini', 'messages': _messages('Say hello'), 'temperature': 0}
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(llm_cache, '_backend', llm_cache.LocMemBackend(60, 100))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeats_are_answered_from_the_cache(self):
+        before = llm_cache.stats()
+
+        first = llm_cache.cached_chat_completion(self.payload, namespace='test')
+        second = llm_cache.cached_chat_completion(
+            {**self.payload, 'messages': _messages('Say   hello\n')}, namespace='test',
+        )
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.upstream_calls(), 1)
+        after = llm_cache.stats()
+        self.assertEqual(after['test.hits'] - before.get('test.hits', 0), 1)
+        self.assertEqual(after['test.misses'] - before.get('test.misses', 0), 1)
+
+    def test_a_broken_backend_does_not_fail_the_call(self):
+        with mock.patch.object(llm_cache._backend, 'get', side_effect=OSError), \
+                mock.patch.object(llm_cache._backend, 'set', side_effect=OSError), \
+                self.assertLogs('chat.llm_cache', 'ERROR'):
+            self.assertTrue(llm_cache.cached_chat_completion(self.payload))
+
+        self.assertEqual(self.upstream_calls(), 1)
+
+
+class GetBackendTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(llm_cache, '_backend', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(LLM_CACHE_BACKEND='')
+    def test_empty_name_disables_caching(self):
+        self.assertIsNone(llm_cache.get_backend())
+        self.assertIsNone(llm_cache.get('anything'))
+
+    @override_settings(LLM_CACHE_BACKEND='db')
+    def test_backend_is_chosen_by_setting(self):
+        self.assertIsInstance(llm_cache.get_backend(), llm_cache.DatabaseBackend)
+        self.assertIs(llm_cache.get_backend(), llm_cache.get_backend())
+
+    @override_settings(LLM_CACHE_BACKEND='redis')
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            llm_cache.get_backend()
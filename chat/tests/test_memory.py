@@ -0,0 +1,84 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from chat import memory
+from chat.models import UserMemory
+
+
+class MemorySnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email='ada@example.com', password='secret')
+
+    def setUp(self):
+        cache.clear()
+        memory._local.clear()
+
+    def test_renders_the_system_prompt(self):
+        UserMemory.objects.create(user=self.user, memory_data={'name': 'Ada', 'bot_name': 'Jarvis'})
+
+        snapshot = memory.get_snapshot(self.user.id)
+
+        self.assertEqual(snapshot.data['name'], 'Ada')
+        self.assertTrue(snapshot.system_prompt.startswith('You are Jarvis, an AI assistant.'))
+        self.assertIn('"name": "Ada"', snapshot.memory_text)
+
+    def test_no_memory_yet(self):
+        snapshot = memory.get_snapshot(self.user.id)
+
+        self.assertEqual(snapshot.data, {})
+        self.assertIn('no stored personal facts', snapshot.system_prompt)
+
+    def test_repeat_lookups_skip_the_database(self):
+        UserMemory.objects.create(user=self.user, memory_data={'name': 'Ada'})
+        first = memory.get_snapshot(self.user.id)
+
+        with self.assertNumQueries(0):
+            self.assertIs(memory.get_snapshot(self.user.id), first)
+
+    def test_shared_cache_serves_other_processes(self):
+        UserMemory.objects.create(user=self.user, memory_data={'name': 'Ada'})
+        memory.get_snapshot(self.user.id)
+        # A process with a cold local cache
+        memory._local.clear()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(memory.get_snapshot(self.user.id).data, {'name': 'Ada'})
+
+    def test_saving_or_deleting_memory_invalidates(self):
+        user_memory = UserMemory.objects.create(user=self.user, memory_data={'name': 'Ada'})
+        memory.get_snapshot(self.user.id)
+
+        user_memory.remember('city', 'Paris')
+        self.assertEqual(memory.get_snapshot(self.user.id).data, {'name': 'Ada', 'city': 'Paris'})
+
+        user_memory.delete()
+        self.assertEqual(memory.get_snapshot(self.user.id).data, {})
+
+    def test_writes_without_signals_need_an_explicit_invalidate(self):
+        UserMemory.objects.create(user=self.user, memory_data={'name': 'Ada'})
+        memory.get_snapshot(self.user.id)
+
+        UserMemory.objects.filter(user=self.user).update(memory_data={'name': 'Grace'})
+        self.assertEqual(memory.get_snapshot(self.user.id).data, {'name': 'Ada'})
+
+        memory.invalidate(self.user.id)
+        self.assertEqual(memory.get_snapshot(self.user.id).data, {'name': 'Grace'})
+
+    @override_settings(CHAT_MEMORY_LOCAL_TTL=0.05)
+    def test_local_cache_versions_expire(self):
+        UserMemory.objects.create(user=self.user, memory_data={'name': 'Ada'})
+        memory.get_snapshot(self.user.id)
+        # As if another process had written it
+        UserMemory.objects.filter(user=self.user).update(memory_data={'name': 'Grace'})
+
+        time.sleep(0.1)
+
+        self.assertEqual(memory.get_snapshot(self.user.id).data, {'name': 'Grace'})
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_shared_cache_versions_do_not_expire(self):
+        self.assertIsNone(memory._version_timeout())
@@ -0,0 +1,194 @@
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from chat import metrics
+
+# Above the kernel's pid_max, so never a live process
+DEAD_PID = 2 ** 22 + 1
+
+
+def _reset_stores():
+    with metrics._stores_lock:
+        for store in metrics._stores.values():
+            store.close()
+        metrics._stores.clear()
+        metrics._stores_pid = None
+
+
+class MetricsDirMixin:
+    """Point the metric files at a fresh directory for each test."""
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+        override = override_settings(CHAT_METRICS_DIR=self.directory)
+        override.enable()
+        self.addCleanup(override.disable)
+        _reset_stores()
+        self.addCleanup(_reset_stores)
+
+    def metric(self, cls, name, *args, **kwargs):
+        metric = cls(name, f'Test {name}.', *args, **kwargs)
+        self.addCleanup(metrics._registry.pop, name)
+        return metric
+
+    def other_process_file(self, kind, pid, samples):
+        store = metrics.MmapStore(os.path.join(self.directory, f'{kind}_{pid}.db'))
+        for key, value in samples:
+            store.add(key, value)
+        store.close()
+
+
+class MmapStoreTests(SimpleTestCase):
+    def test_entries_survive_reopening_and_growth(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'counter_1.db')
+            store = metrics.MmapStore(path)
+            keys = [f'key-{n}-' + 'x' * 500 for n in range(300)]
+            for key in keys:
+                store.add(key, 1.5)
+            store.add(keys[0], 1.0)
+            store.close()
+
+            self.assertGreater(os.path.getsize(path), metrics._INITIAL_SIZE)
+            entries = dict(metrics.read_file(path))
+            self.assertEqual(len(entries), 300)
+            self.assertEqual(entries[keys[0]], 2.5)
+
+            reopened = metrics.MmapStore(path)
+            reopened.add(keys[1], 1.0)
+            reopened.close()
+            self.assertEqual(dict(metrics.read_file(path))[keys[1]], 2.5)
+
+    def test_missing_or_truncated_files_read_as_empty(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'counter_1.db')
+            self.assertEqual(metrics.read_file(path), [])
+            with open(path, 'wb') as f:
+                f.write(b'\x01')
+            self.assertEqual(metrics.read_file(path), [])
+
+
+class RenderTests(MetricsDirMixin, SimpleTestCase):
+    def test_counters_and_gauges(self):
+        counter = self.metric(metrics.Counter, 'test_requests_total', ('view',))
+        gauge = self.metric(metrics.Gauge, 'test_in_flight')
+        counter.inc(view='home')
+        counter.inc(2, view='home')
+        counter.inc(view='say "hi"\n')
+        with gauge.track():
+            gauge.inc()
+
+        text = metrics.render()
+
+        self.assertIn('# HELP test_requests_total Test test_requests_total.\n'
+                      '# TYPE test_requests_total counter\n', text)
+        self.assertIn('test_requests_total{view="home"} 3\n', text)
+        self.assertIn('test_requests_total{view="say \\"hi\\"\\n"} 1\n', text)
+        self.assertIn('# TYPE test_in_flight gauge\ntest_in_flight 1\n', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.metric(metrics.Histogram, 'test_seconds', ('view',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, view='home')
+
+        text = metrics.render()
+
+        self.assertIn(
+            'test_seconds_bucket{view="home",le="0.1"} 1\n'
+            'test_seconds_bucket{view="home",le="1"} 2\n'
+            'test_seconds_bucket{view="home",le="+Inf"} 3\n'
+            'test_seconds_sum{view="home"} 5.55\n'
+            'test_seconds_count{view="home"} 3\n',
+            text,
+        )
+
+    def test_labels_must_match(self):
+        counter = self.metric(metrics.Counter, 'test_labelled_total', ('view',))
+
+        with self.assertRaises(ValueError):
+            counter.inc(status=200)
+
+    def test_processes_are_merged(self):
+        counter = self.metric(metrics.Counter, 'test_merged_total')
+        gauge = self.metric(metrics.Gauge, 'test_merged_gauge')
+        counter.inc()
+        gauge.inc()
+        key = counter._key('test_merged_total', ())
+        gauge_key = gauge._key('test_merged_gauge', ())
+        self.other_process_file('counter', os.getppid(), [(key, 2)])
+        self.other_process_file('gauge', os.getppid(), [(gauge_key, 4)])
+
+        text = metrics.render()
+
+        self.assertIn('test_merged_total 3\n', text)
+        self.assertIn('test_merged_gauge 5\n', text)
+
+    def test_dead_processes_are_archived_and_their_gauges_dropped(self):
+        counter = self.metric(metrics.Counter, 'test_archived_total')
+        gauge = self.metric(metrics.Gauge, 'test_archived_gauge')
+        self.other_process_file('counter', DEAD_PID, [(counter._key('test_archived_total', ()), 2)])
+        self.other_process_file('gauge', DEAD_PID, [(gauge._key('test_archived_gauge', ()), 4)])
+
+        text = metrics.render()
+
+        self.assertIn('test_archived_total 2\n', text)
+        self.assertNotIn('test_archived_gauge 4', text)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['archive.db', 'metrics.lock'])
+        # Archived counts are kept
+        self.assertIn('test_archived_total 2\n', metrics.render())
+
+    def test_a_reused_pid_starts_from_the_archive(self):
+        counter = self.metric(metrics.Counter, 'test_reused_total')
+        self.other_process_file('counter', os.getpid(), [(counter._key('test_reused_total', ()), 5)])
+
+        counter.inc()
+
+        self.assertEqual(dict(metrics.read_file(os.path.join(self.directory, f'counter_{os.getpid()}.db'))),
+                         {counter._key('test_reused_total', ()): 1})
+        self.assertIn('test_reused_total 6\n', metrics.render())
+
+
+@override_settings(CHAT_METRICS_TOKEN='')
+class MetricsViewTests(MetricsDirMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email='ada@example.com', password='secret')
+
+    def test_anonymous_requests_are_refused(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    @override_settings(DEBUG=True)
+    def test_localhost_is_allowed_in_development(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    def test_staff_are_allowed(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertIn('# TYPE chat_http_requests_total counter', response.content.decode())
+
+    @override_settings(CHAT_METRICS_TOKEN='s3cret', DEBUG=True)
+    def test_a_configured_token_is_required(self):
+        with self.assertLogs('django.request', 'WARNING'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            bad_token = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer nope'})
+        self.assertEqual(bad_token.status_code, 403)
+
+        response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer s3cret'})
+
+        self.assertEqual(response.status_code, 200)
+        # The request that scraped is counted too, by the middleware, once it has been served
+        self.assertIn('chat_http_requests_total{view="metrics",method="GET",status="403"} 2', response.content.decode())
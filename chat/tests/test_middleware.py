@@ -0,0 +1,163 @@
+import json
+import re
+import tempfile
+from unittest import mock
+
+from django.db import connection
+from django.http import FileResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+
+from chat import instrumentation, metrics
+from chat.middleware import RequestTimingMiddleware
+from chat.models import Chat
+
+from .base import ChatTestCase
+
+_ENTRY_RE = re.compile(r'^(?P<name>[\w-]+);dur=(?P<dur>[\d.]+)(?:;desc="(?P<desc>[^"]*)")?$')
+
+
+def server_timing(response):
+    """Parse a Server-Timing header into {name: (duration, description)}."""
+    entries = {}
+    for part in response['Server-Timing'].split(', '):
+        match = _ENTRY_RE.match(part)
+        entries[match['name']] = (float(match['dur']), match['desc'])
+    return entries
+
+
+class ServerTimingHeaderTests(SimpleTestCase):
+    def test_renders_each_component(self):
+        timings = instrumentation.Timings()
+        timings.add_query(0.002)
+        timings.add_query(0.003)
+        timings.add_llm('title', 0.25)
+        timings.add_llm('completion', 0.5)
+        timings.add_llm('completion', 0.1, calls=0)
+
+        header = instrumentation.server_timing(timings)
+
+        parts = header.split(', ')
+        self.assertTrue(parts[0].startswith('app;dur='))
+        self.assertEqual(parts[1:], [
+            'db;dur=5.0;desc="2 queries"',
+            'llm-completion;dur=600.0;desc="1 calls"',
+            'llm-title;dur=250.0;desc="1 calls"',
+        ])
+
+    def test_llm_calls_are_charged_to_the_current_record(self):
+        timings = instrumentation.Timings()
+        with instrumentation.activate(timings):
+            with instrumentation.llm_call('memory'):
+                pass
+        with instrumentation.llm_call('memory'):
+            pass
+
+        self.assertEqual(timings.llm_calls, {'memory': 1})
+        self.assertIsNone(instrumentation.current())
+
+
+class RequestTimingTests(ChatTestCase):
+    def test_header_counts_queries_and_upstream_calls(self):
+        response = self.client.post(reverse('chat:send_message'), {'message': 'Hello there'})
+
+        entries = server_timing(response)
+        self.assertGreaterEqual(entries['app'][0], entries['db'][0])
+        queries = int(entries['db'][1].split()[0])
+        self.assertGreater(queries, 0)
+        self.assertEqual(entries['llm-completion'][1], '1 calls')
+
+    def test_requests_without_upstream_calls_have_no_llm_entry(self):
+        response = self.client.get(reverse('chat:list_chats'))
+
+        self.assertEqual(set(server_timing(response)), {'app', 'db'})
+
+    @override_settings(CHAT_SERVER_TIMING=False)
+    def test_header_can_be_turned_off(self):
+        response = self.client.get(reverse('chat:list_chats'))
+
+        self.assertNotIn('Server-Timing', response)
+
+    def test_each_request_is_logged(self):
+        with self.assertLogs('chat.timing', 'INFO') as logs:
+            response = self.client.get(reverse('chat:list_chats'))
+
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(line['event'], 'request')
+        self.assertEqual((line['method'], line['path'], line['view']), ('GET', '/chat/list/', 'chat:list_chats'))
+        self.assertEqual(line['status'], 200)
+        self.assertEqual(line['bytes_out'], len(response.content))
+        self.assertGreater(line['db_queries'], 0)
+
+    def test_streams_are_logged_once_they_end(self):
+        with self.assertLogs('chat.timing', 'INFO') as logs:
+            response = self.client.post(reverse('chat:send_message_stream'), {'message': 'Hello there'})
+            self.assertFalse(any('"streamed": true' in r.getMessage() for r in logs.records))
+            body = b''.join(response.streaming_content)
+
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertTrue(line['streamed'])
+        self.assertEqual(line['bytes_out'], len(body))
+        self.assertEqual(line['llm_calls'], {'completion': 1})
+        self.assertIn('Server-Timing', response)
+
+    def test_requests_are_counted_by_view(self):
+        chat = Chat.objects.create(user=self.user, title='t')
+        with mock.patch.object(metrics.HTTP_REQUESTS, 'inc') as inc:
+            self.client.get(reverse('chat:get_chat', args=[chat.id]))
+            self.client.get('/no/such/page/')
+
+        self.assertEqual(inc.call_args_list, [
+            mock.call(view='chat:get_chat', method='GET', status=200),
+            mock.call(view='<unresolved>', method='GET', status=404),
+        ])
+
+
+class FileResponseTimingTests(SimpleTestCase):
+    def test_files_are_left_for_the_server_to_send(self):
+        body = tempfile.TemporaryFile()
+        self.addCleanup(body.close)
+        body.write(b'x' * 5000)
+        body.seek(0)
+        middleware = RequestTimingMiddleware(lambda request: FileResponse(body))
+
+        with self.assertLogs('chat.timing', 'INFO') as logs:
+            response = middleware(RequestFactory().get('/file/'))
+            # Nothing is recorded until the server has sent the file
+            self.assertEqual(logs.records, [])
+            self.assertIs(response.file_to_stream, body)
+            response.close()
+
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((line['bytes_out'], line['streamed']), (5000, True))
+
+
+class QueryHookTests(ChatTestCase):
+    def test_the_hook_survives_execute_wrapper_blocks(self):
+        connection.execute_wrappers.remove(instrumentation._record_query)
+        self.addCleanup(instrumentation.install_query_hook, sender=None, connection=connection)
+        counted = []
+
+        def counter(execute, *args):
+            counted.append(args[0])
+            return execute(*args)
+
+        # As when the connection is first opened inside the block, as the bench's is
+        with connection.execute_wrapper(counter):
+            instrumentation.install_query_hook(sender=None, connection=connection)
+            response = self.client.get(reverse('chat:list_chats'))
+
+        self.assertEqual(connection.execute_wrappers, [instrumentation._record_query])
+        self.assertTrue(counted)
+        self.assertEqual(server_timing(response)['db'][1], f'{len(counted)} queries')
+
+
+class AsyncRequestTimingTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.async_client.force_login(self.user)
+
+    async def test_async_views_are_timed(self):
+        response = await self.async_client.post(reverse('chat:async_send_message'), {'message': 'Hello there'})
+
+        self.assertEqual(server_timing(response)['llm-completion'][1], '1 calls')
@@ -0,0 +1,143 @@
+from datetime import datetime, timezone
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from chat import pagination
+from chat.models import Chat, Message
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        when = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+
+        token = pagination.encode_cursor(when, 42)
+
+        self.assertNotIn('=', token)
+        created_at, pk = pagination.decode_cursor(token, 2)
+        self.assertEqual(pagination.parse_datetime_value(created_at), when)
+        self.assertEqual(pk, 42)
+
+    def test_malformed_cursors_are_rejected(self):
+        for token in ('not base64!', pagination.encode_cursor(1, 2, 3), pagination.encode_cursor('x')):
+            with self.subTest(token=token), self.assertRaises(pagination.InvalidCursor):
+                pagination.decode_cursor(token, 2)
+        with self.assertRaises(pagination.InvalidCursor):
+            pagination.parse_datetime_value('yesterday')
+
+    def test_page_size_is_clamped(self):
+        self.assertEqual(pagination.page_size(None), pagination.DEFAULT_PAGE_SIZE)
+        self.assertEqual(pagination.page_size('abc'), pagination.DEFAULT_PAGE_SIZE)
+        self.assertEqual(pagination.page_size('0'), 1)
+        self.assertEqual(pagination.page_size('100000'), pagination.MAX_PAGE_SIZE)
+
+
+class ChatHistoryPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email='ada@example.com', password='secret')
+        cls.chat = Chat.objects.create(user=cls.user, title='Long chat')
+        Message.objects.bulk_create([Message(chat=cls.chat, role='user', content=f'm{n}') for n in range(7)])
+        # Identical timestamps, so only the id tie-breaker keeps pages apart
+        Message.objects.filter(chat=cls.chat).update(created_at=datetime(2024, 1, 1, tzinfo=timezone.utc))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def page(self, **params):
+        response = self.client.get(reverse('chat:get_chat', args=[self.chat.id]), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_first_page_is_the_newest_oldest_first(self):
+        data = self.page(limit=3)
+
+        self.assertEqual([m['content'] for m in data['messages']], ['m4', 'm5', 'm6'])
+        self.assertIsNotNone(data['next_before'])
+        self.assertIsNone(data['next_after'])
+
+    def test_walking_back_visits_every_message_once(self):
+        seen = []
+        data = self.page(limit=3)
+        while True:
+            seen = [m['content'] for m in data['messages']] + seen
+            if not data['next_before']:
+                break
+            data = self.page(limit=3, before=data['next_before'])
+
+        self.assertEqual(seen, [f'm{n}' for n in range(7)])
+
+    def test_after_walks_forward(self):
+        oldest = self.page(limit=3)
+        while oldest['next_before']:
+            oldest = self.page(limit=3, before=oldest['next_before'])
+
+        data = self.page(limit=3, after=oldest['next_after'])
+
+        self.assertEqual([m['content'] for m in data['messages']], ['m1', 'm2', 'm3'])
+        self.assertIsNotNone(data['next_before'])
+
+    def test_bad_cursor_is_a_400(self):
+        response = self.client.get(reverse('chat:get_chat', args=[self.chat.id]), {'before': 'garbage'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_other_users_chat_is_not_found(self):
+        other = get_user_model().objects.create_user(email='bob@example.com', password='secret')
+        self.client.force_login(other)
+
+        response = self.client.get(reverse('chat:get_chat', args=[self.chat.id]))
+
+        self.assertEqual(response.status_code, 404)
+
+
+class ChatListPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email='ada@example.com', password='secret')
+        titles = ['Python tips', 'Trip to Rome', 'python packaging', 'Groceries', 'Pinned notes']
+        for title in titles:
+            Chat.objects.create(user=cls.user, title=title)
+        Chat.objects.filter(title='Pinned notes').update(pinned=True)
+        # All updated at once, so the order below the pinned chat comes down to the id
+        Chat.objects.exclude(title='Pinned notes').update(updated_at=datetime(2024, 1, 1, tzinfo=timezone.utc))
+        other = get_user_model().objects.create_user(email='bob@example.com', password='secret')
+        Chat.objects.create(user=other, title='Python for Bob')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def page(self, **params):
+        response = self.client.get(reverse('chat:list_chats'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_cover_every_chat_pinned_first(self):
+        titles = []
+        data = self.page(limit=2)
+        while True:
+            titles += [c['title'] for c in data['chats']]
+            if not data['next_cursor']:
+                break
+            data = self.page(limit=2, cursor=data['next_cursor'])
+
+        self.assertEqual(titles, ['Pinned notes', 'Groceries', 'python packaging', 'Trip to Rome', 'Python tips'])
+
+    def test_search_filters_by_title_in_the_database(self):
+        data = self.page(q='python')
+
+        self.assertEqual([c['title'] for c in data['chats']], ['python packaging', 'Python tips'])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_search_pages_too(self):
+        first = self.page(q='python', limit=1)
+        second = self.page(q='python', limit=1, cursor=first['next_cursor'])
+
+        self.assertEqual([c['title'] for c in first['chats'] + second['chats']], ['python packaging', 'Python tips'])
+        self.assertIsNone(second['next_cursor'])
+
+    def test_bad_cursor_is_a_400(self):
+        response = self.client.get(reverse('chat:list_chats'), {'cursor': pagination.encode_cursor(1, 2)})
+
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,210 @@
+import asyncio
+import time
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from chat import resilience
+
+from .base import ChatTestCase, stub_config
+
+
+def http_error(status, retry_after=None):
+    response = requests.Response()
+    response.status_code = status
+    if retry_after is not None:
+        response.headers['Retry-After'] = retry_after
+    return requests.HTTPError(f'{status} error', response=response)
+
+
+class Flaky:
+    """A call that raises each of ``errors`` in turn, then returns 'ok'."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+@override_settings(LLM_MAX_RETRIES=2, LLM_BACKOFF_BASE=0.01, LLM_BACKOFF_MAX=0.05, LLM_RETRY_AFTER_MAX=20,
+                   LLM_BREAKER_THRESHOLD=3, LLM_BREAKER_COOLDOWN=30)
+class CallTests(SimpleTestCase):
+    def setUp(self):
+        resilience._breakers.clear()
+
+    def test_transient_failures_are_retried(self):
+        func = Flaky(http_error(503), requests.ConnectionError())
+
+        self.assertEqual(resilience.call('m', func), 'ok')
+        self.assertEqual(func.calls, 3)
+        self.assertEqual(resilience.breaker_for('m').state, 'closed')
+
+    def test_gives_up_after_the_last_retry(self):
+        func = Flaky(*[http_error(502)] * 3)
+
+        with self.assertRaises(resilience.UpstreamUnavailable):
+            resilience.call('m', func)
+        self.assertEqual(func.calls, 3)
+
+    def test_client_errors_are_not_retried(self):
+        func = Flaky(http_error(400))
+
+        with self.assertRaises(requests.HTTPError):
+            resilience.call('m', func)
+        self.assertEqual(func.calls, 1)
+        self.assertEqual(resilience.breaker_for('m').failures, 0)
+
+    def test_read_timeouts_are_not_retried(self):
+        func = Flaky(requests.ReadTimeout())
+
+        with self.assertRaises(resilience.UpstreamUnavailable):
+            resilience.call('m', func)
+        self.assertEqual(func.calls, 1)
+
+    @mock.patch('chat.resilience.time.sleep')
+    def test_retry_after_sets_the_minimum_wait(self, sleep):
+        resilience.call('m', Flaky(http_error(429, retry_after='2')))
+
+        sleep.assert_called_once_with(2.0)
+
+    def test_a_long_retry_after_gives_up_at_once(self):
+        func = Flaky(http_error(503, retry_after='60'))
+
+        with self.assertRaises(resilience.UpstreamUnavailable) as cm:
+            resilience.call('m', func)
+        self.assertEqual(func.calls, 1)
+        self.assertEqual(cm.exception.retry_after, 60)
+
+    def test_retry_after_dates_are_understood(self):
+        error = http_error(503, retry_after='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertGreater(resilience.retry_after(error), 3600)
+        self.assertIsNone(resilience.retry_after(http_error(503, retry_after='soon')))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_consecutive_failures(self):
+        breaker = resilience.CircuitBreaker('m', threshold=2, cooldown=30)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'closed')
+
+        breaker.record_failure()
+
+        self.assertEqual(breaker.state, 'open')
+        with self.assertRaises(resilience.UpstreamUnavailable) as cm:
+            breaker.before_call()
+        self.assertGreater(cm.exception.retry_after, 29)
+
+    def test_half_open_lets_one_probe_through(self):
+        breaker = resilience.CircuitBreaker('m', threshold=1, cooldown=0.05)
+        breaker.record_failure()
+        time.sleep(0.1)
+        self.assertEqual(breaker.state, 'half-open')
+
+        breaker.before_call()
+        with self.assertRaises(resilience.UpstreamUnavailable):
+            breaker.before_call()
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+        breaker.before_call()
+
+    def test_a_failed_probe_reopens(self):
+        breaker = resilience.CircuitBreaker('m', threshold=5, cooldown=0.05)
+        for _ in range(5):
+            breaker.record_failure()
+        time.sleep(0.1)
+
+        breaker.before_call()
+        breaker.record_failure()
+
+        self.assertEqual(breaker.state, 'open')
+
+    @override_settings(LLM_MAX_RETRIES=0, LLM_BREAKER_THRESHOLD=2, LLM_BREAKER_COOLDOWN=30)
+    def test_an_open_breaker_fails_fast(self):
+        resilience._breakers.clear()
+        for _ in range(2):
+            with self.assertRaises(resilience.UpstreamUnavailable):
+                resilience.call('m', Flaky(http_error(500)))
+        func = Flaky()
+
+        with self.assertRaises(resilience.UpstreamUnavailable):
+            resilience.call('m', func)
+        self.assertEqual(func.calls, 0)
+        # Breakers are per model
+        self.assertEqual(resilience.call('other', func), 'ok')
+
+
+class HedgeTests(SimpleTestCase):
+    @override_settings(LLM_HEDGE_AFTER=0.05)
+    def test_a_slow_call_is_hedged(self):
+        delays = [1.0, 0.0]
+
+        def func():
+            delay = delays.pop(0)
+            time.sleep(delay)
+            return delay
+
+        started = time.monotonic()
+        self.assertEqual(resilience.hedged(func), 0.0)
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    @override_settings(LLM_HEDGE_AFTER=0.5)
+    def test_a_fast_call_is_not_hedged(self):
+        func = Flaky()
+
+        self.assertEqual(resilience.hedged(func), 'ok')
+        self.assertEqual(func.calls, 1)
+
+    @override_settings(LLM_HEDGE_AFTER=0.01)
+    def test_fails_only_when_both_copies_fail(self):
+        def func():
+            time.sleep(0.05)
+            raise requests.ConnectionError('down')
+
+        with self.assertRaises(requests.ConnectionError):
+            resilience.hedged(func)
+
+    @override_settings(LLM_HEDGE_AFTER=0.05)
+    def test_async_hedge_returns_the_faster_copy(self):
+        delays = [1.0, 0.0]
+
+        async def func():
+            delay = delays.pop(0)
+            await asyncio.sleep(delay)
+            return delay
+
+        self.assertEqual(asyncio.run(resilience.ahedged(func)), 0.0)
+
+
+@override_settings(LLM_BREAKER_THRESHOLD=5)
+class UpstreamFailureViewTests(ChatTestCase):
+    stub = stub_config(error_rate=1.0, error_statuses=(500,))
+
+    def send(self):
+        return self.client.post(reverse('chat:send_message'), {'message': 'Anyone there?'})
+
+    def test_failures_are_retried_then_reported_as_503(self):
+        response = self.send()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertNotIn('Retry-After', response)
+        self.assertEqual(self.upstream_calls(), 3)
+
+    def test_the_breaker_opens_and_stops_calling_upstream(self):
+        self.send()
+        response = self.send()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(self.upstream_calls(), 5)
+
+        self.assertEqual(self.send().status_code, 503)
+        self.assertEqual(self.upstream_calls(), 5)
@@ -0,0 +1,123 @@
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from chat import search
+from chat.models import Chat, Message
+
+
+class MessageSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email='ada@example.com', password='secret')
+        cls.chat = Chat.objects.create(user=cls.user, title='Learning')
+        cls.other = get_user_model().objects.create_user(email='bob@example.com', password='secret')
+        other_chat = Chat.objects.create(user=cls.other, title='Bob')
+        Message.objects.create(chat=other_chat, role='user', content='Python decorators for Bob')
+
+    def search(self, query, **kwargs):
+        return search.search_messages(self.user.id, query, limit=kwargs.pop('limit', 20), **kwargs)
+
+    def ids(self, query):
+        return [r['message_id'] for r in self.search(query)[0]]
+
+    def test_finds_only_the_users_messages(self):
+        mine = Message.objects.create(chat=self.chat, role='user', content='How do Python decorators work?')
+
+        results, has_more = self.search('python decorators')
+
+        self.assertEqual([r['message_id'] for r in results], [mine.id])
+        self.assertFalse(has_more)
+        self.assertEqual(results[0]['chat_title'], 'Learning')
+
+    def test_last_term_matches_as_a_prefix(self):
+        message = Message.objects.create(chat=self.chat, role='assistant', content='Django middleware explained')
+
+        self.assertEqual(self.ids('djan'), [message.id])
+        self.assertEqual(self.ids('middle djan'), [])
+
+    def test_results_have_aware_timestamps_and_escaped_snippets(self):
+        Message.objects.create(chat=self.chat, role='user', content='Is <b>python</b> fast?')
+
+        result = self.search('python')[0][0]
+
+        self.assertTrue(timezone.is_aware(result['created_at']))
+        self.assertIn('<mark>python</mark>', result['snippet_html'])
+        self.assertIn('&lt;b&gt;', result['snippet_html'])
+
+    def test_has_more_and_offset(self):
+        for n in range(3):
+            Message.objects.create(chat=self.chat, role='user', content=f'queue number {n}')
+
+        first, more = self.search('queue', limit=2)
+        rest, no_more = self.search('queue', limit=2, offset=2)
+
+        self.assertEqual(len(first), 2)
+        self.assertTrue(more)
+        self.assertEqual(len(rest), 1)
+        self.assertFalse(no_more)
+
+    def test_queries_without_terms_match_nothing(self):
+        Message.objects.create(chat=self.chat, role='user', content='anything at all')
+
+        self.assertEqual(self.search('  '), ([], False))
+        self.assertEqual(self.search('"*"'), ([], False))
+
+    def test_search_view(self):
+        message = Message.objects.create(chat=self.chat, role='user', content='Kubernetes pods')
+        self.client.force_login(self.user)
+
+        data = self.client.get(reverse('chat:search_messages'), {'q': 'kubernetes'}).json()
+
+        self.assertEqual([r['message_id'] for r in data['results']], [message.id])
+        self.assertEqual(data['page'], 1)
+
+    def test_other_backends_fall_back_to_a_scan(self):
+        message = Message.objects.create(chat=self.chat, role='user', content='A long note about gardening')
+
+        with mock.patch.object(connection, 'vendor', 'other'):
+            results, _ = self.search('gardening')
+
+        self.assertEqual([r['message_id'] for r in results], [message.id])
+        self.assertIn('<mark>gardening</mark>', results[0]['snippet_html'])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'the FTS5 index and its triggers are SQLite only')
+class SearchIndexSyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email='ada@example.com', password='secret')
+        cls.chat = Chat.objects.create(user=cls.user, title='Notes')
+
+    def ids(self, query):
+        return [r['message_id'] for r in search.search_messages(self.user.id, query, limit=20)[0]]
+
+    def test_edits_are_reindexed(self):
+        message = Message.objects.create(chat=self.chat, role='user', content='apples')
+
+        Message.objects.filter(id=message.id).update(content='oranges')
+
+        self.assertEqual(self.ids('apples'), [])
+        self.assertEqual(self.ids('oranges'), [message.id])
+
+    def test_deleted_messages_leave_the_index(self):
+        message = Message.objects.create(chat=self.chat, role='user', content='ephemeral thought')
+
+        Message.objects.filter(id=message.id).delete()
+
+        self.assertEqual(self.ids('ephemeral'), [])
+
+    def test_bulk_created_messages_are_indexed(self):
+        Message.objects.bulk_create([Message(chat=self.chat, role='user', content=f'bulk row {n}') for n in range(3)])
+
+        self.assertEqual(len(self.ids('bulk')), 3)
+
+    def test_user_filter_is_part_of_the_match(self):
+        sql, params = search.search_sql(self.user.id, 'hello', limit=10)
+
+        self.assertIn(f'owner:u{self.user.id} AND content:("hello"*)', params)
+        self.assertIsNone(search.search_sql(self.user.id, '!!', limit=10))
@@ -0,0 +1,138 @@
+import threading
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from chat import singleflight
+from chat.models import Message
+
+from .base import ChatTestCase, ndjson
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        singleflight._flights.clear()
+
+    def test_keys_cover_user_chat_content_and_idempotency_key(self):
+        key = singleflight.turn_key(1, 5, 'hi')
+        self.assertEqual(key, singleflight.turn_key(1, '5', 'hi'))
+        self.assertEqual(singleflight.turn_key(1, None, 'hi'), singleflight.turn_key(1, '', 'hi'))
+        for other in (singleflight.turn_key(2, 5, 'hi'), singleflight.turn_key(1, 6, 'hi'),
+                      singleflight.turn_key(1, 5, 'hi!'), singleflight.turn_key(1, 5, 'hi', 'abc')):
+            self.assertNotEqual(key, other)
+
+    def test_only_one_request_leads(self):
+        self.assertTrue(singleflight.acquire('k'))
+        self.assertFalse(singleflight.acquire('k'))
+
+    def test_waiters_get_the_leaders_result(self):
+        singleflight.acquire('k')
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(singleflight.wait('k', timeout=5)))
+        waiter.start()
+
+        singleflight.complete('k', {'content': 'hello'})
+        waiter.join(5)
+
+        self.assertEqual(results, [{'content': 'hello'}])
+        # Finished, so the next identical request leads a new turn
+        self.assertTrue(singleflight.acquire('k'))
+
+    def test_waiters_fail_when_the_leader_abandons(self):
+        singleflight.acquire('k')
+        threading.Timer(0.05, singleflight.abandon, args=['k', 'upstream broke']).start()
+
+        with self.assertRaisesMessage(singleflight.FlightFailed, 'upstream broke'):
+            singleflight.wait('k', timeout=5)
+
+    def test_waiting_times_out(self):
+        singleflight.acquire('k')
+
+        with self.assertRaises(singleflight.FlightTimeout):
+            singleflight.wait('k', timeout=0.05)
+
+    def test_other_processes_poll_the_shared_cache(self):
+        singleflight.acquire('k')
+        singleflight.complete('k', {'content': 'hello'})
+
+        self.assertEqual(singleflight.wait('k', timeout=1), {'content': 'hello'})
+
+    def test_a_lost_leader_fails_pollers(self):
+        with self.assertRaisesMessage(singleflight.FlightFailed, 'did not complete'):
+            singleflight.wait('never-started', timeout=1)
+
+    def test_idempotent_results_are_replayed(self):
+        singleflight.acquire('k', idempotent=True)
+        singleflight.complete('k', {'content': 'hello'}, idempotent=True)
+
+        self.assertFalse(singleflight.acquire('k', idempotent=True))
+        self.assertEqual(singleflight.wait('k'), {'content': 'hello'})
+
+    @override_settings(CHAT_SINGLEFLIGHT_WAIT=0)
+    def test_a_stuck_leader_stops_blocking_the_key(self):
+        singleflight.acquire('k')
+
+        self.assertTrue(singleflight.acquire('k'))
+
+
+class SendMessageDeduplicationTests(ChatTestCase):
+    def send(self, text, **headers):
+        return self.client.post(reverse('chat:send_message'), {'message': text}, headers=headers).json()
+
+    def test_repeating_a_finished_turn_is_a_new_turn(self):
+        first = self.send('continue')
+        second = self.send('continue')
+
+        self.assertFalse(second['deduplicated'])
+        self.assertNotEqual(second['chat_id'], first['chat_id'])
+        self.assertEqual(self.upstream_calls(), 2)
+        self.assertEqual(Message.objects.filter(content='continue').count(), 2)
+
+    def test_idempotency_key_replays_the_finished_turn(self):
+        first = self.send('Hello there', **{'Idempotency-Key': 'abc'})
+        retry = self.send('Hello there', **{'Idempotency-Key': 'abc'})
+
+        self.assertFalse(first['deduplicated'])
+        self.assertTrue(retry['deduplicated'])
+        self.assertEqual(retry['assistant'], first['assistant'])
+        self.assertEqual(retry['chat_id'], first['chat_id'])
+        self.assertEqual(self.upstream_calls(), 1)
+        self.assertEqual(Message.objects.filter(content='Hello there').count(), 1)
+
+    def test_a_duplicate_in_flight_waits_for_the_leader(self):
+        key = singleflight.turn_key(self.user.id, None, 'Hello there')
+        singleflight.acquire(key)
+        result = {'chat_id': 1, 'created': True, 'title': 'New chat', 'title_pending': True,
+                  'model': 'gpt-4o-mini', 'message_id': 1, 'content': 'Hi!'}
+        threading.Timer(0.05, singleflight.complete, args=[key, result]).start()
+
+        response = self.send('Hello there')
+
+        self.assertTrue(response['deduplicated'])
+        self.assertEqual(response['assistant']['content'], 'Hi!')
+        self.assertEqual(self.upstream_calls(), 0)
+
+    def test_a_duplicate_of_a_failed_turn_fails(self):
+        key = singleflight.turn_key(self.user.id, None, 'Hello there')
+        singleflight.acquire(key)
+        threading.Timer(0.05, singleflight.abandon, args=[key, 'upstream broke']).start()
+
+        response = self.client.post(reverse('chat:send_message'), {'message': 'Hello there'})
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json(), {'error': 'upstream broke'})
+
+    def test_streamed_duplicates_are_replayed(self):
+        first = self.client.post(
+            reverse('chat:send_message_stream'), {'message': 'Hello there'}, headers={'Idempotency-Key': 'abc'},
+        )
+        events = ndjson(first)
+        retry = ndjson(self.client.post(
+            reverse('chat:send_message_stream'), {'message': 'Hello there'}, headers={'Idempotency-Key': 'abc'},
+        ))
+
+        self.assertTrue(retry[0]['deduplicated'])
+        self.assertEqual(retry[1]['content'], ''.join(e['content'] for e in events if e['type'] == 'delta'))
+        self.assertEqual(self.upstream_calls(), 1)
@@ -0,0 +1,55 @@
+from django.urls import reverse
+
+from chat.models import Chat, Message
+
+from .base import ChatTestCase, ndjson, stub_config
+
+
+class SendMessageStreamTests(ChatTestCase):
+    def test_streams_meta_deltas_and_done(self):
+        response = self.client.post(reverse('chat:send_message_stream'), {'message': 'Tell me about caches'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        events = ndjson(response)
+        self.assertEqual(events[0]['type'], 'meta')
+        self.assertTrue(events[0]['created'])
+        self.assertEqual(events[-1]['type'], 'done')
+        deltas = [e['content'] for e in events if e['type'] == 'delta']
+        self.assertGreater(len(deltas), 1)
+
+        chat = Chat.objects.get(id=events[0]['chat_id'], user=self.user)
+        reply = Message.objects.get(chat=chat, role='assistant')
+        self.assertEqual(reply.content, ''.join(deltas))
+        self.assertEqual(events[-1]['message_id'], reply.id)
+
+    def test_continues_an_existing_chat(self):
+        chat = Chat.objects.create(user=self.user, title='Existing', model='gpt-4o-mini')
+
+        events = ndjson(self.client.post(
+            reverse('chat:send_message_stream'), {'message': 'And another thing', 'chat_id': chat.id},
+        ))
+
+        self.assertEqual(events[0]['chat_id'], chat.id)
+        self.assertFalse(events[0]['created'])
+        self.assertEqual(list(chat.messages.values_list('role', flat=True).order_by('id')), ['user', 'assistant'])
+
+    def test_rejects_an_empty_message(self):
+        response = self.client.post(reverse('chat:send_message_stream'), {'message': '  '})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Message.objects.exists())
+
+    def test_requires_post(self):
+        self.assertEqual(self.client.get(reverse('chat:send_message_stream')).status_code, 405)
+
+
+class SendMessageStreamUpstreamErrorTests(ChatTestCase):
+    stub = stub_config(error_rate=1.0, error_statuses=(400,))
+
+    def test_reports_the_error_and_saves_no_reply(self):
+        events = ndjson(self.client.post(reverse('chat:send_message_stream'), {'message': 'Hello there friend'}))
+
+        self.assertEqual([e['type'] for e in events], ['meta', 'error'])
+        self.assertFalse(Message.objects.filter(role='assistant').exists())
@@ -0,0 +1,157 @@
+import json
+import random
+import threading
+import urllib.error
+import urllib.request
+
+from django.test import SimpleTestCase
+
+from chat.stub_server import Distribution, StubConfig, build_reply, make_server
+
+
+class DistributionTests(SimpleTestCase):
+    def test_parses_each_kind(self):
+        rng = random.Random(0)
+        self.assertEqual(Distribution('fixed:250').sample(rng), 250)
+        self.assertTrue(10 <= Distribution('uniform:10,20').sample(rng) <= 20)
+        for spec in ('normal:100,10', 'exp:100', 'lognormal:300,0.5'):
+            self.assertGreaterEqual(Distribution(spec).sample(rng), 0)
+
+    def test_samples_are_never_negative(self):
+        rng = random.Random(0)
+        self.assertTrue(all(Distribution('normal:0,100').sample(rng) >= 0 for _ in range(100)))
+        self.assertEqual(Distribution('exp:0').sample(rng), 0)
+
+    def test_rejects_bad_specs(self):
+        for spec in ('gamma:1,2', 'fixed:fast', 'uniform:10', 'fixed:1,2', 'exp'):
+            with self.subTest(spec=spec), self.assertRaises(ValueError):
+                Distribution(spec)
+
+
+class BuildReplyTests(SimpleTestCase):
+    config = StubConfig(reply_tokens=Distribution('fixed:30'))
+
+    def reply(self, system, user, **body):
+        messages = [{'role': 'system', 'content': system}, {'role': 'user', 'content': user}]
+        return build_reply({'messages': messages, **body}, random.Random(0), self.config)
+
+    def test_titles(self):
+        self.assertEqual(self.reply('You are a title generator.', 'what are good pasta recipes today'),
+                         'What Are Good Pasta Recipes')
+
+    def test_single_fact_extraction(self):
+        reply = self.reply('You do fact extraction.', "My name is Ada, I'm 36 years old and I live in Paris")
+
+        self.assertEqual(json.loads(reply), {'name': 'Ada', 'location': 'Paris', 'age': '36'})
+
+    def test_batched_fact_extraction_is_keyed_by_id(self):
+        items = [{'id': 1, 'message': 'Call me Grace'}, {'id': 2, 'message': 'I enjoy hiking.'}]
+
+        reply = self.reply('You do fact extraction.', json.dumps(items))
+
+        self.assertEqual(json.loads(reply), {'1': {'name': 'Grace'}, '2': {'interests': 'hiking'}})
+
+    def test_json_mode_is_always_json(self):
+        reply = self.reply('Be helpful.', 'hi', response_format={'type': 'json_object'})
+
+        self.assertIn('result', json.loads(reply))
+
+    def test_chat_replies_have_about_the_requested_length(self):
+        reply = self.reply('Be helpful.', 'hi')
+
+        self.assertEqual(len(reply.split()), 30)
+        self.assertTrue(reply.endswith('.'))
+
+
+class StubServerTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        config = StubConfig(latency=Distribution('fixed:0'), reply_tokens=Distribution('fixed:20'),
+                            tokens_per_second=0)
+        cls.server = make_server('127.0.0.1', 0, config)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+        cls.base = f'http://127.0.0.1:{cls.server.server_port}'
+
+    def request(self, path, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(self.base + path, data=data, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.read().decode('utf-8')
+
+    def complete(self, **body):
+        return json.loads(self.request('/v1/chat/completions', {
+            'model': 'gpt-4o', 'messages': [{'role': 'user', 'content': 'hello'}], **body,
+        }))
+
+    def test_health_and_models(self):
+        self.assertEqual(json.loads(self.request('/health')), {'ok': True})
+        models = json.loads(self.request('/v1/models'))
+        self.assertIn('gpt-4o-mini', [m['id'] for m in models['data']])
+
+    def test_completions_are_deterministic(self):
+        first, second = self.complete(), self.complete()
+
+        self.assertEqual(first['choices'][0]['message'], second['choices'][0]['message'])
+        self.assertEqual(first['model'], 'gpt-4o')
+        self.assertGreater(first['usage']['completion_tokens'], 0)
+
+    def stream(self):
+        body = self.request('/v1/chat/completions', {
+            'model': 'gpt-4o', 'messages': [{'role': 'user', 'content': 'hello'}],
+            'stream': True, 'stream_options': {'include_usage': True},
+        })
+        return [line[len('data: '):] for line in body.splitlines() if line.startswith('data: ')]
+
+    def test_streams_are_deterministic_server_sent_events(self):
+        events = self.stream()
+        self.assertEqual(events[-1], '[DONE]')
+        chunks = [json.loads(e) for e in events[:-1]]
+
+        streamed = ''.join(c['choices'][0]['delta'].get('content', '') for c in chunks if c['choices'])
+        self.assertEqual(len(streamed.split()), 20)
+        self.assertEqual(chunks[-2]['choices'][0]['finish_reason'], 'stop')
+        self.assertIn('usage', chunks[-1])
+        self.assertEqual(self.stream(), events)
+
+    def test_stats_count_requests(self):
+        before = json.loads(self.request('/stats')).get('requests', 0)
+        self.complete()
+
+        self.assertEqual(json.loads(self.request('/stats'))['requests'], before + 1)
+
+    def test_bad_requests(self):
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            self.request('/nope')
+        self.assertEqual(cm.exception.code, 404)
+
+        request = urllib.request.Request(self.base + '/v1/chat/completions', data=b'{not json')
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            urllib.request.urlopen(request, timeout=5)
+        self.assertEqual(cm.exception.code, 400)
+
+
+class InjectedErrorTests(SimpleTestCase):
+    def test_errors_carry_retry_after_and_retries_can_succeed(self):
+        config = StubConfig(latency=Distribution('fixed:0'), error_rate=0.5, error_statuses=(503,), retry_after=2)
+        server = make_server('127.0.0.1', 0, config)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f'http://127.0.0.1:{server.server_port}/v1/chat/completions'
+        body = json.dumps({'messages': [{'role': 'user', 'content': 'hi'}]}).encode('utf-8')
+
+        statuses = set()
+        for _ in range(20):
+            request = urllib.request.Request(url, data=body)
+            try:
+                with urllib.request.urlopen(request, timeout=5) as response:
+                    statuses.add(response.status)
+            except urllib.error.HTTPError as e:
+                statuses.add(e.code)
+                self.assertEqual(e.headers['Retry-After'], '2')
+
+        # The same request is retried twenty times; some attempts fail and some get through
+        self.assertEqual(statuses, {200, 503})
@@ -0,0 +1,84 @@
+from datetime import timedelta
+
+from django.test import override_settings
+from django.utils import timezone
+
+from chat import tasks, views
+from chat.models import BackgroundJob, Chat, Message
+
+from .base import ChatTestCase
+
+
+@override_settings(CHAT_SUMMARY_KEEP_RECENT=2, CHAT_SUMMARY_EVERY_TURNS=2)
+class RollingSummaryTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.chat = Chat.objects.create(user=self.user, title='Long chat')
+
+    def add(self, count):
+        return [
+            Message.objects.create(chat=self.chat, role='user' if n % 2 == 0 else 'assistant', content=f'turn {n}')
+            for n in range(count)
+        ]
+
+    def summary_jobs(self):
+        return BackgroundJob.objects.filter(kind='summarize_chat', payload__chat_id=self.chat.id)
+
+    def test_summary_is_scheduled_once_enough_turns_pile_up(self):
+        self.add(5)
+        views._schedule_summary_if_due(self.chat)
+        self.assertFalse(self.summary_jobs().exists())
+
+        self.add(1)
+        views._schedule_summary_if_due(self.chat)
+        views._schedule_summary_if_due(self.chat)
+        self.assertEqual(self.summary_jobs().count(), 1)
+
+    @override_settings(CHAT_JOB_LEASE=60)
+    def test_a_summary_lost_with_its_worker_is_requeued(self):
+        self.add(6)
+        views._schedule_summary_if_due(self.chat)
+        self.summary_jobs().update(status='running', attempts=1, updated_at=timezone.now() - timedelta(minutes=5))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            views._schedule_summary_if_due(self.chat)
+
+        self.assertEqual(list(self.summary_jobs().values_list('status', flat=True)), ['pending'])
+        # The pool is woken to run it
+        self.assertEqual(len(callbacks), 1)
+
+    def test_folds_all_but_the_recent_messages(self):
+        messages = self.add(6)
+
+        tasks.summarize_chat(self.chat.id)
+
+        self.chat.refresh_from_db()
+        self.assertTrue(self.chat.summary)
+        self.assertEqual(self.chat.summarized_through_id, messages[3].id)
+        self.assertEqual(self.upstream_calls(), 1)
+
+    def test_nothing_new_to_fold_makes_no_call(self):
+        self.add(6)
+        tasks.summarize_chat(self.chat.id)
+        self.chat.refresh_from_db()
+        folded = self.chat.summarized_through_id
+
+        tasks.summarize_chat(self.chat.id)
+
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.summarized_through_id, folded)
+        self.assertEqual(self.upstream_calls(), 1)
+
+    def test_summary_replaces_folded_messages_in_the_prompt(self):
+        messages = self.add(6)
+        Chat.objects.filter(id=self.chat.id).update(
+            summary='They talked about turns.', summarized_through_id=messages[3].id,
+        )
+        self.chat.refresh_from_db()
+
+        payload = views._build_openai_payload('gpt-4o-mini', self.chat, self.user)
+
+        contents = [m['content'] for m in payload['messages']]
+        self.assertIn('Summary of the earlier conversation:\nThey talked about turns.', contents)
+        self.assertEqual(contents[-2:], ['turn 4', 'turn 5'])
+        self.assertNotIn('turn 3', contents)
@@ -0,0 +1,38 @@
+"""Offline token estimation for OpenAI chat models.
+
+A close approximation of the cl100k/o200k tokenizers without shipping
+their vocabularies: text is pre-split the way those tokenizers do (words,
+short digit runs, punctuation, whitespace) and each piece is costed by
+length. It tends to overestimate slightly, which is the safe direction
+for budgeting.
+"""
+import math
+import re
+
+# Mirrors the tiktoken pre-tokenizer: optional leading space + letters, 1-3 digits, punctuation runs
+# (underscores included, as they are neither letters nor digits), whitespace
+_PIECE_RE = re.compile(r"""'(?:[sdmt]|ll|ve|re)| ?[^\W\d_]+| ?\d{1,3}| ?(?:[^\s\w]|_)+|\s+""", re.UNICODE)
+
+# Per-message framing cost in the chat completions format (role, separators)
+MESSAGE_OVERHEAD = 4
+# Every reply is primed with the assistant role
+REPLY_PRIMING = 3
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    tokens = 0
+    for piece in _PIECE_RE.findall(text):
+        if piece.isascii():
+            stripped = piece.strip()
+            # Common short words are a single token; long ones split roughly every 4 characters
+            tokens += 1 if len(stripped) <= 4 else math.ceil(len(stripped) / 4)
+        else:
+            # Non-Latin scripts average close to one token per character
+            tokens += max(1, len(piece.strip()))
+    return tokens
+
+
+def estimate_message_tokens(content: str) -> int:
+    return estimate_tokens(content) + MESSAGE_OVERHEAD
@@ -1,17 +1,29 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('', views.chat_home, name='home'),
     path('<int:chat_id>/', views.chat_home, name='chat_detail'),
     path('list/', views.list_chats, name='list_chats'),
     path('api/chat/<int:chat_id>/', views.get_chat, name='get_chat'),
+    path('search/', views.search_messages, name='search_messages'),
     path('send/', views.send_message, name='send_message'),
+    path('send/stream/', views.send_message_stream, name='send_message_stream'),
     path('create/', views.create_chat, name='create_chat'),
     path('chat/<int:chat_id>/rename/', views.rename_chat, name='rename_chat'),
     path('chat/<int:chat_id>/delete/', views.delete_chat, name='delete_chat'),
     path('chat/<int:chat_id>/pin/', views.toggle_pin_chat, name='toggle_pin_chat'),
     path('message/<int:message_id>/edit/', views.edit_message, name='edit_message'),
     path('message/<int:message_id>/delete/', views.delete_message, name='delete_message'),
+    path('message/<int:message_id>/speech/', views.message_speech, name='message_speech'),
+    path('message/<int:message_id>/speech/stream/', views.message_speech_stream, name='message_speech_stream'),
     path('chat/<int:chat_id>/regenerate/', views.regenerate_response, name='regenerate_response'),
+    path('voices/', views.list_voices, name='list_voices'),
+    path('voices/select/', views.select_voice, name='select_voice'),
+    path('voices/profiles/', views.create_voice_profile, name='create_voice_profile'),
+    path('voices/profiles/<int:profile_id>/delete/', views.delete_voice_profile, name='delete_voice_profile'),
+    # Async variants for deployments served through ttss.asgi
+    path('async/send/', async_views.send_message, name='async_send_message'),
+    path('async/create/', async_views.create_chat, name='async_create_chat'),
+    path('async/chat/<int:chat_id>/regenerate/', async_views.regenerate_response, name='async_regenerate_response'),
 ]
\ No newline at end of file
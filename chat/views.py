@@ -1,143 +1,54 @@
-import os
+import base64
 import json
+import math
 import re
-from typing import List, Dict
+from typing import Dict, Iterator, List
 
-import requests
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponseBadRequest, HttpRequest, HttpResponse
+from django.http import (
+    FileResponse, HttpRequest, HttpResponse, HttpResponseBadRequest, HttpResponseNotModified, JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import render, get_object_or_404
 from django.views.decorators.http import require_GET, require_POST
 from django.utils import timezone
 
-from .models import Chat, Message, UserMemory  # Make sure to add UserMemory model
+from tts import cache as audio_cache, pipeline, profiles, workers
+from tts.engine import UnknownVoice, get_engine
+from tts.models import VoiceProfile
 
-OPENAI_API_URL = 'https://api.openai.com/v1/chat/completions'
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
-DEFAULT_CHAT_MODEL = 'gpt-4o-mini'
-
-# ---------------- MEMORY HELPERS ----------------
-
-def _generate_title_with_ai(text: str) -> str:
-    """Generate a short, descriptive chat title from the first user message."""
-    if not text.strip():
-        return "New Chat"
-
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "model": "gpt-4o-mini",
-        "messages": [
-            {
-                "role": "system",
-                "content": (
-                    "You are a title generator. Create a short, descriptive title (max 6 words) "
-                    "based on the provided conversation start. "
-                    "Do not use quotes or punctuation at the start or end."
-                )
-            },
-            {"role": "user", "content": text}
-        ],
-        "temperature": 0.3
-    }
-
-    try:
-        resp = requests.post(OPENAI_API_URL, headers=headers, json=payload, timeout=15)
-        resp.raise_for_status()
-        title = resp.json()["choices"][0]["message"]["content"].strip()
-        return title if title else "New Chat"
-    except Exception as e:
-        print(f"Title generation failed: {e}")
-        return "New Chat"
-
-
-def _update_user_memory_from_message(user, message):
-    """Use GPT to dynamically extract personal facts from user messages."""
-    if not message:
-        return
-
-    extraction_prompt = [
-        {
-            "role": "system",
-            "content": (
-                "You are a fact extraction assistant. "
-                "Given the following user message, extract any personal information they are sharing "
-                "(e.g., name, age, location, interests, preferences, dislikes). "
-                "Respond only in JSON with key-value pairs, do not include explanations. "
-                "If no personal info is found, return an empty JSON object."
-            )
-        },
-        {"role": "user", "content": message}
-    ]
-
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "model": "gpt-4o-mini",
-        "messages": extraction_prompt,
-        "temperature": 0,
-    }
-
-    try:
-        resp = requests.post(OPENAI_API_URL, headers=headers, json=payload, timeout=20)
-        resp.raise_for_status()
-        facts = json.loads(resp.json()["choices"][0]["message"]["content"])
-
-        if not hasattr(user, "memory"):
-            memory = UserMemory.objects.create(user=user, memory_data={})
-        else:
-            memory = user.memory
-
-        updated = False
-        for k, v in facts.items():
-            if v and memory.memory_data.get(k) != v:
-                memory.memory_data[k] = v
-                updated = True
-
-        if updated:
-            memory.save()
-
-    except Exception as e:
-        # Log for debugging
-        print(f"Memory extraction failed: {e}")
-
-
-def _get_memory_text(user):
-    """Return a string description of what we know about the user."""
-    if hasattr(user, 'memory') and user.memory.memory_data:
-        return f"Here is what you know about this user: {json.dumps(user.memory.memory_data)}"
-    return "You have no stored personal facts about this user yet."
+from . import context, fact_filter, jobs, llm, memory, metrics, pagination, search, singleflight
+from .models import BackgroundJob, Chat, Message
+from .tokens import estimate_message_tokens
 
+DEFAULT_CHAT_MODEL = 'gpt-4o-mini'
 
 # ---------------- PAYLOAD BUILDING ----------------
 
-def _build_openai_payload(model: str, messages: List[Dict[str, str]], user) -> Dict:
-    """Add stored memory and bot personality to the context before sending to OpenAI."""
-
-    # Default values
-    bot_name = "Assistant"
-    bot_personality = "Friendly, helpful, remembers previous conversations, understanding and very intelligent."
-
-    # If user has stored bot name, use it
-    if hasattr(user, 'memory') and 'bot_name' in user.memory.memory_data:
-        bot_name = user.memory.memory_data['bot_name']
+def _build_openai_payload(model: str, chat: Chat, user) -> Dict:
+    """Add stored memory and bot personality to the chat history that fits the model's budget."""
 
+    # Rendered once per memory version and served from cache on later turns
     system_message = {
         'role': 'system',
-        'content': (
-            f"You are {bot_name}, an AI assistant. "
-            f"Your personality: {bot_personality}\n"
-            f"{_get_memory_text(user)}\n"
-        )
+        'content': memory.get_snapshot(user.id).system_prompt,
     }
 
+    preamble = [system_message]
+    if chat.summary:
+        preamble.append({
+            'role': 'system',
+            'content': f"Summary of the earlier conversation:\n{chat.summary}",
+        })
+
+    messages = context.build_context(
+        chat, model, reserved_tokens=sum(estimate_message_tokens(m['content']) for m in preamble),
+    )
+
     return {
         'model': model,
-        'messages': [system_message] + messages,
+        'messages': preamble + messages,
         'temperature': 0.5,
     }
 
@@ -156,6 +67,39 @@ def _generate_title_from_text(text: str) -> str:
     return title
 
 
+def _queue_memory_extraction(user_id: int, text: str) -> None:
+    """Queue GPT fact extraction unless the local pre-filter rules the message out."""
+    if fact_filter.should_extract(text):
+        jobs.enqueue('extract_memory', user_id=user_id, message=text)
+
+
+def _schedule_summary_if_due(chat: Chat) -> None:
+    """Queue a rolling-summary update once enough unsummarized turns have piled up."""
+    unsummarized = Message.objects.filter(chat=chat)
+    if chat.summarized_through_id is not None:
+        unsummarized = unsummarized.filter(id__gt=chat.summarized_through_id)
+    threshold = settings.CHAT_SUMMARY_KEEP_RECENT + 2 * settings.CHAT_SUMMARY_EVERY_TURNS
+    if unsummarized.count() < threshold:
+        return
+    # A summary 'running' on a worker that died would otherwise block this chat's summaries for good
+    if jobs.requeue_stale():
+        jobs.wake()
+    already_queued = BackgroundJob.objects.filter(
+        kind='summarize_chat', status__in=['pending', 'running'], payload__chat_id=chat.id,
+    ).exists()
+    if not already_queued:
+        jobs.enqueue('summarize_chat', chat_id=chat.id)
+
+
+def _create_chat_with_title(user, text: str, model: str) -> Chat:
+    """Create a chat with a quick placeholder title and let a background job write the AI one."""
+    placeholder = _generate_title_from_text(text)
+    chat = Chat.objects.create(user=user, title=placeholder, model=model)
+    if text.strip():
+        jobs.enqueue('generate_title', chat_id=chat.id, text=text, placeholder=placeholder)
+    return chat
+
+
 @login_required
 def chat_home(request: HttpRequest, chat_id: int | None = None) -> HttpResponse:
     return render(request, 'chat/chat.html', {
@@ -167,20 +111,74 @@ def chat_home(request: HttpRequest, chat_id: int | None = None) -> HttpResponse:
 @login_required
 @require_GET
 def list_chats(request: HttpRequest) -> JsonResponse:
-    chats = (
-        Chat.objects
-        .filter(user=request.user)
-        .order_by('-pinned', '-updated_at')
-        .values('id', 'title', 'model', 'updated_at', 'created_at', 'pinned')
+    """Return one page of the user's chats, pinned first, optionally filtered by ``q``."""
+    limit = pagination.page_size(request.GET.get('limit'))
+    cursor = request.GET.get('cursor', '').strip()
+    query = request.GET.get('q', '').strip()
+
+    chats = Chat.objects.filter(user=request.user)
+    if query:
+        chats = chats.filter(title__icontains=query)
+    if cursor:
+        try:
+            pinned, updated_at, pk = pagination.decode_cursor(cursor, 3)
+            keys = [bool(pinned), pagination.parse_datetime_value(updated_at), pk]
+        except pagination.InvalidCursor as e:
+            return HttpResponseBadRequest(str(e))
+        chats = chats.filter(pagination.keyset_filter(['pinned', 'updated_at', 'id'], keys, descending=True))
+
+    rows = list(
+        chats
+        .order_by('-pinned', '-updated_at', '-id')
+        .values('id', 'title', 'model', 'updated_at', 'created_at', 'pinned')[:limit + 1]
     )
-    return JsonResponse({'chats': list(chats)})
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = page[-1]
+        next_cursor = pagination.encode_cursor(last['pinned'], last['updated_at'], last['id'])
+    return JsonResponse({'chats': page, 'next_cursor': next_cursor})
 
 
 @login_required
 @require_GET
 def get_chat(request: HttpRequest, chat_id: int) -> JsonResponse:
+    """Return one page of a chat's messages, oldest first.
+
+    Without a cursor this is the newest page. Pass ``before`` (or ``after``)
+    with a cursor from a previous response to walk older (or newer) history.
+    """
     chat = get_object_or_404(Chat, id=chat_id, user=request.user)
-    messages = list(chat.messages.values('id', 'role', 'content', 'created_at'))
+    limit = pagination.page_size(request.GET.get('limit'))
+    before = request.GET.get('before', '').strip()
+    after = request.GET.get('after', '').strip()
+
+    fields = ['created_at', 'id']
+    queryset = chat.messages.all()
+    try:
+        if after:
+            created_at, pk = pagination.decode_cursor(after, 2)
+            keys = [pagination.parse_datetime_value(created_at), pk]
+            queryset = queryset.filter(pagination.keyset_filter(fields, keys, descending=False))
+        elif before:
+            created_at, pk = pagination.decode_cursor(before, 2)
+            keys = [pagination.parse_datetime_value(created_at), pk]
+            queryset = queryset.filter(pagination.keyset_filter(fields, keys, descending=True))
+    except pagination.InvalidCursor as e:
+        return HttpResponseBadRequest(str(e))
+
+    ordering = ['created_at', 'id'] if after else ['-created_at', '-id']
+    rows = list(queryset.order_by(*ordering).values('id', 'role', 'content', 'created_at')[:limit + 1])
+    has_more = len(rows) > limit
+    messages = rows[:limit]
+    if not after:
+        messages.reverse()
+
+    def cursor_for(message):
+        return pagination.encode_cursor(message['created_at'], message['id'])
+
+    has_older = has_more if not after else True
+    has_newer = has_more if after else bool(before)
     return JsonResponse({
         'chat': {
             'id': chat.id,
@@ -191,22 +189,42 @@ def get_chat(request: HttpRequest, chat_id: int) -> JsonResponse:
             'pinned': chat.pinned,
         },
         'messages': messages,
+        'next_before': cursor_for(messages[0]) if messages and has_older else None,
+        'next_after': cursor_for(messages[-1]) if messages and has_newer else None,
     })
 
 
+@login_required
+@require_GET
+def search_messages(request: HttpRequest) -> JsonResponse:
+    """Full-text search across the user's messages, best matches first."""
+    query = request.GET.get('q', '').strip()
+    limit = pagination.page_size(request.GET.get('limit'), default=20)
+    try:
+        page = max(1, int(request.GET.get('page', '1')))
+    except ValueError:
+        page = 1
+    results, has_more = search.search_messages(request.user.id, query, limit=limit, offset=(page - 1) * limit)
+    return JsonResponse({'query': query, 'page': page, 'has_more': has_more, 'results': results})
+
+
 @login_required
 @require_POST
 def create_chat(request: HttpRequest) -> JsonResponse:
-    title = _generate_title_with_ai(request.POST.get('title', ''))
+    text = request.POST.get('title', '')
     model = (request.POST.get('model', '').strip() or DEFAULT_CHAT_MODEL)
-    chat = Chat.objects.create(user=request.user, title=title, model=model)
-    return JsonResponse({'chat_id': chat.id, 'title': chat.title, 'model': chat.model})
+    chat = _create_chat_with_title(request.user, text, model)
+    return JsonResponse({
+        'chat_id': chat.id,
+        'title': chat.title,
+        'model': chat.model,
+        'title_pending': bool(text.strip()),
+    })
 
 
-@login_required
-@require_POST
-def send_message(request: HttpRequest) -> JsonResponse:
-    if not OPENAI_API_KEY:
+def _parse_turn(request: HttpRequest):
+    """Validate a send request and return (user_text, chat_id_str, model), or an HttpResponse."""
+    if not llm.is_configured():
         return HttpResponseBadRequest('Server missing OPENAI_API_KEY')
 
     user_text = request.POST.get('message', '').strip()
@@ -215,67 +233,284 @@ def send_message(request: HttpRequest) -> JsonResponse:
 
     if not user_text:
         return HttpResponseBadRequest('Empty message')
+    return user_text, chat_id_str, model
 
-    # Update memory with new personal info
-    _update_user_memory_from_message(request.user, user_text)
+
+def _idempotency_key(request: HttpRequest) -> str:
+    return (request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key', '')).strip()[:200]
+
+
+def _start_turn(user, user_text: str, chat_id_str: str, model: str):
+    """Persist the user message and return (chat, created, payload)."""
+    # Extract personal info after the reply instead of before it
+    _queue_memory_extraction(user.id, user_text)
 
     # Get or create chat
     created = False
     if chat_id_str:
-        chat = get_object_or_404(Chat, id=int(chat_id_str), user=request.user)
+        chat = get_object_or_404(Chat, id=int(chat_id_str), user=user)
         if chat.model != model:
             chat.model = model
             chat.save(update_fields=['model', 'updated_at'])
     else:
-        title = _generate_title_with_ai(user_text)
-        chat = Chat.objects.create(user=request.user, title=title, model=model)
+        chat = _create_chat_with_title(user, user_text, model)
         created = True
 
     # Save user message
     Message.objects.create(chat=chat, role='user', content=user_text)
 
-    # Fetch recent context (last 20 messages from this chat)
-    recent_messages = list(
-        Message.objects.filter(chat=chat)
-        .order_by('-created_at')[:20]
-        .values('role', 'content')
-    )
-    recent_messages.reverse()
+    # Build payload with stored memory and as much recent history as the budget allows
+    payload = _build_openai_payload(model=model, chat=chat, user=user)
+    return chat, created, payload
 
-    # Build payload with stored memory
-    payload = _build_openai_payload(model=model, messages=recent_messages, user=request.user)
 
-    headers = {
-        'Authorization': f'Bearer {OPENAI_API_KEY}',
-        'Content-Type': 'application/json',
+def _turn_meta(chat: Chat, created: bool) -> Dict:
+    return {
+        'chat_id': chat.id,
+        'created': created,
+        'title': chat.title,
+        'title_pending': created,
+        'model': chat.model,
     }
 
+
+def _finish_turn(chat: Chat, assistant_text: str) -> Message:
+    message = Message.objects.create(chat=chat, role='assistant', content=assistant_text)
+    Chat.objects.filter(id=chat.id).update(updated_at=timezone.now())
+    _schedule_summary_if_due(chat)
+    if settings.TTS_PREGENERATE:
+        _pregenerate_speech(chat, assistant_text)
+    return message
+
+
+def _pregenerate_speech(chat: Chat, text: str) -> None:
+    """Render the reply in the user's chosen voice in the background, so Listen starts at once."""
+    engine = get_engine()
+    user = chat.user
+    if not user.voice_profile_id and user.preferred_voice not in engine.voices:
+        return
     try:
-        resp = requests.post(OPENAI_API_URL, headers=headers, data=json.dumps(payload), timeout=90)
-        resp.raise_for_status()
-        data = resp.json()
-        assistant_text = data['choices'][0]['message']['content']
-    except Exception as e:
+        voice = profiles.user_voice(engine, user)
+    except UnknownVoice:
+        return
+    pipeline.pregenerate(engine, voice, text[:settings.TTS_MAX_CHARS], user=user.id)
+
+
+def _llm_error_response(e: Exception) -> JsonResponse:
+    """503 with a Retry-After hint while the upstream is down; 500 for anything else."""
+    if isinstance(e, llm.UpstreamUnavailable):
+        response = JsonResponse({'error': str(e)}, status=503)
+        if e.retry_after is not None:
+            response['Retry-After'] = str(math.ceil(e.retry_after))
+        return response
+    return JsonResponse({'error': str(e)}, status=500)
+
+
+def _saturated_response(e: workers.Saturated) -> JsonResponse:
+    """503 with a Retry-After hint while the speech workers are at capacity."""
+    response = JsonResponse({'error': str(e)}, status=503)
+    response['Retry-After'] = str(math.ceil(e.retry_after))
+    return response
+
+
+def _saturated_event(e: workers.Saturated) -> str:
+    """The NDJSON counterpart of :func:`_saturated_response`, for a stream whose status is already sent."""
+    return _ndjson_event({'type': 'error', 'error': str(e), 'status': 503, 'retry_after': math.ceil(e.retry_after)})
+
+
+def _await_duplicate_turn(key: str):
+    """Return the result of the identical turn already in flight, or an error response."""
+    try:
+        return singleflight.wait(key)
+    except singleflight.FlightTimeout as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    except singleflight.FlightFailed as e:
         return JsonResponse({'error': str(e)}, status=500)
 
-    # Save assistant message
-    Message.objects.create(chat=chat, role='assistant', content=assistant_text)
 
-    # Update chat timestamp
-    Chat.objects.filter(id=chat.id).update(updated_at=timezone.now())
+@login_required
+@require_POST
+def send_message(request: HttpRequest) -> JsonResponse:
+    parsed = _parse_turn(request)
+    if isinstance(parsed, HttpResponse):
+        return parsed
+    user_text, chat_id_str, model = parsed
+
+    # Identical concurrent submissions share one stored turn and one completion
+    idempotency_key = _idempotency_key(request)
+    key = singleflight.turn_key(request.user.id, chat_id_str, user_text, idempotency_key)
+    if singleflight.acquire(key, idempotent=bool(idempotency_key)):
+        # Whatever fails between leading and completing, the duplicates waiting on us must be released
+        try:
+            chat, created, payload = _start_turn(request.user, user_text, chat_id_str, model)
+            try:
+                assistant_text = llm.chat_completion(payload)
+            except Exception as e:
+                singleflight.abandon(key, str(e))
+                return _llm_error_response(e)
+            message = _finish_turn(chat, assistant_text)
+            result = {**_turn_meta(chat, created), 'message_id': message.id, 'content': assistant_text}
+            singleflight.complete(key, result, idempotent=bool(idempotency_key))
+        except BaseException as e:
+            singleflight.abandon(key, str(e))
+            raise
+        deduplicated = False
+    else:
+        result = _await_duplicate_turn(key)
+        if isinstance(result, HttpResponse):
+            return result
+        deduplicated = True
 
     return JsonResponse({
-        'chat_id': chat.id,
-        'created': created,
-        'title': chat.title,
-        'model': chat.model,
+        **{k: result[k] for k in ('chat_id', 'created', 'title', 'title_pending', 'model')},
+        'deduplicated': deduplicated,
         'assistant': {
             'role': 'assistant',
-            'content': assistant_text,
+            'content': result['content'],
         },
     })
 
 
+def _ndjson_event(obj: Dict) -> str:
+    return json.dumps(obj, default=str) + '\n'
+
+
+def _audio_events(speech: pipeline.SpeechPipeline, chunks) -> Iterator[str]:
+    for pcm in chunks:
+        yield _ndjson_event({
+            'type': 'audio',
+            'encoding': 'pcm_s16le',
+            'sample_rate': speech.engine.sample_rate,
+            'data': base64.b64encode(pcm).decode('ascii'),
+        })
+
+
+@login_required
+@require_POST
+def send_message_stream(request: HttpRequest) -> HttpResponse:
+    """Relay completion deltas as NDJSON events while the model is still generating.
+
+    Emits one ``meta`` event, then ``delta`` events, then ``done`` (or ``error``).
+    The assembled reply is saved when the upstream stream ends. A duplicate of
+    a turn that is already streaming gets the finished reply as one delta.
+
+    With a ``speak`` field (a voice name, or ``default``), the reply is also
+    spoken: ``audio`` events carrying base64 16-bit PCM are interleaved with
+    the deltas, one per sentence, as soon as each sentence is rendered. If
+    the speech workers are at capacity the request gets a 503 up front; if
+    they stay full for ``TTS_QUEUE_TIMEOUT`` once the reply is under way,
+    the stream ends with an ``error`` event carrying ``status`` 503 and
+    ``retry_after`` instead of ``done``.
+    """
+    parsed = _parse_turn(request)
+    if isinstance(parsed, HttpResponse):
+        return parsed
+    user_text, chat_id_str, model = parsed
+
+    speech = None
+    if request.POST.get('speak'):
+        resolved = _speech_voice(request, request.POST['speak'] if request.POST['speak'] != 'default' else None)
+        if isinstance(resolved, HttpResponse):
+            return resolved
+        try:
+            workers.get_farm().check()
+        except workers.Saturated as e:
+            return _saturated_response(e)
+        speech = pipeline.SpeechPipeline(*resolved, user=request.user.id)
+
+    idempotency_key = _idempotency_key(request)
+    key = singleflight.turn_key(request.user.id, chat_id_str, user_text, idempotency_key)
+    if not singleflight.acquire(key, idempotent=bool(idempotency_key)):
+        return _ndjson_response(_replay_turn_stream(key, speech))
+
+    try:
+        chat, created, payload = _start_turn(request.user, user_text, chat_id_str, model)
+    except BaseException as e:
+        singleflight.abandon(key, str(e))
+        raise
+
+    def stream():
+        try:
+            yield from turn()
+        finally:
+            if speech:
+                speech.cancel()
+
+    def turn():
+        yield _ndjson_event({'type': 'meta', **_turn_meta(chat, created)})
+        parts: List[str] = []
+        error = None
+        try:
+            for delta in llm.stream_chat_completion(payload):
+                parts.append(delta)
+                yield _ndjson_event({'type': 'delta', 'content': delta})
+                if speech:
+                    speech.feed(delta)
+                    yield from _audio_events(speech, speech.ready())
+        except Exception as e:
+            error = str(e)
+            yield _ndjson_event({'type': 'error', 'error': error})
+            return
+        finally:
+            # Persist whatever arrived, even if the client went away mid-stream
+            assistant_text = ''.join(parts)
+            message = None
+            if assistant_text:
+                try:
+                    message = _finish_turn(chat, assistant_text)
+                    singleflight.complete(
+                        key,
+                        {**_turn_meta(chat, created), 'message_id': message.id, 'content': assistant_text},
+                        idempotent=bool(idempotency_key),
+                    )
+                except BaseException as e:
+                    singleflight.abandon(key, str(e))
+                    raise
+            else:
+                singleflight.abandon(key, error or 'No reply was generated')
+        if speech:
+            # The reply is saved; finish speaking its last sentences before signing off
+            speech.close()
+            try:
+                yield from _audio_events(speech, speech.drain())
+            except workers.Saturated as e:
+                yield _saturated_event(e)
+                return
+        yield _ndjson_event({'type': 'done', 'message_id': message.id if message else None})
+
+    return _ndjson_response(stream())
+
+
+def _replay_turn_stream(key: str, speech: pipeline.SpeechPipeline | None = None):
+    result = _await_duplicate_turn(key)
+    if isinstance(result, HttpResponse):
+        yield _ndjson_event({'type': 'error', 'error': json.loads(result.content)['error']})
+        return
+    yield _ndjson_event({
+        'type': 'meta',
+        **{k: result[k] for k in ('chat_id', 'created', 'title', 'title_pending', 'model')},
+        'deduplicated': True,
+    })
+    yield _ndjson_event({'type': 'delta', 'content': result['content']})
+    if speech:
+        speech.feed(result['content'])
+        speech.close()
+        try:
+            yield from _audio_events(speech, speech.drain())
+        except workers.Saturated as e:
+            yield _saturated_event(e)
+            return
+    yield _ndjson_event({'type': 'done', 'message_id': result['message_id']})
+
+
+def _ndjson_response(events) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(events, content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the whole reply
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 @require_POST
 def rename_chat(request: HttpRequest, chat_id: int) -> JsonResponse:
@@ -326,25 +561,10 @@ def delete_message(request: HttpRequest, message_id: int) -> JsonResponse:
     Chat.objects.filter(id=chat_id).update(updated_at=timezone.now())
     return JsonResponse({'ok': True})
 
-@login_required
-@require_POST
-def regenerate_response(request: HttpRequest, chat_id: int) -> JsonResponse:
-    if not OPENAI_API_KEY:
-        return HttpResponseBadRequest('Server missing OPENAI_API_KEY')
-    chat = get_object_or_404(Chat, id=chat_id, user=request.user)
-    model = chat.model or DEFAULT_CHAT_MODEL
-
-    # Find the last user message
-    last_user_message = (
-        Message.objects
-        .filter(chat=chat, role='user')
-        .order_by('-created_at')
-        .first()
-    )
-    if not last_user_message:
-        return HttpResponseBadRequest('No user message to regenerate from')
-
-    # Remove the last assistant message if present so we "replace" it
+def _drop_last_reply(chat: Chat) -> bool:
+    """Delete the chat's last assistant message so it can be replaced; False if no user message exists."""
+    if not Message.objects.filter(chat=chat, role='user').exists():
+        return False
     last_assistant_message = (
         Message.objects
         .filter(chat=chat, role='assistant')
@@ -353,29 +573,235 @@ def regenerate_response(request: HttpRequest, chat_id: int) -> JsonResponse:
     )
     if last_assistant_message:
         last_assistant_message.delete()
+    return True
+
+
+@login_required
+@require_POST
+def regenerate_response(request: HttpRequest, chat_id: int) -> JsonResponse:
+    if not llm.is_configured():
+        return HttpResponseBadRequest('Server missing OPENAI_API_KEY')
+    chat = get_object_or_404(Chat, id=chat_id, user=request.user)
+    model = chat.model or DEFAULT_CHAT_MODEL
+    if not _drop_last_reply(chat):
+        return HttpResponseBadRequest('No user message to regenerate from')
 
     # Rebuild context and call OpenAI
-    recent_messages = list(
-        Message.objects.filter(chat=chat)
-        .order_by('-created_at')[:20]
-        .values('role', 'content')
-    )
-    recent_messages.reverse()
+    payload = _build_openai_payload(model=model, chat=chat, user=request.user)
+    try:
+        assistant_text = llm.chat_completion(payload)
+    except Exception as e:
+        return _llm_error_response(e)
+
+    _finish_turn(chat, assistant_text)
+    return JsonResponse({'assistant': {'role': 'assistant', 'content': assistant_text}})
+
+
+def _speech_voice(request: HttpRequest, name: str | None):
+    """(engine, voice) for ``name``, else the user's own choice of voice; an error response if unknown."""
+    engine = get_engine()
+    try:
+        return engine, profiles.user_voice(engine, request.user, name)
+    except UnknownVoice as e:
+        return HttpResponseBadRequest(str(e))
+
 
-    payload = _build_openai_payload(model=model, messages=recent_messages, user=request.user)
-    headers = {
-        'Authorization': f'Bearer {OPENAI_API_KEY}',
-        'Content-Type': 'application/json',
+def _spoken_message(request: HttpRequest, message_id: int):
+    message = get_object_or_404(Message, id=message_id, chat__user=request.user)
+    if message.role != 'assistant':
+        return HttpResponseBadRequest('Only assistant messages can be spoken')
+    return message
+
+
+def _speech_response(message: Message, key: str, body) -> HttpResponse:
+    """Audio headers shared by both speech views; ``body`` is an open cache file or a WAV stream."""
+    # The key covers the text and voice, so it is a strong validator of the file
+    etag = f'"{key}"'
+    if isinstance(body, (bytes, bytearray)):
+        response = HttpResponse(body, content_type='audio/wav')
+    elif hasattr(body, 'read'):
+        # FileResponse hands the open file to the server's sendfile path
+        response = FileResponse(body, content_type='audio/wav')
+    else:
+        response = StreamingHttpResponse(body, content_type='audio/wav')
+        response['X-Accel-Buffering'] = 'no'
+        # The same audio behind a header of unknown length: equivalent, not byte-identical
+        etag = f'W/{etag}'
+    response['Content-Disposition'] = f'inline; filename="message-{message.id}.wav"'
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+
+def _speech_request(request: HttpRequest, message_id: int):
+    """(message, engine, voice, text, cache key), a 304 if the client has it, or an error response."""
+    message = _spoken_message(request, message_id)
+    if isinstance(message, HttpResponse):
+        return message
+    resolved = _speech_voice(request, request.GET.get('voice'))
+    if isinstance(resolved, HttpResponse):
+        return resolved
+    engine, voice = resolved
+    text = message.content[:settings.TTS_MAX_CHARS]
+    key = audio_cache.make_key(engine, voice, text)
+    # Weak comparison, so a client that first got the stream still revalidates against the file
+    tags = {tag.strip().removeprefix('W/') for tag in request.headers.get('If-None-Match', '').split(',')}
+    if f'"{key}"' in tags:
+        return HttpResponseNotModified()
+    return message, engine, voice, text, key
+
+
+@login_required
+@require_GET
+def message_speech(request: HttpRequest, message_id: int) -> HttpResponse:
+    """Speak an assistant message as a WAV file, in ``?voice=`` or the user's preferred voice.
+
+    Rendered files are kept in the audio cache, so playing a message again costs no synthesis.
+    """
+    prepared = _speech_request(request, message_id)
+    if isinstance(prepared, HttpResponse):
+        return prepared
+    message, engine, voice, text, key = prepared
+    cache = audio_cache.get_cache()
+    cached = cache.open(key) if cache else None
+    if cached is None:
+        try:
+            wav = pipeline.render_wav(engine, voice, text, key if cache else None, user=request.user.id)
+        except workers.Saturated as e:
+            return _saturated_response(e)
+        if not cache:
+            return _speech_response(message, key, wav)
+        # Pruning may already have taken the new file; the bytes are still at hand
+        cached = cache.open(key) or wav
+    return _speech_response(message, key, cached)
+
+
+@login_required
+@require_GET
+def message_speech_stream(request: HttpRequest, message_id: int) -> HttpResponse:
+    """Like :func:`message_speech`, but each sentence is sent as soon as it is rendered.
+
+    A message already in the audio cache is sent as a plain file.
+    """
+    prepared = _speech_request(request, message_id)
+    if isinstance(prepared, HttpResponse):
+        return prepared
+    message, engine, voice, text, key = prepared
+    cache = audio_cache.get_cache()
+    cached = cache.open(key) if cache else None
+    if cached is not None:
+        return _speech_response(message, key, cached)
+    try:
+        workers.get_farm().check()
+    except workers.Saturated as e:
+        return _saturated_response(e)
+    chunks = pipeline.stream_wav(engine, voice, text, cache_key=key, user=request.user.id)
+    return _speech_response(message, key, chunks)
+
+
+# ---------------- VOICES ----------------
+
+def _voice_profile_json(profile: VoiceProfile) -> Dict:
+    return {
+        'voice': profiles.voice_name(profile.id),
+        'name': profile.name,
+        'reference_seconds': round(profile.reference_seconds, 1),
+        'created_at': profile.created_at,
     }
+
+
+@login_required
+@require_GET
+def list_voices(request: HttpRequest) -> JsonResponse:
+    """Built-in voices, the user's cloned voices, and the one replies are spoken in."""
+    engine = get_engine()
+    own = VoiceProfile.objects.filter(user=request.user).defer('embedding')
+    return JsonResponse({
+        'voices': [{'voice': voice.name, 'name': voice.label} for voice in engine.voices.values()],
+        'profiles': [_voice_profile_json(profile) for profile in own],
+        'selected': profiles.user_voice(engine, request.user).name,
+    })
+
+
+@login_required
+@require_POST
+def create_voice_profile(request: HttpRequest) -> HttpResponse:
+    """Clone a voice from ``audio``, a WAV recording of the user reading aloud.
+
+    The recording is analysed once, on the speech workers, and then discarded;
+    with ``select`` set, replies are spoken in the new voice from now on.
+    """
+    name = request.POST.get('name', '').strip()
+    upload = request.FILES.get('audio')
+    if not name:
+        return HttpResponseBadRequest('Name required')
+    if upload is None:
+        return HttpResponseBadRequest('Reference audio required')
+    if upload.size > settings.TTS_PROFILE_MAX_BYTES:
+        return HttpResponseBadRequest(f'Reference audio is limited to {settings.TTS_PROFILE_MAX_BYTES} bytes')
+    if VoiceProfile.objects.filter(user=request.user).count() >= settings.TTS_PROFILES_PER_USER:
+        return HttpResponseBadRequest('Delete a voice before adding another')
     try:
-        resp = requests.post(OPENAI_API_URL, headers=headers, data=json.dumps(payload), timeout=90)
-        resp.raise_for_status()
-        data = resp.json()
-        assistant_text = data['choices'][0]['message']['content']
-    except Exception as e:
-        return JsonResponse({'error': str(e)}, status=500)
+        embedding, seconds = workers.get_farm().submit(profiles.embed_wav, upload.read(), user=request.user.id).result()
+    except workers.Saturated as e:
+        return _saturated_response(e)
+    except profiles.InvalidReference as e:
+        return HttpResponseBadRequest(str(e))
+    profile = VoiceProfile.objects.create(
+        user=request.user, name=name[:100], embedding=embedding, reference_seconds=seconds,
+    )
+    if request.POST.get('select'):
+        request.user.voice_profile = profile
+        request.user.save(update_fields=['voice_profile', 'updated_at'])
+    return JsonResponse({'profile': _voice_profile_json(profile)}, status=201)
 
-    Message.objects.create(chat=chat, role='assistant', content=assistant_text)
-    Chat.objects.filter(id=chat.id).update(updated_at=timezone.now())
 
-    return JsonResponse({'assistant': {'role': 'assistant', 'content': assistant_text}})
\ No newline at end of file
+@login_required
+@require_POST
+def delete_voice_profile(request: HttpRequest, profile_id: int) -> JsonResponse:
+    profile = get_object_or_404(VoiceProfile, id=profile_id, user=request.user)
+    profile.delete()
+    return JsonResponse({'ok': True})
+
+
+@login_required
+@require_POST
+def select_voice(request: HttpRequest) -> HttpResponse:
+    """Speak replies in ``voice``: a built-in voice or ``profile-<id>``; empty for the default voice."""
+    name = request.POST.get('voice', '').strip()
+    engine = get_engine()
+    user = request.user
+    try:
+        voice = profiles.user_voice(engine, user, name or None)
+    except UnknownVoice as e:
+        return HttpResponseBadRequest(str(e))
+    if name.startswith(profiles.PREFIX):
+        user.voice_profile_id = int(name[len(profiles.PREFIX):])
+    else:
+        user.voice_profile = None
+        user.preferred_voice = name
+    user.save(update_fields=['voice_profile', 'preferred_voice', 'updated_at'])
+    return JsonResponse({'selected': voice.name})
+
+
+# ---------------- OPERATIONS ----------------
+
+def _metrics_allowed(request: HttpRequest) -> bool:
+    token = settings.CHAT_METRICS_TOKEN
+    if token:
+        return request.headers.get('Authorization') == f'Bearer {token}'
+    # Behind a reverse proxy every request comes from localhost, so that only counts in development
+    local = settings.DEBUG and request.META.get('REMOTE_ADDR') in ('127.0.0.1', '::1')
+    return request.user.is_staff or local
+
+
+@require_GET
+def prometheus_metrics(request: HttpRequest) -> HttpResponse:
+    """Aggregate metrics of every worker process in the Prometheus text format.
+
+    With ``CHAT_METRICS_TOKEN`` set, scrapers must send it as a bearer token. Without one,
+    only staff users are served, plus localhost when ``DEBUG`` is on.
+    """
+    if not _metrics_allowed(request):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_delete
+
+
+class TtsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'tts'
+    verbose_name = 'Text to speech'
+
+    def ready(self):
+        from .models import VoiceProfile
+        from .profiles import on_profile_deleted
+
+        post_delete.connect(on_profile_deleted, sender=VoiceProfile)
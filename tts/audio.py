@@ -0,0 +1,26 @@
+"""WAV encoding of engine output."""
+import struct
+
+import numpy as np
+
+# Data size for a stream whose length is not known up front; players read to the end
+STREAMING_SIZE = 0xFFFFFFFF
+
+
+def pcm16(samples: np.ndarray) -> bytes:
+    """Float samples in [-1, 1] as little-endian signed 16-bit PCM."""
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+
+
+def wav_header(sample_rate: int, data_bytes: int = STREAMING_SIZE) -> bytes:
+    """A 44-byte header for mono 16-bit PCM."""
+    riff_size = STREAMING_SIZE if data_bytes == STREAMING_SIZE else 36 + data_bytes
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', riff_size, b'WAVE', b'fmt ', 16, 1, 1, sample_rate, sample_rate * 2, 2, 16, b'data', data_bytes,
+    )
+
+
+def to_wav(samples: np.ndarray, sample_rate: int) -> bytes:
+    data = pcm16(samples)
+    return wav_header(sample_rate, len(data)) + data
@@ -0,0 +1,153 @@
+"""Content-addressed on-disk cache of synthesized speech.
+
+An entry is a complete WAV file named by a SHA-256 over the engine (name,
+version, sample rate), every parameter of the voice, and the text as it
+will be spoken (after :func:`tts.text.normalize`, so Markdown-only
+differences share an entry). It lives under ``TTS_CACHE_DIR`` and is shared
+by every process on the host. Whole messages are cached so that replaying
+one costs no synthesis. Single sentences from the streaming pipeline are
+cached too, so phrases that recur across replies and users are rendered
+only once.
+
+Writes go to a temporary file that is renamed into place, so concurrent
+workers never see a partial entry; if two render the same text, the last
+rename wins and both copies are identical. Hits touch the file's mtime,
+and every ``PRUNE_EVERY`` writes the least recently used files are
+deleted until the directory is back under ``TTS_CACHE_MAX_BYTES``.
+Whole files are sent with ``FileResponse``, which goes out through the
+server's sendfile path. Sentences are read back through ``mmap``.
+"""
+import dataclasses
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import BinaryIO
+
+from django.conf import settings
+
+from chat import metrics
+
+from . import text as text_frontend
+from .engine import Engine, Voice
+
+WAV_HEADER_BYTES = 44
+
+
+def make_key(engine: Engine, voice: Voice, text: str, kind: str = 'message') -> str:
+    material = json.dumps({
+        'engine': [engine.name, engine.version, engine.sample_rate],
+        'voice': dataclasses.asdict(voice),
+        'kind': kind,
+        'text': text_frontend.normalize(text),
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class AudioCache:
+    # Pruning walks the whole directory, so it only runs every N writes
+    PRUNE_EVERY = 50
+    # Prune down to this share of the limit, so the next few writes do not trigger it again
+    PRUNE_TO = 0.9
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        # Two-character fan-out keeps directories small
+        return self.directory / key[:2] / f'{key}.wav'
+
+    def _touch(self, path: Path) -> None:
+        # The mtime records the last use and drives LRU pruning
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def open(self, key: str, namespace: str = 'message') -> BinaryIO | None:
+        """An open file of the entry, or None on a miss."""
+        path = self._path(key)
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            metrics.CACHE_REQUESTS.inc(cache='tts', namespace=namespace, result='miss')
+            return None
+        metrics.CACHE_REQUESTS.inc(cache='tts', namespace=namespace, result='hit')
+        self._touch(path)
+        return f
+
+    def read_pcm(self, key: str, namespace: str = 'sentence') -> bytes | None:
+        """The entry's PCM samples without the WAV header, or None on a miss."""
+        f = self.open(key, namespace)
+        if f is None:
+            return None
+        with f:
+            if os.fstat(f.fileno()).st_size <= WAV_HEADER_BYTES:
+                return b''
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return mapped[WAV_HEADER_BYTES:]
+
+    def write(self, key: str, wav: bytes) -> None:
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        # Write-then-rename so concurrent readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(wav)
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self.PRUNE_EVERY == 0
+        if due:
+            self.prune()
+
+    def prune(self) -> None:
+        entries = []
+        total = 0
+        for path in self.directory.glob('*/*.wav'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        target = self.max_bytes * self.PRUNE_TO
+        for _, size, path in entries:
+            if total <= target:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self) -> None:
+        for path in self.directory.glob('*/*.wav'):
+            path.unlink(missing_ok=True)
+
+
+_cache: AudioCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> AudioCache | None:
+    """Return the shared cache, or None when ``TTS_CACHE_MAX_BYTES`` is 0."""
+    global _cache
+    if _cache is None:
+        if not settings.TTS_CACHE_MAX_BYTES:
+            return None
+        with _cache_lock:
+            if _cache is None:
+                _cache = AudioCache(settings.TTS_CACHE_DIR, settings.TTS_CACHE_MAX_BYTES)
+    return _cache
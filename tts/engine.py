@@ -0,0 +1,93 @@
+"""The speech engine interface and the registry that picks one.
+
+An engine turns plain text into mono float32 samples in [-1, 1] at its
+``sample_rate``. ``TTS_ENGINE`` names a built-in engine from
+:data:`ENGINES` or gives the dotted path of an :class:`Engine` subclass,
+so a network or GPU engine can be dropped in without touching the views.
+"""
+import threading
+from dataclasses import dataclass
+from typing import Dict
+
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+ENGINES = {
+    'formant': 'tts.formant.FormantEngine',
+}
+
+
+# Layout of a voice embedding (see tts.profiles): prosody and timbre, then the long-term spectrum
+EMBED_PITCH, EMBED_INTONATION, EMBED_FORMANT_SCALE, EMBED_RATE, EMBED_BREATHINESS = range(5)
+EMBED_SPECTRUM = slice(5, None)
+
+
+class UnknownVoice(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Voice:
+    name: str
+    label: str
+    pitch: float = 120.0          # mean fundamental frequency, Hz
+    formant_scale: float = 1.0    # vocal tract length: >1 is shorter and brighter
+    rate: float = 1.0             # speaking rate multiplier
+    breathiness: float = 0.05     # share of aspiration noise in voiced sounds
+    intonation: float = 1.0       # pitch range multiplier: <1 flatter, >1 livelier
+
+
+class Engine:
+    """Base class for speech engines."""
+    name = ''
+    # Part of the audio cache key: bump it whenever the engine's output changes
+    version = 1
+    sample_rate = 22050
+    voices: Dict[str, Voice] = {}
+
+    def get_voice(self, name: str | None = None) -> Voice:
+        """The named voice, or the default voice when ``name`` is empty."""
+        if not name:
+            return self.voices.get(settings.TTS_DEFAULT_VOICE) or next(iter(self.voices.values()))
+        try:
+            return self.voices[name]
+        except KeyError:
+            raise UnknownVoice(f"Unknown voice '{name}' for engine '{self.name}'") from None
+
+    def voice_from_embedding(self, name: str, label: str, embedding: np.ndarray) -> Voice:
+        """A voice that sounds like the speaker ``embedding`` was computed from.
+
+        Engines with a richer speaker model can override this and use the spectrum too.
+        """
+        return Voice(
+            name, label,
+            pitch=float(embedding[EMBED_PITCH]),
+            formant_scale=float(embedding[EMBED_FORMANT_SCALE]),
+            rate=float(embedding[EMBED_RATE]),
+            breathiness=float(embedding[EMBED_BREATHINESS]),
+            intonation=float(embedding[EMBED_INTONATION]),
+        )
+
+    def synthesize(self, text: str, voice: Voice) -> np.ndarray:
+        raise NotImplementedError
+
+
+_engines: Dict[str, Engine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(name: str | None = None) -> Engine:
+    """Return the shared instance of the named (default: configured) engine."""
+    name = name or settings.TTS_ENGINE
+    engine = _engines.get(name)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(name)
+            if engine is None:
+                try:
+                    cls = import_string(ENGINES.get(name, name))
+                except ImportError:
+                    raise ValueError(f"Unknown TTS_ENGINE '{name}'") from None
+                engine = _engines[name] = cls()
+    return engine
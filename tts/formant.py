@@ -0,0 +1,209 @@
+"""Offline reference engine: a NumPy formant synthesizer.
+
+Phonemes become control tracks sampled every ``HOP`` samples: three
+formant frequencies, voicing and noise amplitudes, and a noise band.
+Formant targets glide between neighbouring sounds, which gives the
+coarticulation. Voiced sound is additive: every harmonic of the pitch
+track up to ``VOICED_MAX_HZ`` gets an amplitude from the formant envelope
+at its frequency, and the harmonics are summed as a matrix of sines.
+Noise (fricatives, bursts, aspiration) is white noise shaped frame by
+frame in the frequency domain and overlap-added. There is no per-sample
+Python loop, so a second of speech costs a few tens of milliseconds of
+CPU time on one core.
+"""
+import zlib
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import numpy as np
+
+from . import text as text_frontend
+from .engine import Engine, Voice
+
+HOP = 110                    # control frame, samples (5 ms at 22050 Hz)
+BLOCK = 4096                 # samples rendered per harmonic matrix
+VOICED_MAX_HZ = 5000.0       # harmonics above this add little; the noise covers the top
+BANDWIDTHS = np.array([70.0, 100.0, 160.0])
+FORMANT_GAINS = np.array([1.0, 0.55, 0.3])
+NOISE_GAIN = 0.18
+OUTPUT_GAIN = 1.2
+NEUTRAL = (500.0, 1500.0, 2500.0)
+
+
+@dataclass(frozen=True)
+class Segment:
+    ms: float
+    formants: Tuple[float, float, float] | None   # None: glide between the neighbours
+    voice: float = 0.0
+    noise: float = 0.0
+    band: Tuple[float, float] = (1000.0, 8000.0)
+    vowel: bool = False
+
+
+def _vowel(ms, f1, f2, f3):
+    return [Segment(ms, (f1, f2, f3), voice=1.0, vowel=True)]
+
+
+def _sonorant(ms, f1, f2, f3, voice=0.6):
+    return [Segment(ms, (f1, f2, f3), voice=voice)]
+
+
+def _fricative(ms, band, noise, voice=0.0):
+    return [Segment(ms, None, voice=voice, noise=noise, band=band)]
+
+
+def _stop(band, voiced):
+    if voiced:
+        return [Segment(45, None, voice=0.12), Segment(12, None, voice=0.3, noise=0.35, band=band)]
+    return [Segment(60, None), Segment(15, None, noise=0.6, band=band), Segment(30, None, noise=0.18, band=(500, 6000))]
+
+
+PHONES = {
+    'iy': _vowel(115, 270, 2290, 3010), 'ih': _vowel(85, 390, 1990, 2550), 'eh': _vowel(95, 530, 1840, 2480),
+    'ae': _vowel(125, 660, 1720, 2410), 'ah': _vowel(85, 520, 1190, 2390), 'aa': _vowel(125, 730, 1090, 2440),
+    'ao': _vowel(120, 570, 840, 2410), 'uh': _vowel(85, 440, 1020, 2240), 'uw': _vowel(115, 300, 870, 2240),
+    'er': _vowel(125, 490, 1350, 1690),
+    'l': _sonorant(65, 360, 1300, 2700), 'r': _sonorant(65, 310, 1060, 1380), 'w': _sonorant(55, 290, 610, 2150),
+    'y': _sonorant(55, 260, 2070, 3020), 'm': _sonorant(70, 250, 1000, 2200, 0.4),
+    'n': _sonorant(65, 250, 1600, 2600, 0.4), 'ng': _sonorant(70, 250, 2000, 2700, 0.4),
+    'hh': _fricative(55, (400, 5000), 0.22), 'f': _fricative(95, (1500, 9000), 0.22),
+    'th': _fricative(85, (1500, 9000), 0.16), 's': _fricative(105, (4000, 10000), 0.5),
+    'sh': _fricative(105, (2000, 6500), 0.45), 'v': _fricative(70, (1500, 9000), 0.12, voice=0.35),
+    'dh': _fricative(55, (1500, 9000), 0.08, voice=0.4), 'z': _fricative(85, (4000, 10000), 0.3, voice=0.35),
+    'zh': _fricative(85, (2000, 6500), 0.28, voice=0.35),
+    'p': _stop((400, 2500), False), 't': _stop((3000, 8000), False), 'k': _stop((1500, 4500), False),
+    'b': _stop((400, 2500), True), 'd': _stop((3000, 8000), True), 'g': _stop((1500, 4500), True),
+    '|': [Segment(20, None)], '_': [Segment(180, None)], '__': [Segment(320, None)],
+}
+PHONES['ch'] = PHONES['t'][:1] + _fricative(90, (2000, 6500), 0.45)
+PHONES['jh'] = PHONES['d'][:1] + _fricative(80, (2000, 6500), 0.28, voice=0.35)
+
+
+def _segments(phonemes: List[str]) -> List[Segment]:
+    segments = [segment for phoneme in phonemes for segment in PHONES.get(phoneme, ())]
+    # Phrase-final lengthening: the last vowel of the sentence is held longer
+    for i in range(len(segments) - 1, -1, -1):
+        if segments[i].vowel:
+            last = segments[i]
+            segments[i] = Segment(last.ms * 1.5, last.formants, last.voice, last.noise, last.band, True)
+            break
+    return segments
+
+
+def _smooth(track: np.ndarray, frames: int) -> np.ndarray:
+    """Moving Hann-weighted average along axis 0, edge-padded so the length is unchanged."""
+    if frames < 2:
+        return track
+    kernel = np.hanning(frames + 2)[1:-1]
+    kernel /= kernel.sum()
+    pad = frames // 2
+    padded = np.pad(track, [(pad, frames - 1 - pad)] + [(0, 0)] * (track.ndim - 1), mode='edge')
+    if track.ndim == 1:
+        return np.convolve(padded, kernel, mode='valid')
+    return np.stack([np.convolve(padded[:, i], kernel, mode='valid') for i in range(track.shape[1])], axis=1)
+
+
+class FormantEngine(Engine):
+    name = 'formant'
+    sample_rate = 22050
+    voices = {
+        'alto': Voice('alto', 'Alto', pitch=185.0, formant_scale=1.12),
+        'soprano': Voice('soprano', 'Soprano', pitch=225.0, formant_scale=1.18, rate=1.05),
+        'tenor': Voice('tenor', 'Tenor', pitch=125.0, formant_scale=1.0),
+        'bass': Voice('bass', 'Bass', pitch=95.0, formant_scale=0.94, rate=0.95, breathiness=0.03),
+    }
+
+    def synthesize(self, text: str, voice: Voice) -> np.ndarray:
+        sentences = text_frontend.split_sentences(text_frontend.normalize(text))
+        rng = np.random.default_rng(zlib.crc32(f'{voice.name}:{text}'.encode('utf-8')))
+        pause = np.zeros(int(0.25 * self.sample_rate), dtype=np.float32)
+        parts = []
+        for sentence in sentences:
+            audio = self._sentence(sentence, voice, rng)
+            if audio.size:
+                parts.extend((audio, pause))
+        return np.concatenate(parts[:-1]) if parts else np.zeros(0, dtype=np.float32)
+
+    def _tracks(self, segments: List[Segment], voice: Voice):
+        frame_ms = 1000.0 * HOP / self.sample_rate
+        counts = [max(1, round(s.ms / voice.rate / frame_ms)) for s in segments]
+        formants = np.repeat(
+            np.array([s.formants or (np.nan,) * 3 for s in segments], dtype=np.float64), counts, axis=0,
+        )
+        # Consonants without targets of their own glide between the sounds around them
+        known = ~np.isnan(formants[:, 0])
+        if not known.any():
+            formants[:] = NEUTRAL
+        else:
+            index = np.arange(len(formants))
+            for i in range(3):
+                formants[:, i] = np.interp(index, index[known], formants[known, i])
+        formants = _smooth(formants, 8) * voice.formant_scale
+        voiced = _smooth(np.repeat([s.voice for s in segments], counts).astype(np.float64), 3)
+        noise = _smooth(np.repeat([s.noise for s in segments], counts).astype(np.float64), 2)
+        band = np.repeat(np.array([s.band for s in segments], dtype=np.float64), counts, axis=0)
+        return formants, voiced, noise, band
+
+    def _pitch(self, frames: int, voice: Voice, question: bool, rng: np.random.Generator) -> np.ndarray:
+        position = np.linspace(0.0, 1.0, frames)
+        # Declination over the sentence, a rise at the end of a question, and a little slow wander
+        contour = 1.1 - 0.22 * position
+        if question:
+            contour += np.clip((position - 0.75) * 1.6, 0.0, None)
+        t = np.arange(frames) * HOP / self.sample_rate
+        wander = 0.015 * np.sin(2 * np.pi * 4.5 * t + rng.uniform(0, 2 * np.pi))
+        return voice.pitch * (1.0 + (contour + wander - 1.0) * voice.intonation)
+
+    def _voiced(self, f0: np.ndarray, formants: np.ndarray, amplitude: np.ndarray) -> np.ndarray:
+        sr = self.sample_rate
+        n = len(f0) * HOP
+        k = np.arange(1, int(VOICED_MAX_HZ / f0.min()) + 1, dtype=np.float64)
+        freqs = f0[:, None] * k[None, :]
+        # A resonance's peak grows with its frequency, which offsets the source tilt below
+        envelope = 0.02 + sum(
+            gain * formants[:, i:i + 1] / 500.0 / (1.0 + ((freqs - formants[:, i:i + 1]) / (BANDWIDTHS[i] / 2)) ** 2)
+            for i, gain in enumerate(FORMANT_GAINS)
+        )
+        # Source tilt of about -6 dB per octave; nothing at or above the band limit
+        amps = envelope / k * amplitude[:, None] * (freqs < VOICED_MAX_HZ)
+
+        position = (np.arange(n) + 0.5) / HOP - 0.5
+        f0_samples = np.interp(position, np.arange(len(f0)), f0)
+        phase = 2 * np.pi * np.cumsum(f0_samples) / sr
+        out = np.empty(n, dtype=np.float64)
+        for start in range(0, n, BLOCK):
+            stop = min(n, start + BLOCK)
+            pos = np.clip(position[start:stop], 0, len(f0) - 1)
+            low = np.minimum(pos.astype(np.int64), max(len(f0) - 2, 0))
+            weight = (pos - low)[:, None]
+            high = np.minimum(low + 1, len(f0) - 1)
+            block_amps = amps[low] * (1 - weight) + amps[high] * weight
+            out[start:stop] = np.einsum('nk,nk->n', block_amps, np.sin(phase[start:stop, None] * k[None, :]))
+        return out
+
+    def _noise(self, noise: np.ndarray, band: np.ndarray, breath: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        frames = len(noise)
+        window = np.hanning(2 * HOP + 1)[:-1]
+        white = rng.standard_normal((frames, 2 * HOP)) * window
+        spectrum = np.fft.rfft(white, axis=1)
+        freqs = np.fft.rfftfreq(2 * HOP, 1.0 / self.sample_rate)[None, :]
+        centre = band.mean(axis=1, keepdims=True)
+        half = np.diff(band, axis=1) / 2
+        shaped = noise[:, None] / (1.0 + ((freqs - centre) / half) ** 6)
+        shaped += breath[:, None] / (1.0 + ((freqs - 2000.0) / 1800.0) ** 4)
+        grains = np.fft.irfft(spectrum * shaped, n=2 * HOP, axis=1)
+        # 50% overlap of periodic Hann windows sums to one
+        out = np.zeros((frames + 1) * HOP)
+        out[:frames * HOP] += grains[:, :HOP].ravel()
+        out[HOP:] += grains[:, HOP:].ravel()
+        return out[:frames * HOP] * NOISE_GAIN
+
+    def _sentence(self, sentence: str, voice: Voice, rng: np.random.Generator) -> np.ndarray:
+        segments = _segments(text_frontend.to_phonemes(sentence))
+        if not any(s.voice or s.noise for s in segments):
+            return np.zeros(0, dtype=np.float32)
+        formants, voiced, noise, band = self._tracks(segments, voice)
+        f0 = self._pitch(len(voiced), voice, sentence.rstrip().endswith('?'), rng)
+        audio = self._voiced(f0, formants, voiced) + self._noise(noise, band, voiced * voice.breathiness, rng)
+        # Fixed gain and a soft limiter, so loudness matches from one sentence (or request) to the next
+        return np.tanh(audio * OUTPUT_GAIN).astype(np.float32)
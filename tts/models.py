@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.db import models
+
+
+class VoiceProfile(models.Model):
+    """A user's cloned voice: the speaker embedding of their reference audio (see tts.profiles)."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='voice_profiles')
+    name = models.CharField(max_length=100)
+    # float32 vector in .npy format; the recording itself is not kept
+    embedding = models.BinaryField()
+    reference_seconds = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.user.email})"
@@ -0,0 +1,252 @@
+"""Sentence-pipelined speech: start speaking before the whole text exists.
+
+Text arrives in pieces (LLM deltas, or one piece for a stored message).
+:class:`SentenceSegmenter` cuts off each sentence as soon as it is
+complete. :class:`SpeechPipeline` synthesizes those sentences on the
+worker farm (``tts.workers``), up to ``TTS_PIPELINE_DEPTH`` at a time per
+stream, and hands the audio back strictly in order. The first sentence
+can therefore play while the model is still writing the second and a
+worker is rendering the third. Rendered sentences go through the audio
+cache (``tts.cache``); the workers write it, the request side reads it.
+
+A whole message, streamed or not, is always rendered sentence by sentence,
+so :func:`render_wav` and :func:`stream_wav` produce the same audio, and
+both reuse sentences that :func:`pregenerate` already rendered.
+"""
+import logging
+import re
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Deque, Iterator, List
+
+import numpy as np
+from django.conf import settings
+
+from chat import metrics
+
+from . import audio, cache as audio_cache, workers
+from .engine import Engine, Voice, get_engine
+
+logger = logging.getLogger(__name__)
+
+# Sentence end: terminal punctuation before whitespace, or a line break
+_BOUNDARY_RE = re.compile(r'[.!?;:](?=\s)|\n')
+_WORD_RE = re.compile(r'\w+')
+# Sentences shorter than this many words ("1.", "Hi!") wait for the next one
+MIN_WORDS = 2
+# With no boundary in sight, a clause this long is cut at its last comma or space
+MAX_CHARS = 240
+SENTENCE_PAUSE = 0.25
+
+
+class SentenceSegmenter:
+    """Turns a stream of text pieces into complete sentences."""
+
+    def __init__(self):
+        self._buffer = ''
+
+    def feed(self, piece: str) -> List[str]:
+        """Add ``piece`` and return the sentences it completed."""
+        self._buffer += piece
+        sentences = []
+        start = 0
+        for match in _BOUNDARY_RE.finditer(self._buffer):
+            candidate = self._buffer[start:match.end()]
+            # Never split inside a code fence; the whole block is dropped when spoken
+            if self._buffer[:match.end()].count('```') % 2:
+                continue
+            if len(_WORD_RE.findall(candidate)) >= MIN_WORDS:
+                sentences.append(candidate.strip())
+                start = match.end()
+        self._buffer = self._buffer[start:]
+        if len(self._buffer) > MAX_CHARS and self._buffer.count('```') % 2 == 0:
+            cut = max(self._buffer.rfind(',', 0, MAX_CHARS), self._buffer.rfind(' ', 0, MAX_CHARS))
+            if cut > 0:
+                sentences.append(self._buffer[:cut + 1].strip())
+                self._buffer = self._buffer[cut + 1:]
+        return [s for s in sentences if s]
+
+    def flush(self) -> List[str]:
+        """Whatever is left once the text is complete."""
+        rest, self._buffer = self._buffer.strip(), ''
+        return [rest] if rest else []
+
+
+def _engine_path(engine: Engine) -> str:
+    # Workers build their own engine instance from this
+    return f'{type(engine).__module__}.{type(engine).__qualname__}'
+
+
+def _render_sentence(engine_path: str, voice: Voice, text: str, cache_key: str | None) -> bytes:
+    """Worker side: ``text`` as 16-bit PCM followed by the pause that separates sentences."""
+    engine = get_engine(engine_path)
+    samples = engine.synthesize(text, voice)
+    if samples.size:
+        pause = np.zeros(int(SENTENCE_PAUSE * engine.sample_rate), dtype=np.float32)
+        samples = np.concatenate((samples, pause))
+    pcm = audio.pcm16(samples)
+    cache = audio_cache.get_cache()
+    if cache_key and cache:
+        cache.write(cache_key, audio.wav_header(engine.sample_rate, len(pcm)) + pcm)
+    return pcm
+
+
+def render_pcm(engine: Engine, voice: Voice, text: str, user: Any = None,
+               priority: str = workers.INTERACTIVE) -> Future:
+    """A future of one sentence's PCM: already resolved on a cache hit, else a job on the worker farm.
+
+    Raises :class:`tts.workers.Saturated` when the farm has no room for the job.
+    """
+    cache = audio_cache.get_cache()
+    key = None
+    if cache:
+        key = audio_cache.make_key(engine, voice, text, kind='sentence')
+        pcm = cache.read_pcm(key)
+        if pcm is not None:
+            hit = Future()
+            hit.set_result(pcm)
+            return hit
+    return workers.get_farm().submit(
+        _render_sentence, _engine_path(engine), voice, text, key, user=user, priority=priority,
+    )
+
+
+def _store(engine: Engine, cache_key: str | None, parts: List[bytes]) -> bytes:
+    """The sentences' PCM as one WAV file, written to the audio cache under ``cache_key`` if given."""
+    data = b''.join(parts)
+    wav = audio.wav_header(engine.sample_rate, len(data)) + data
+    cache = audio_cache.get_cache()
+    if cache_key and cache:
+        cache.write(cache_key, wav)
+    return wav
+
+
+def render_wav(engine: Engine, voice: Voice, text: str, cache_key: str | None = None, user: Any = None) -> bytes:
+    """``text`` as a complete WAV file, rendered on the worker farm; stored under ``cache_key`` if given.
+
+    Raises :class:`tts.workers.Saturated` when the farm has no room for the first sentence.
+    """
+    workers.get_farm().check()
+    pipeline = SpeechPipeline(engine, voice, user=user)
+    pipeline.feed(text)
+    pipeline.close()
+    try:
+        parts = list(pipeline.drain())
+    finally:
+        pipeline.cancel()
+    return _store(engine, cache_key, parts)
+
+
+def pregenerate(engine: Engine, voice: Voice, text: str, user: Any = None) -> None:
+    """Warm the sentence cache for ``text`` at low priority, without waiting; a full queue skips the rest."""
+    segmenter = SentenceSegmenter()
+    for sentence in segmenter.feed(text) + segmenter.flush():
+        try:
+            render_pcm(engine, voice, sentence, user, workers.PREGENERATE)
+        except workers.Saturated:
+            return
+
+
+class SpeechPipeline:
+    """Synthesizes the sentences of a growing text concurrently and returns their audio in order."""
+
+    def __init__(self, engine: Engine, voice: Voice, depth: int | None = None, user: Any = None):
+        self.engine = engine
+        self.voice = voice
+        self.depth = depth or settings.TTS_PIPELINE_DEPTH
+        self.user = user
+        self._segmenter = SentenceSegmenter()
+        self._waiting: Deque[str] = deque()
+        self._running: Deque[Future] = deque()
+        self._first_sentence_at: float | None = None
+        self._spoken = False
+
+    def feed(self, piece: str) -> None:
+        self._waiting.extend(self._segmenter.feed(piece))
+        self._submit()
+
+    def close(self) -> None:
+        """Mark the text complete; its last, unterminated sentence is queued too."""
+        self._waiting.extend(self._segmenter.flush())
+        self._submit()
+
+    def _submit(self) -> None:
+        if self._waiting and self._first_sentence_at is None:
+            self._first_sentence_at = time.perf_counter()
+        while self._waiting and len(self._running) < self.depth:
+            try:
+                future = render_pcm(self.engine, self.voice, self._waiting[0], self.user)
+            except workers.Saturated:
+                # Backpressure: the sentence keeps its place and is offered again later
+                return
+            self._waiting.popleft()
+            self._running.append(future)
+
+    def _pop(self) -> bytes:
+        pcm = self._running.popleft().result()
+        self._submit()
+        if not self._spoken and pcm:
+            self._spoken = True
+            metrics.TTS_FIRST_AUDIO.observe(time.perf_counter() - self._first_sentence_at, engine=self.engine.name)
+        return pcm
+
+    def ready(self) -> Iterator[bytes]:
+        """Audio that is already rendered and next in line, without waiting."""
+        while self._running and self._running[0].done():
+            pcm = self._pop()
+            if pcm:
+                yield pcm
+
+    def drain(self) -> Iterator[bytes]:
+        """All remaining audio, in order, waiting for each sentence as needed. Call after :meth:`close`.
+
+        Raises :class:`tts.workers.Saturated` if the worker farm stays full for ``TTS_QUEUE_TIMEOUT`` seconds.
+        """
+        deadline = None
+        while self._running or self._waiting:
+            if not self._running:
+                # Every sentence left was turned away: wait for the farm to free a slot, but not forever
+                if deadline is None:
+                    deadline = time.monotonic() + settings.TTS_QUEUE_TIMEOUT
+                workers.get_farm().wait_for_room(timeout=max(0.0, deadline - time.monotonic()))
+                self._submit()
+                continue
+            deadline = None
+            pcm = self._pop()
+            if pcm:
+                yield pcm
+
+    def cancel(self) -> None:
+        """Drop queued sentences, for when the listener has gone away."""
+        self._waiting.clear()
+        for future in self._running:
+            future.cancel()
+        self._running.clear()
+
+
+def stream_wav(engine: Engine, voice: Voice, text: str, cache_key: str | None = None,
+               user: Any = None) -> Iterator[bytes]:
+    """A WAV file of ``text`` as a stream of chunks, one sentence at a time.
+
+    With ``cache_key``, a stream that runs to the end is stored in the audio cache as a whole
+    file: the same bytes :func:`render_wav` returns, apart from the header's unknown length.
+    Its status has been sent by the time the worker farm could turn it away, so a stream held
+    up for ``TTS_QUEUE_TIMEOUT`` just ends early, a valid but shorter file that is not cached.
+    """
+    pipeline = SpeechPipeline(engine, voice, user=user)
+    pipeline.feed(text)
+    pipeline.close()
+    parts = []
+    try:
+        yield audio.wav_header(engine.sample_rate)
+        for pcm in pipeline.drain():
+            parts.append(pcm)
+            yield pcm
+    except workers.Saturated:
+        logger.warning('speech stream cut short: the worker farm stayed at capacity')
+        return
+    finally:
+        pipeline.cancel()
+    if cache_key:
+        _store(engine, cache_key, parts)
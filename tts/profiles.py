@@ -0,0 +1,276 @@
+"""Cloned voices: speaker embeddings computed once from reference audio.
+
+A user uploads a recording of themselves reading a paragraph or so. The
+recording is analysed once, in a speech worker, into a small float32
+vector (layout in :mod:`tts.engine`):
+
+* median pitch, and how widely it moves, relative to the engine's own range;
+* vocal tract length, from the centroid of the spectral envelope;
+* speaking rate, from syllable nuclei per second of speech;
+* breathiness, from how periodic the voiced frames are;
+* the long-term average spectrum, for engines that can use it.
+
+The features are rough by design: they steer an engine's voice towards
+the speaker, they do not model it. Only the vector is kept (as ``.npy``
+bytes on :class:`tts.models.VoiceProfile`), never the recording. Speaking
+with a profile loads its vector through an in-process LRU, so a warm
+profile costs no database read and no audio analysis.
+"""
+import io
+import struct
+import threading
+import wave
+from collections import OrderedDict
+from typing import Tuple
+
+import numpy as np
+from django.conf import settings
+
+from chat import metrics
+
+from .engine import (
+    EMBED_BREATHINESS, EMBED_FORMANT_SCALE, EMBED_INTONATION, EMBED_PITCH, EMBED_RATE, EMBED_SPECTRUM,
+    Engine, UnknownVoice, Voice,
+)
+from .models import VoiceProfile
+
+# Voice names of the form profile-<id> refer to a VoiceProfile
+PREFIX = 'profile-'
+
+MIN_SECONDS = 3.0
+# Uploads above this rate are analysed at it: every feature lies below 8 kHz, and it is
+# the rate the reference constants below were measured at
+ANALYSIS_RATE = 22050
+# Frames analysed at once, which bounds the FFT matrices to a few megabytes
+CHUNK_FRAMES = 512
+FRAME_SECONDS = 0.04
+HOP_SECONDS = 0.01
+SPECTRUM_BANDS = 24
+# The same analysis run over the formant engine's tenor voice (formant_scale, rate and
+# intonation 1.0), so that a speaker maps onto the engine's own scale
+REFERENCE_CENTROID = 1180.0      # Hz, spectral envelope centroid between 250 and 4000 Hz
+REFERENCE_SYLLABLE_RATE = 4.45   # syllable nuclei per second of speech
+REFERENCE_PITCH_RANGE = 0.16     # octaves between the quartiles of the pitch track
+REFERENCE_APERIODICITY = 0.03
+
+
+class InvalidReference(ValueError):
+    pass
+
+
+def read_wav(data: bytes) -> Tuple[np.ndarray, int]:
+    """Mono float64 samples and the sample rate of a PCM WAV file, cut to ``TTS_PROFILE_MAX_SECONDS``."""
+    try:
+        with wave.open(io.BytesIO(data)) as f:
+            width, channels, rate = f.getsampwidth(), f.getnchannels(), f.getframerate()
+            if not channels or not rate:
+                raise wave.Error('no audio')
+            # Frames past the analysed length are never decoded
+            frames = f.readframes(min(f.getnframes(), int(settings.TTS_PROFILE_MAX_SECONDS * rate)))
+    except (wave.Error, EOFError, ValueError, struct.error, OverflowError):
+        raise InvalidReference('Not a readable PCM WAV file') from None
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float64) - 128) / 128
+    elif width in (2, 4):
+        samples = np.frombuffer(frames[:len(frames) // width * width], dtype=f'<i{width}').astype(np.float64)
+        samples /= 2 ** (8 * width - 1)
+    else:
+        raise InvalidReference('Only 8, 16 and 32-bit PCM WAV files are supported')
+    if channels > 1:
+        samples = samples[:len(samples) // channels * channels].reshape(-1, channels).mean(axis=1)
+    return samples, rate
+
+
+def _downsample(samples: np.ndarray, sample_rate: int) -> Tuple[np.ndarray, int]:
+    """``samples`` at ``ANALYSIS_RATE`` if they are above it: low-pass filtered, then interpolated."""
+    if sample_rate <= ANALYSIS_RATE:
+        return samples, sample_rate
+    # Windowed-sinc low-pass a little under the new Nyquist frequency, so nothing aliases
+    cutoff = 0.45 * ANALYSIS_RATE / sample_rate
+    taps = np.arange(-32, 33)
+    kernel = 2 * cutoff * np.sinc(2 * cutoff * taps) * np.hamming(len(taps))
+    filtered = np.convolve(samples, kernel / kernel.sum(), mode='same')
+    positions = np.arange(int(len(samples) * ANALYSIS_RATE / sample_rate)) * (sample_rate / ANALYSIS_RATE)
+    return np.interp(positions, np.arange(len(samples)), filtered), ANALYSIS_RATE
+
+
+def _syllable_nuclei(level: np.ndarray, active: np.ndarray) -> int:
+    """Peaks of a dB envelope that rise 5 dB over the dip before them, at least 80 ms apart."""
+    count, last, dip = 0, -8, level[0]
+    for i in range(1, len(level) - 1):
+        dip = min(dip, level[i])
+        if active[i] and level[i] >= level[i - 1] and level[i] > level[i + 1] and level[i] - dip > 5 and i - last >= 8:
+            count, last, dip = count + 1, i, level[i]
+    return count
+
+
+def compute_embedding(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """The speaker embedding of a recording; raises :class:`InvalidReference` if it holds too little speech.
+
+    The analysis runs at ``ANALYSIS_RATE`` at most, ``CHUNK_FRAMES`` frames at a time, so its
+    memory stays small and flat whatever the rate and length of the upload.
+    """
+    if len(samples) < MIN_SECONDS * sample_rate:
+        raise InvalidReference(f'The reference audio must be at least {MIN_SECONDS:g} seconds long')
+    samples = samples[:int(settings.TTS_PROFILE_MAX_SECONDS * sample_rate)]
+    samples, sample_rate = _downsample(samples, sample_rate)
+    samples = samples - samples.mean()
+    samples /= np.abs(samples).max() or 1.0
+
+    frame, hop = int(FRAME_SECONDS * sample_rate), int(HOP_SECONDS * sample_rate)
+    window = np.hanning(frame)
+    # A view: frames are only materialized a chunk at a time
+    windows = np.lib.stride_tricks.sliding_window_view(samples, frame)[::hop]
+    chunks = [slice(i, i + CHUNK_FRAMES) for i in range(0, len(windows), CHUNK_FRAMES)]
+    rms = np.concatenate([np.sqrt(((windows[c] * window) ** 2).mean(axis=1)) for c in chunks])
+    active = rms > rms.max() * 0.05
+
+    n = 2 * frame
+    freqs = np.fft.rfftfreq(n, 1.0 / sample_rate)
+    window_ac = np.fft.irfft(np.abs(np.fft.rfft(window, n=n)) ** 2, n=n)[:frame]
+    low, high = sample_rate // 400, min(sample_rate // 60, frame // 2)
+    lifter = int(0.0015 * sample_rate)
+    speech_band = (freqs > 300) & (freqs < 2500)
+    lag = np.empty(len(windows), dtype=np.int64)
+    periodicity = np.empty(len(windows))
+    has_peak = np.empty(len(windows), dtype=bool)
+    level = np.empty(len(windows))
+    envelope_sum = np.zeros(len(freqs))
+    power_sum = np.zeros(len(freqs))
+    for c in chunks:
+        spectrum = np.fft.rfft(windows[c] * window, n=n)
+        power = np.abs(spectrum) ** 2
+
+        # Pitch: autocorrelation, corrected for the window's own taper
+        ac = np.fft.irfft(power, n=n)[:, :frame]
+        ac = ac / np.maximum(ac[:, :1], 1e-12) / (window_ac / window_ac[0] + 1e-3)
+        lags = ac[:, low:high]
+        peaks = (lags[:, 1:-1] >= lags[:, :-2]) & (lags[:, 1:-1] >= lags[:, 2:])
+        # The shortest lag near the best one, so that a multiple of the period is never taken for it
+        peaks &= lags[:, 1:-1] >= 0.9 * lags.max(axis=1, keepdims=True)
+        lag[c] = np.argmax(peaks, axis=1) + 1 + low
+        periodicity[c] = np.clip(ac[np.arange(len(ac)), lag[c]], 0.0, 1.0)
+        has_peak[c] = peaks.any(axis=1)
+        voiced = active[c] & has_peak[c] & (periodicity[c] > 0.5)
+
+        # Vocal tract length: cepstrally smoothed spectral envelope of voiced frames
+        if voiced.any():
+            cepstrum = np.fft.irfft(np.log(np.abs(spectrum[voiced]) + 1e-9), n=n)
+            cepstrum[:, lifter:n - lifter] = 0.0
+            envelope_sum += (np.exp(np.fft.rfft(cepstrum, n=n).real) ** 2).sum(axis=0)
+
+        level[c] = 10 * np.log10(power[:, speech_band].sum(axis=1) + 1e-12)
+        power_sum += power[active[c]].sum(axis=0)
+
+    voiced = active & has_peak & (periodicity > 0.5)
+    if voiced.sum() < 50:
+        raise InvalidReference('Not enough clear speech in the reference audio')
+    octaves = np.log2(sample_rate / lag[voiced])
+    pitch_range = np.subtract(*np.percentile(octaves, [75, 25]))
+
+    band = (freqs > 250) & (freqs < 4000)
+    centroid = (envelope_sum[band] * freqs[band]).sum() / envelope_sum[band].sum()
+
+    # Speaking rate: syllable nuclei in the smoothed 300-2500 Hz level
+    kernel = np.hanning(7)[1:-1]
+    level = np.convolve(level, kernel / kernel.sum(), mode='same')
+    syllable_rate = _syllable_nuclei(level, active) / (active.sum() * HOP_SECONDS)
+
+    # Long-term average spectrum of speech in log-spaced bands, level-normalized
+    edges = np.geomspace(100.0, min(8000.0, sample_rate / 2), SPECTRUM_BANDS + 1)
+    mean_power = power_sum / active.sum()
+    bands = np.array([mean_power[(freqs >= lo) & (freqs < hi)].sum() for lo, hi in zip(edges[:-1], edges[1:])])
+    ltas = 10 * np.log10(bands + 1e-12)
+
+    embedding = np.zeros(EMBED_SPECTRUM.start + SPECTRUM_BANDS, dtype=np.float32)
+    embedding[EMBED_PITCH] = 2 ** np.median(octaves)
+    embedding[EMBED_INTONATION] = np.clip(pitch_range / REFERENCE_PITCH_RANGE, 0.5, 2.0)
+    embedding[EMBED_FORMANT_SCALE] = np.clip(centroid / REFERENCE_CENTROID, 0.85, 1.25)
+    embedding[EMBED_RATE] = np.clip(syllable_rate / REFERENCE_SYLLABLE_RATE, 0.75, 1.35)
+    embedding[EMBED_BREATHINESS] = np.clip(
+        0.05 * (1.0 - np.median(periodicity[voiced])) / REFERENCE_APERIODICITY, 0.02, 0.12,
+    )
+    embedding[EMBED_SPECTRUM] = ltas - ltas.mean()
+    return embedding
+
+
+def to_bytes(embedding: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    np.save(buf, embedding, allow_pickle=False)
+    return buf.getvalue()
+
+
+def from_bytes(data: bytes) -> np.ndarray:
+    return np.load(io.BytesIO(data), allow_pickle=False)
+
+
+def embed_wav(data: bytes) -> Tuple[bytes, float]:
+    """Worker side: the serialized embedding of a WAV file, and the seconds of audio it used."""
+    samples, sample_rate = read_wav(data)
+    try:
+        embedding = compute_embedding(samples, sample_rate)
+    except InvalidReference:
+        raise
+    except (ArithmeticError, IndexError, ValueError) as e:
+        # Degenerate audio that passed the checks is still a bad upload, not a server error
+        raise InvalidReference('Could not analyse the reference audio') from e
+    return to_bytes(embedding), min(len(samples) / sample_rate, settings.TTS_PROFILE_MAX_SECONDS)
+
+
+# profile id -> (owner's user id, label, embedding); rows are never updated, only deleted
+_local: "OrderedDict[int, Tuple[int, str, np.ndarray]]" = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _load(profile_id: int) -> Tuple[int, str, np.ndarray] | None:
+    with _local_lock:
+        entry = _local.get(profile_id)
+        if entry is not None:
+            _local.move_to_end(profile_id)
+            metrics.CACHE_REQUESTS.inc(cache='voice_profile', namespace='local', result='hit')
+            return entry
+    metrics.CACHE_REQUESTS.inc(cache='voice_profile', namespace='local', result='miss')
+    row = VoiceProfile.objects.filter(id=profile_id).values_list('user_id', 'name', 'embedding').first()
+    if row is None:
+        return None
+    entry = (row[0], row[1], from_bytes(bytes(row[2])))
+    with _local_lock:
+        _local[profile_id] = entry
+        _local.move_to_end(profile_id)
+        while len(_local) > settings.TTS_PROFILE_CACHE_SIZE:
+            _local.popitem(last=False)
+    return entry
+
+
+def evict(profile_id: int) -> None:
+    with _local_lock:
+        _local.pop(profile_id, None)
+
+
+def on_profile_deleted(sender, instance, **kwargs) -> None:
+    # Other processes keep serving the profile until their LRU drops it; it is only ever the owner's
+    evict(instance.id)
+
+
+def voice_name(profile_id: int) -> str:
+    return f'{PREFIX}{profile_id}'
+
+
+def user_voice(engine: Engine, user, name: str | None = None) -> Voice:
+    """The voice called ``name`` for ``user``: a built-in voice, or one of their profiles.
+
+    Without a name, the user's selected profile, then their preferred built-in voice, then the default.
+    Raises :class:`tts.engine.UnknownVoice` for names that are neither.
+    """
+    if not name:
+        if user.voice_profile_id:
+            name = voice_name(user.voice_profile_id)
+        elif user.preferred_voice in engine.voices:
+            name = user.preferred_voice
+    if not name or not name.startswith(PREFIX):
+        return engine.get_voice(name)
+    profile_id = name[len(PREFIX):]
+    entry = _load(int(profile_id)) if profile_id.isdigit() else None
+    if entry is None or entry[0] != user.id:
+        raise UnknownVoice(f"Unknown voice '{name}'")
+    return engine.voice_from_embedding(name, entry[1], entry[2])
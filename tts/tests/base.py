@@ -0,0 +1,63 @@
+"""Shared fixtures: an assistant message to speak, and a speech worker farm writing to a scratch cache."""
+import os
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from chat.models import Chat, Message
+from tts import cache as audio_cache, profiles, workers
+
+
+def _stop_farm():
+    farm, workers._farm = workers._farm, None
+    if farm is not None:
+        farm._pool.shutdown(wait=True, cancel_futures=True)
+    audio_cache._cache = None
+
+
+def use_speech_workers(cls, **overrides):
+    """Give test class ``cls`` its own audio cache directory and a one-process worker farm, started on first use."""
+    tmp = tempfile.TemporaryDirectory()
+    cls.addClassCleanup(tmp.cleanup)
+    cls.cache_dir = tmp.name
+    # Workers are spawned processes: they read settings from the environment, not override_settings
+    environ = mock.patch.dict(os.environ, {'TTS_CACHE_DIR': tmp.name})
+    environ.start()
+    cls.addClassCleanup(environ.stop)
+    speech = override_settings(**{'TTS_CACHE_DIR': tmp.name, 'TTS_WORKERS': 1, 'TTS_QUEUE_MAX': 64, **overrides})
+    speech.enable()
+    cls.addClassCleanup(speech.disable)
+    _stop_farm()
+    cls.addClassCleanup(_stop_farm)
+
+
+def clear_speech_cache():
+    cache = audio_cache.get_cache()
+    if cache:
+        cache.clear()
+    profiles._local.clear()
+
+
+class SpeechTestCase(TestCase):
+    """A signed-in user with an assistant message to speak, and speech workers of its own."""
+    speech_settings = {}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        use_speech_workers(cls, **cls.speech_settings)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email='ada@example.com', password='secret')
+        cls.chat = Chat.objects.create(user=cls.user, title='Speech')
+        Message.objects.create(chat=cls.chat, role='user', content='Say something.')
+        cls.message = Message.objects.create(
+            chat=cls.chat, role='assistant', content='Hello there, this is a test. How are you today?',
+        )
+
+    def setUp(self):
+        clear_speech_cache()
+        self.client.force_login(self.user)
@@ -0,0 +1,192 @@
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.signals import request_finished
+from django.db import close_old_connections
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+
+from tts import cache as audio_cache, pipeline, workers
+from tts.engine import get_engine
+
+from .base import SpeechTestCase
+
+
+class MakeKeyTests(SimpleTestCase):
+    def setUp(self):
+        self.engine = get_engine('formant')
+        self.voice = self.engine.get_voice('alto')
+
+    def test_text_is_keyed_as_it_is_spoken(self):
+        self.assertEqual(
+            audio_cache.make_key(self.engine, self.voice, '**Hello** there, [friend](https://example.com)!'),
+            audio_cache.make_key(self.engine, self.voice, 'Hello there, friend!'),
+        )
+
+    def test_voice_kind_and_engine_version_change_the_key(self):
+        key = audio_cache.make_key(self.engine, self.voice, 'Hello there')
+
+        self.assertNotEqual(key, audio_cache.make_key(self.engine, self.engine.get_voice('bass'), 'Hello there'))
+        self.assertNotEqual(key, audio_cache.make_key(self.engine, self.voice, 'Hello there', kind='sentence'))
+        with mock.patch.object(type(self.engine), 'version', 2):
+            self.assertNotEqual(key, audio_cache.make_key(self.engine, self.voice, 'Hello there'))
+
+
+class AudioCacheTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache = audio_cache.AudioCache(tmp.name, max_bytes=10_000)
+
+    def entry(self, key, size=1000):
+        self.cache.write(key, b'H' * audio_cache.WAV_HEADER_BYTES + b'p' * size)
+
+    def test_round_trip(self):
+        self.assertIsNone(self.cache.open('ab12'))
+        self.entry('ab12', size=10)
+
+        with self.cache.open('ab12') as f:
+            self.assertEqual(f.read(), b'H' * 44 + b'p' * 10)
+        self.assertEqual(self.cache.read_pcm('ab12'), b'p' * 10)
+        self.assertTrue(os.path.exists(os.path.join(self.cache.directory, 'ab', 'ab12.wav')))
+
+    def test_an_empty_entry_has_no_samples(self):
+        self.cache.write('cd34', b'H' * 44)
+
+        self.assertEqual(self.cache.read_pcm('cd34'), b'')
+
+    def test_prune_drops_the_least_recently_used(self):
+        now = time.time()
+        for n in range(12):
+            self.entry(f'{n:02d}')
+            os.utime(self.cache._path(f'{n:02d}'), (now - 100 + n, now - 100 + n))
+        # Reading an old entry makes it recent
+        self.cache.open('00').close()
+
+        self.cache.prune()
+
+        left = sorted(p.stem for p in self.cache.directory.glob('*/*.wav'))
+        self.assertEqual(left, ['00', '05', '06', '07', '08', '09', '10', '11'])
+
+    def test_prune_runs_every_so_many_writes(self):
+        with mock.patch.object(self.cache, 'PRUNE_EVERY', 3), mock.patch.object(self.cache, 'prune') as prune:
+            for n in range(7):
+                self.entry(f'{n:02d}')
+
+        self.assertEqual(prune.call_count, 2)
+
+    @override_settings(TTS_CACHE_MAX_BYTES=0)
+    def test_a_zero_size_disables_the_cache(self):
+        with mock.patch.object(audio_cache, '_cache', None):
+            self.assertIsNone(audio_cache.get_cache())
+
+
+class CachedSpeechTests(SpeechTestCase):
+    def speak(self, view='chat:message_speech', **headers):
+        return self.client.get(reverse(view, args=[self.message.id]), headers=headers)
+
+    def key(self):
+        engine = get_engine()
+        return audio_cache.make_key(engine, engine.get_voice(), self.message.content)
+
+    def test_files_carry_a_strong_etag(self):
+        response = self.speak()
+
+        self.assertEqual(response['ETag'], f'"{self.key()}"')
+        self.assertEqual(response['Cache-Control'], 'private, max-age=86400')
+        self.assertNotIn('X-Accel-Buffering', response)
+
+    def test_repeats_are_served_from_the_cache(self):
+        first = b''.join(self.speak().streaming_content)
+
+        with mock.patch.object(workers, 'get_farm') as get_farm:
+            second = b''.join(self.speak().streaming_content)
+            streamed = self.speak('chat:message_speech_stream')
+
+        get_farm.assert_not_called()
+        self.assertEqual(second, first)
+        # A cached message is sent as a file even from the streaming endpoint
+        self.assertEqual(streamed['ETag'], f'"{self.key()}"')
+        self.assertEqual(b''.join(streamed.streaming_content), first)
+
+    def test_the_stream_matches_the_file_apart_from_its_length(self):
+        response = self.speak('chat:message_speech_stream')
+        streamed = b''.join(response.streaming_content)
+
+        self.assertEqual(response['ETag'], f'W/"{self.key()}"')
+        self.assertEqual(response['X-Accel-Buffering'], 'no')
+        rendered = b''.join(self.speak().streaming_content)
+        self.assertEqual(streamed[44:], rendered[44:])
+        self.assertEqual(streamed[40:44], b'\xff\xff\xff\xff')
+
+    def test_a_finished_stream_is_cached_for_next_time(self):
+        streamed = b''.join(self.speak('chat:message_speech_stream').streaming_content)
+
+        cached = audio_cache.get_cache().open(self.key())
+        self.assertIsNotNone(cached)
+        with cached:
+            self.assertEqual(cached.read()[44:], streamed[44:])
+
+    def test_clients_that_have_the_audio_get_a_304(self):
+        for tag in (f'"{self.key()}"', f'W/"{self.key()}"', f'"other", "{self.key()}"'):
+            with self.subTest(tag=tag):
+                self.assertEqual(self.speak(**{'If-None-Match': tag}).status_code, 304)
+                self.assertEqual(self.speak('chat:message_speech_stream', **{'If-None-Match': tag}).status_code, 304)
+        self.assertEqual(self.speak(**{'If-None-Match': '"other"'}).status_code, 200)
+
+    def test_cached_files_are_left_for_sendfile(self):
+        b''.join(self.speak().streaming_content)
+        # As the test client does: the test's transaction must outlive the request
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+        cookie = '; '.join(f'{m.key}={m.value}' for m in self.client.cookies.values())
+        request = RequestFactory().get(reverse('chat:message_speech', args=[self.message.id]), HTTP_COOKIE=cookie)
+
+        with self.assertLogs('chat.timing', 'INFO') as logs:
+            # The whole middleware stack, without the test client's own wrapping of the body
+            response = WSGIHandler().get_response(request)
+            self.assertIsNotNone(response.file_to_stream)
+            body = response.file_to_stream.read()
+            self.assertEqual(logs.records, [])
+            response.close()
+
+        with audio_cache.get_cache().open(self.key()) as cached:
+            self.assertEqual(body, cached.read())
+        self.assertEqual(json.loads(logs.records[-1].getMessage())['bytes_out'], len(body))
+
+    def test_sentences_are_shared_between_messages(self):
+        engine = get_engine()
+        voice = engine.get_voice()
+        pipeline.pregenerate(engine, voice, 'Hello there, this is a test. A different ending.')
+        key = audio_cache.make_key(engine, voice, 'Hello there, this is a test.', kind='sentence')
+        for _ in range(100):
+            if audio_cache.get_cache().read_pcm(key) is not None:
+                break
+            time.sleep(0.05)
+
+        with mock.patch.object(workers.WorkerFarm, 'submit', wraps=workers.get_farm().submit) as submit:
+            b''.join(self.speak().streaming_content)
+
+        # Only "How are you today?" still had to be rendered
+        self.assertEqual(submit.call_count, 1)
+
+
+@override_settings(TTS_CACHE_MAX_BYTES=0)
+class UncachedSpeechTests(SpeechTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(audio_cache, '_cache', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_audio_is_rendered_every_time(self):
+        response = self.client.get(reverse('chat:message_speech', args=[self.message.id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.content[:4], b'RIFF')
+        self.assertEqual(os.listdir(self.cache_dir), [])
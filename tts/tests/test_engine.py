@@ -0,0 +1,129 @@
+import io
+import struct
+import wave
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from chat.models import Message
+from tts import audio, text
+from tts.engine import UnknownVoice, get_engine
+from tts.formant import FormantEngine
+
+from .base import SpeechTestCase
+
+
+class TextTests(SimpleTestCase):
+    def test_markdown_links_and_code_are_not_spoken(self):
+        spoken = text.normalize('## **Step one**: see [the docs](https://example.com)\n```\nrm -rf /\n```\nDone')
+
+        self.assertEqual(text.split_sentences(spoken), ['Step one :', 'see the docs.', 'Done'])
+
+    def test_urls_numbers_and_symbols_are_said_in_words(self):
+        self.assertEqual(text.normalize('Visit https://example.com'), 'Visit link')
+        self.assertEqual(text.normalize('42 is 3.5% of 1200'),
+                         'forty two is three point five percent of one thousand two hundred')
+        self.assertEqual(text.normalize('salt & pepper'), 'salt and pepper')
+
+    def test_bullets_become_sentences(self):
+        self.assertEqual(text.split_sentences(text.normalize('- first point\n- second point')),
+                         ['first point.', 'second point'])
+
+    def test_split_sentences(self):
+        self.assertEqual(text.split_sentences('Hi there! How are you? Fine; thanks. ...'),
+                         ['Hi there!', 'How are you?', 'Fine;', 'thanks.'])
+
+    def test_letter_to_sound(self):
+        self.assertEqual(text.word_phonemes('the'), ['dh', 'ah'])
+        self.assertEqual(text.word_phonemes('make'), ['m', 'eh', 'iy', 'k'])
+        self.assertEqual(text.word_phonemes('dogs')[-1], 'z')
+        self.assertEqual(text.to_phonemes('Hi, you.'), ['hh', 'ih', '|', '_', 'y', 'uw', '|', '__'])
+
+
+class WavTests(SimpleTestCase):
+    def test_header_describes_mono_16_bit_pcm(self):
+        wav = audio.to_wav(np.array([0.0, 1.0, -2.0], dtype=np.float32), 22050)
+
+        with wave.open(io.BytesIO(wav)) as f:
+            self.assertEqual((f.getnchannels(), f.getsampwidth(), f.getframerate(), f.getnframes()), (1, 2, 22050, 3))
+            self.assertEqual(struct.unpack('<3h', f.readframes(3)), (0, 32767, -32767))
+
+    def test_streaming_header_has_an_unknown_length(self):
+        header = audio.wav_header(22050)
+
+        self.assertEqual(len(header), 44)
+        self.assertEqual(struct.unpack_from('<I', header, 40)[0], audio.STREAMING_SIZE)
+
+
+class EngineTests(SimpleTestCase):
+    def setUp(self):
+        self.engine = get_engine('formant')
+
+    def test_synthesizes_float_samples_in_range(self):
+        samples = self.engine.synthesize('Hello there.', self.engine.get_voice('tenor'))
+
+        self.assertEqual(samples.dtype, np.float32)
+        self.assertGreater(len(samples), self.engine.sample_rate // 4)
+        self.assertLessEqual(np.abs(samples).max(), 1.0)
+        self.assertGreater(np.abs(samples).max(), 0.1)
+
+    def test_output_is_deterministic_per_voice(self):
+        alto, bass = self.engine.get_voice('alto'), self.engine.get_voice('bass')
+
+        first = self.engine.synthesize('Hello there.', alto)
+
+        np.testing.assert_array_equal(first, self.engine.synthesize('Hello there.', alto))
+        self.assertFalse(np.array_equal(first[:1000], self.engine.synthesize('Hello there.', bass)[:1000]))
+
+    def test_nothing_to_say(self):
+        self.assertEqual(self.engine.synthesize('```code only```', self.engine.get_voice()).size, 0)
+
+    @override_settings(TTS_DEFAULT_VOICE='bass')
+    def test_voices(self):
+        self.assertEqual(set(self.engine.voices), {'alto', 'soprano', 'tenor', 'bass'})
+        self.assertEqual(self.engine.get_voice().name, 'bass')
+        with self.assertRaises(UnknownVoice):
+            self.engine.get_voice('baritone')
+
+    def test_engine_registry(self):
+        self.assertIs(get_engine('formant'), self.engine)
+        self.assertIsInstance(get_engine('tts.formant.FormantEngine'), FormantEngine)
+        with self.assertRaises(ValueError):
+            get_engine('nonexistent.Engine')
+
+
+class MessageSpeechTests(SpeechTestCase):
+    def speak(self, message_id=None, **params):
+        return self.client.get(reverse('chat:message_speech', args=[message_id or self.message.id]), params)
+
+    def test_speaks_the_message_as_wav(self):
+        response = self.speak()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'audio/wav')
+        self.assertEqual(response['Content-Disposition'], f'inline; filename="message-{self.message.id}.wav"')
+        with wave.open(io.BytesIO(b''.join(response.streaming_content))) as f:
+            self.assertEqual((f.getnchannels(), f.getframerate()), (1, 22050))
+            self.assertGreater(f.getnframes(), 22050)
+
+    def test_voices_can_be_chosen(self):
+        bass = b''.join(self.speak(voice='bass').streaming_content)
+        soprano = b''.join(self.speak(voice='soprano').streaming_content)
+
+        self.assertNotEqual(bass, soprano)
+        self.assertEqual(self.speak(voice='baritone').status_code, 400)
+
+    def test_only_own_assistant_messages_are_spoken(self):
+        user_message = Message.objects.get(chat=self.chat, role='user')
+        self.assertEqual(self.speak(user_message.id).status_code, 400)
+
+        other = get_user_model().objects.create_user(email='grace@example.com', password='secret')
+        self.client.force_login(other)
+        self.assertEqual(self.speak().status_code, 404)
+
+    def test_login_required(self):
+        self.client.logout()
+
+        self.assertEqual(self.speak().status_code, 302)
@@ -0,0 +1,184 @@
+import base64
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.urls import reverse
+
+from chat import metrics
+from chat.models import Message
+from chat.tests.base import ChatTestCase, ndjson
+from tts import audio, cache as audio_cache, pipeline, workers
+from tts.engine import get_engine
+
+from .base import SpeechTestCase, clear_speech_cache, use_speech_workers
+
+
+class SentenceSegmenterTests(SimpleTestCase):
+    def setUp(self):
+        self.segmenter = pipeline.SentenceSegmenter()
+
+    def test_sentences_are_cut_as_soon_as_they_end(self):
+        self.assertEqual(self.segmenter.feed('Hello there. How'), ['Hello there.'])
+        # The end of a sentence is only known once something follows it
+        self.assertEqual(self.segmenter.feed(' are you?'), [])
+        self.assertEqual(self.segmenter.feed('\nFine'), ['How are you?'])
+        self.assertEqual(self.segmenter.flush(), ['Fine'])
+        self.assertEqual(self.segmenter.flush(), [])
+
+    def test_pieces_can_split_words(self):
+        sentences = []
+        for piece in ('Th', 'is is one', '. And', ' this is two. '):
+            sentences += self.segmenter.feed(piece)
+
+        self.assertEqual(sentences, ['This is one.', 'And this is two.'])
+
+    def test_very_short_sentences_wait_for_the_next(self):
+        self.assertEqual(self.segmenter.feed('Hi. '), [])
+        self.assertEqual(self.segmenter.feed('Then we go on. '), ['Hi. Then we go on.'])
+
+    def test_code_fences_are_never_split(self):
+        self.assertEqual(self.segmenter.feed('Run this:\n```\nx = 1.\ny = 2.\n'), ['Run this:'])
+        self.assertEqual(self.segmenter.feed('```\nThat is all. '), ['```\nx = 1.\ny = 2.\n```', 'That is all.'])
+
+    def test_long_clauses_are_cut_at_a_comma_or_space(self):
+        clause = 'and then, ' + 'word ' * 60
+
+        sentences = self.segmenter.feed(clause)
+
+        self.assertEqual(len(sentences), 1)
+        self.assertLessEqual(len(sentences[0]), pipeline.MAX_CHARS)
+        self.assertEqual(' '.join(sentences + self.segmenter.flush()).split(), clause.split())
+
+
+class SpeechPipelineTests(SpeechTestCase):
+    def setUp(self):
+        super().setUp()
+        self.engine = get_engine()
+        self.voice = self.engine.get_voice('tenor')
+
+    def expected(self, *sentences):
+        path = pipeline._engine_path(self.engine)
+        return [pipeline._render_sentence(path, self.voice, s, None) for s in sentences]
+
+    def test_audio_comes_back_in_sentence_order(self):
+        sentences = ['This is the first sentence.', 'A second one follows.', 'Third.', 'And the fourth is last.']
+        speech = pipeline.SpeechPipeline(self.engine, self.voice, depth=2)
+
+        for word in ' '.join(sentences).split(' '):
+            speech.feed(word + ' ')
+        speech.close()
+        # "Third." is too short to stand alone
+        spoken = list(speech.drain())
+
+        self.assertEqual(spoken, self.expected(sentences[0], sentences[1], 'Third. And the fourth is last.'))
+
+    def test_ready_never_waits(self):
+        speech = pipeline.SpeechPipeline(self.engine, self.voice)
+        self.assertEqual(list(speech.ready()), [])
+
+        speech.feed('One sentence is here. ')
+        speech.close()
+        speech._running[0].result(timeout=30)
+
+        self.assertEqual(list(speech.ready()), self.expected('One sentence is here.'))
+        self.assertEqual(list(speech.drain()), [])
+
+    def test_cancel_drops_queued_sentences(self):
+        speech = pipeline.SpeechPipeline(self.engine, self.voice, depth=1)
+        speech.feed('First of many. Second of many. Third of many. ')
+
+        speech.cancel()
+
+        self.assertEqual(list(speech.drain()), [])
+
+    def test_time_to_first_audio_is_observed_once(self):
+        speech = pipeline.SpeechPipeline(self.engine, self.voice)
+        with mock.patch.object(metrics.TTS_FIRST_AUDIO, 'observe') as observe:
+            speech.feed('First of two. Second of two.')
+            speech.close()
+            list(speech.drain())
+
+        observe.assert_called_once_with(mock.ANY, engine='formant')
+
+
+class FullFarmTests(SpeechTestCase):
+    speech_settings = {'TTS_QUEUE_MAX': 0, 'TTS_QUEUE_TIMEOUT': 0.2}
+
+    def setUp(self):
+        super().setUp()
+        self.engine = get_engine()
+        self.voice = self.engine.get_voice()
+
+    def test_drain_gives_up_once_the_timeout_passes(self):
+        speech = pipeline.SpeechPipeline(self.engine, self.voice)
+        speech.feed('This sentence never finds a worker. ')
+        speech.close()
+
+        with self.assertRaises(workers.Saturated):
+            list(speech.drain())
+
+    def test_a_stream_held_up_too_long_ends_early(self):
+        with self.assertLogs('tts.pipeline', 'WARNING'):
+            chunks = list(pipeline.stream_wav(self.engine, self.voice, 'Nobody hears this.', cache_key='ab12'))
+
+        self.assertEqual(chunks, [audio.wav_header(self.engine.sample_rate)])
+        self.assertIsNone(audio_cache.get_cache().open('ab12'))
+
+
+class SaturatedReplyStreamTests(ChatTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        use_speech_workers(cls, TTS_QUEUE_MAX=0, TTS_QUEUE_TIMEOUT=0.1)
+
+    def setUp(self):
+        super().setUp()
+        clear_speech_cache()
+
+    def test_the_stream_ends_with_a_503_event(self):
+        # The farm fills up only after the request was let in
+        with mock.patch.object(workers.WorkerFarm, 'check'):
+            events = ndjson(self.client.post(reverse('chat:send_message_stream'), {'message': 'Hi', 'speak': 'bass'}))
+
+        self.assertEqual(events[-1], {
+            'type': 'error', 'error': 'Speech synthesis is at capacity, try again shortly', 'status': 503,
+            'retry_after': 1,
+        })
+        self.assertNotIn('done', [e['type'] for e in events])
+        # The reply itself was still saved
+        self.assertTrue(Message.objects.filter(role='assistant').exists())
+
+
+class SpokenReplyTests(ChatTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        use_speech_workers(cls)
+
+    def setUp(self):
+        super().setUp()
+        clear_speech_cache()
+
+    def test_the_reply_is_spoken_in_audio_events(self):
+        events = ndjson(self.client.post(reverse('chat:send_message_stream'), {'message': 'Hello', 'speak': 'bass'}))
+
+        kinds = [e['type'] for e in events]
+        self.assertEqual((kinds[0], kinds[-1]), ('meta', 'done'))
+        audio = [e for e in events if e['type'] == 'audio']
+        self.assertTrue(audio)
+        self.assertEqual({(e['encoding'], e['sample_rate']) for e in audio}, {('pcm_s16le', 22050)})
+        reply = ''.join(e['content'] for e in events if e['type'] == 'delta')
+        engine = get_engine()
+        spoken = b''.join(base64.b64decode(e['data']) for e in audio)
+        self.assertEqual(spoken, pipeline.render_wav(engine, engine.get_voice('bass'), reply)[44:])
+
+    def test_unknown_voice_is_rejected_up_front(self):
+        response = self.client.post(reverse('chat:send_message_stream'), {'message': 'Hello', 'speak': 'baritone'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.upstream_calls(), 0)
+
+    def test_without_speak_there_is_no_audio(self):
+        events = ndjson(self.client.post(reverse('chat:send_message_stream'), {'message': 'Hello'}))
+
+        self.assertNotIn('audio', [e['type'] for e in events])
@@ -0,0 +1,236 @@
+import functools
+import io
+import wave
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from tts import audio, profiles
+from tts.engine import EMBED_FORMANT_SCALE, EMBED_PITCH, EMBED_SPECTRUM, UnknownVoice, get_engine
+from tts.models import VoiceProfile
+
+from .base import SpeechTestCase
+
+READING = ('The quick brown fox jumps over the lazy dog. '
+           'She sells sea shells by the sea shore, and then she goes home.')
+
+
+@functools.lru_cache
+def reading_wav(voice: str) -> bytes:
+    """A few seconds of the engine's ``voice`` reading aloud, as a reference recording."""
+    engine = get_engine('formant')
+    return audio.to_wav(engine.synthesize(READING, engine.get_voice(voice)), engine.sample_rate)
+
+
+def pcm_wav(frames: bytes, width: int = 2, channels: int = 1, rate: int = 16000) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as f:
+        f.setsampwidth(width)
+        f.setnchannels(channels)
+        f.setframerate(rate)
+        f.writeframes(frames)
+    return buf.getvalue()
+
+
+class ReadWavTests(SimpleTestCase):
+    def test_samples_are_scaled_and_mixed_down(self):
+        samples, rate = profiles.read_wav(pcm_wav(np.array([0, 16384, -32768, 0], '<i2').tobytes(), channels=2))
+
+        self.assertEqual(rate, 16000)
+        np.testing.assert_array_equal(samples, [0.25, -0.5])
+
+    def test_8_bit_audio_is_unsigned(self):
+        samples, _ = profiles.read_wav(pcm_wav(bytes([128, 192, 0]), width=1))
+
+        np.testing.assert_array_equal(samples, [0.0, 0.5, -1.0])
+
+    def test_unreadable_files_are_rejected(self):
+        for data in (b'', b'not a wav file', reading_wav('tenor')[:30], pcm_wav(b'\0' * 30, width=3)):
+            with self.subTest(data=data[:16]), self.assertRaises(profiles.InvalidReference):
+                profiles.read_wav(data)
+
+    @override_settings(TTS_PROFILE_MAX_SECONDS=1)
+    def test_long_files_are_cut(self):
+        samples, rate = profiles.read_wav(pcm_wav(b'\0\0' * 40000))
+
+        self.assertEqual(len(samples), rate)
+
+
+class EmbeddingTests(SimpleTestCase):
+    def embed(self, data):
+        embedding, seconds = profiles.embed_wav(data)
+        return profiles.from_bytes(embedding), seconds
+
+    def test_the_speaker_is_recovered(self):
+        tenor, seconds = self.embed(reading_wav('tenor'))
+        bass, _ = self.embed(reading_wav('bass'))
+
+        self.assertEqual(tenor.dtype, np.float32)
+        self.assertEqual(len(tenor), EMBED_SPECTRUM.start + profiles.SPECTRUM_BANDS)
+        self.assertGreater(seconds, profiles.MIN_SECONDS)
+        # The engine's tenor is at 125 Hz and the reference scale, its bass at 95 Hz and lower
+        self.assertAlmostEqual(tenor[EMBED_PITCH], 125, delta=8)
+        self.assertAlmostEqual(tenor[EMBED_FORMANT_SCALE], 1.0, delta=0.05)
+        self.assertAlmostEqual(bass[EMBED_PITCH], 95, delta=8)
+        self.assertLess(bass[EMBED_FORMANT_SCALE], tenor[EMBED_FORMANT_SCALE])
+
+    def test_a_higher_rate_gives_the_same_voice(self):
+        engine = get_engine('formant')
+        samples = engine.synthesize(READING, engine.get_voice('tenor'))
+        upsampled = np.repeat(samples, 2)
+
+        tenor, _ = self.embed(reading_wav('tenor'))
+        doubled, _ = self.embed(audio.to_wav(upsampled, 2 * engine.sample_rate))
+
+        self.assertAlmostEqual(doubled[EMBED_PITCH], tenor[EMBED_PITCH], delta=5)
+
+    def test_short_or_silent_recordings_are_rejected(self):
+        rate = get_engine('formant').sample_rate
+        for samples in (np.zeros(3 * rate // 2), np.zeros(5 * rate)):
+            with self.subTest(seconds=len(samples) / rate), self.assertRaises(profiles.InvalidReference):
+                profiles.embed_wav(audio.to_wav(samples.astype(np.float32), rate))
+
+
+class UserVoiceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(email='ada@example.com', password='secret')
+        cls.other = User.objects.create_user(email='grace@example.com', password='secret')
+        embedding = profiles.to_bytes(np.arange(29, dtype=np.float32) + 100)
+        cls.profile = VoiceProfile.objects.create(user=cls.user, name='Me', embedding=embedding, reference_seconds=5)
+        cls.others = VoiceProfile.objects.create(user=cls.other, name='Her', embedding=embedding, reference_seconds=5)
+
+    def setUp(self):
+        self.engine = get_engine('formant')
+        profiles._local.clear()
+        self.addCleanup(profiles._local.clear)
+
+    def test_names_resolve_to_voices(self):
+        name = profiles.voice_name(self.profile.id)
+
+        voice = profiles.user_voice(self.engine, self.user, name)
+
+        self.assertEqual((voice.name, voice.label, voice.pitch), (name, 'Me', 100.0))
+        self.assertEqual(profiles.user_voice(self.engine, self.user, 'bass').name, 'bass')
+
+    def test_the_selection_is_used_by_default(self):
+        self.assertEqual(profiles.user_voice(self.engine, self.user).name, self.engine.get_voice().name)
+
+        self.user.preferred_voice = 'soprano'
+        self.assertEqual(profiles.user_voice(self.engine, self.user).name, 'soprano')
+
+        self.user.voice_profile = self.profile
+        self.assertEqual(profiles.user_voice(self.engine, self.user).name, profiles.voice_name(self.profile.id))
+
+    def test_only_own_profiles_can_be_used(self):
+        for name in (profiles.voice_name(self.others.id), 'profile-999999', 'profile-x', 'baritone'):
+            with self.subTest(name=name), self.assertRaises(UnknownVoice):
+                profiles.user_voice(self.engine, self.user, name)
+
+    @override_settings(TTS_PROFILE_CACHE_SIZE=1)
+    def test_profiles_are_kept_in_a_small_lru(self):
+        name = profiles.voice_name(self.profile.id)
+        profiles.user_voice(self.engine, self.user, name)
+
+        with self.assertNumQueries(0):
+            profiles.user_voice(self.engine, self.user, name)
+        profiles.user_voice(self.engine, self.other, profiles.voice_name(self.others.id))
+
+        self.assertEqual(list(profiles._local), [self.others.id])
+
+    def test_deleted_profiles_are_evicted(self):
+        name = profiles.voice_name(self.profile.id)
+        profiles.user_voice(self.engine, self.user, name)
+
+        self.profile.delete()
+
+        self.assertNotIn(self.profile.id, profiles._local)
+        with self.assertRaises(UnknownVoice):
+            profiles.user_voice(self.engine, self.user, name)
+
+
+class VoiceViewTests(SpeechTestCase):
+    def create(self, data=None, **fields):
+        fields.setdefault('name', 'My voice')
+        fields.setdefault('audio', SimpleUploadedFile('me.wav', data or reading_wav('tenor'), content_type='audio/wav'))
+        return self.client.post(reverse('chat:create_voice_profile'), fields)
+
+    def select(self, voice):
+        return self.client.post(reverse('chat:select_voice'), {'voice': voice})
+
+    def test_a_profile_is_created_from_a_recording(self):
+        response = self.create(select='1')
+
+        self.assertEqual(response.status_code, 201)
+        profile = VoiceProfile.objects.get(user=self.user)
+        self.assertEqual(response.json()['profile']['voice'], profiles.voice_name(profile.id))
+        self.assertEqual(response.json()['profile']['name'], 'My voice')
+        self.assertGreater(response.json()['profile']['reference_seconds'], profiles.MIN_SECONDS)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.voice_profile, profile)
+
+    def test_bad_uploads_are_rejected(self):
+        for fields in ({'name': ''}, {'audio': ''}, {'data': b'RIFF not really'}, {'data': pcm_wav(b'\0\0' * 100)}):
+            with self.subTest(fields=fields):
+                self.assertEqual(self.create(**fields).status_code, 400)
+        with override_settings(TTS_PROFILE_MAX_BYTES=1000):
+            self.assertEqual(self.create().status_code, 400)
+        self.assertFalse(VoiceProfile.objects.exists())
+
+    @override_settings(TTS_PROFILES_PER_USER=1)
+    def test_profiles_per_user_are_limited(self):
+        self.assertEqual(self.create().status_code, 201)
+
+        self.assertEqual(self.create().status_code, 400)
+
+    def test_voices_are_listed_and_selected(self):
+        voice = self.create().json()['profile']['voice']
+
+        listed = self.client.get(reverse('chat:list_voices')).json()
+        self.assertEqual({v['voice'] for v in listed['voices']}, {'alto', 'soprano', 'tenor', 'bass'})
+        self.assertEqual([p['voice'] for p in listed['profiles']], [voice])
+        self.assertEqual(listed['selected'], get_engine().get_voice().name)
+
+        self.assertEqual(self.select(voice).json(), {'selected': voice})
+        self.assertEqual(self.client.get(reverse('chat:list_voices')).json()['selected'], voice)
+        # Choosing a built-in voice drops the profile
+        self.assertEqual(self.select('bass').json(), {'selected': 'bass'})
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.voice_profile, self.user.preferred_voice), (None, 'bass'))
+        self.assertEqual(self.select('baritone').status_code, 400)
+
+    def test_replies_are_spoken_in_the_selected_voice(self):
+        voice = self.create(select='1').json()['profile']['voice']
+        speech = reverse('chat:message_speech', args=[self.message.id])
+
+        selected = b''.join(self.client.get(speech).streaming_content)
+
+        self.assertEqual(selected, b''.join(self.client.get(speech, {'voice': voice}).streaming_content))
+        self.assertNotEqual(selected, b''.join(self.client.get(speech, {'voice': 'tenor'}).streaming_content))
+
+    def test_other_users_profiles_are_off_limits(self):
+        voice = self.create().json()['profile']['voice']
+        profile_id = VoiceProfile.objects.get().id
+        other = get_user_model().objects.create_user(email='grace@example.com', password='secret')
+        self.client.force_login(other)
+
+        self.assertEqual(self.select(voice).status_code, 400)
+        self.assertEqual(self.client.post(reverse('chat:delete_voice_profile', args=[profile_id])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('chat:list_voices')).json()['profiles'], [])
+
+    def test_deleting_a_profile_unselects_it(self):
+        self.create(select='1')
+        profile = VoiceProfile.objects.get()
+        delete = reverse('chat:delete_voice_profile', args=[profile.id])
+
+        self.assertEqual(self.client.get(delete).status_code, 405)
+        self.assertEqual(self.client.post(delete).json(), {'ok': True})
+
+        self.assertFalse(VoiceProfile.objects.exists())
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.voice_profile)
+        self.assertEqual(self.client.get(reverse('chat:list_voices')).json()['selected'], get_engine().get_voice().name)
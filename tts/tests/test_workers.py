@@ -0,0 +1,148 @@
+import time
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase
+from django.urls import reverse
+
+from chat import metrics
+from chat.tests.base import ChatTestCase
+from tts import workers
+
+from .base import SpeechTestCase, use_speech_workers
+
+
+class WorkerFarmTests(SimpleTestCase):
+    def setUp(self):
+        self.farm = workers.WorkerFarm(1, max_queue=6)
+        self.addCleanup(self.farm._pool.shutdown)
+        self.finished = []
+
+    def occupy(self):
+        """Keep the only worker busy so that later jobs queue up."""
+        blocker = self.farm.submit(time.sleep, 0.5)
+        deadline = time.monotonic() + 30
+        while self.farm._busy < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return blocker
+
+    def job(self, label, user, priority=workers.INTERACTIVE):
+        future = self.farm.submit(time.sleep, 0, user=user, priority=priority)
+        future.add_done_callback(lambda f: self.finished.append(label))
+        return future
+
+    def test_interactive_jobs_go_first_and_users_take_turns(self):
+        self.occupy()
+        self.job('warm', 'ada', workers.PREGENERATE)
+        self.job('ada-1', 'ada')
+        self.job('ada-2', 'ada')
+        self.job('ada-3', 'ada')
+        last = self.job('bob-1', 'bob')
+
+        last.result(timeout=30)
+        deadline = time.monotonic() + 30
+        while len(self.finished) < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(self.finished, ['ada-1', 'bob-1', 'ada-2', 'ada-3', 'warm'])
+
+    def test_a_full_queue_turns_jobs_away(self):
+        self.occupy()
+        for n in range(6):
+            self.job(n, 'ada')
+
+        with mock.patch.object(metrics.TTS_JOBS, 'inc') as inc, self.assertRaises(workers.Saturated) as cm:
+            self.job(6, 'bob')
+        inc.assert_called_once_with(priority=workers.INTERACTIVE, outcome='rejected')
+        self.assertEqual(cm.exception.retry_after, 1.0)
+        with self.assertRaises(workers.Saturated):
+            self.farm.check()
+
+    def test_pregeneration_may_only_fill_half_the_queue(self):
+        self.occupy()
+        for n in range(3):
+            self.job(n, 'ada', workers.PREGENERATE)
+
+        with self.assertRaises(workers.Saturated):
+            self.farm.check(workers.PREGENERATE)
+        # Interactive work still has room
+        self.farm.check()
+        self.job('now', 'bob').result(timeout=30)
+
+    def test_cancelled_jobs_leave_the_queue(self):
+        self.occupy()
+        jobs = [self.job(n, 'ada') for n in range(6)]
+
+        self.assertTrue(jobs[0].cancel())
+
+        self.assertEqual(self.farm._queued[workers.INTERACTIVE], 5)
+        self.farm.check()
+
+    def test_failures_reach_the_caller(self):
+        with self.assertRaises(ValueError):
+            self.farm.submit(int, 'not a number').result(timeout=30)
+        # The farm keeps going
+        self.assertEqual(self.farm.submit(int, '7').result(timeout=30), 7)
+
+
+class WaitForRoomTests(SimpleTestCase):
+    def setUp(self):
+        self.farm = workers.WorkerFarm(1, max_queue=1)
+        self.addCleanup(self.farm._pool.shutdown)
+
+    def test_waits_until_a_job_leaves_the_queue(self):
+        self.farm.submit(time.sleep, 0.3)
+        deadline = time.monotonic() + 30
+        while self.farm._busy < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.farm.submit(time.sleep, 0)
+        with self.assertRaises(workers.Saturated):
+            self.farm.check()
+
+        self.farm.wait_for_room(timeout=30)
+
+        self.farm.check()
+
+    def test_gives_up_after_the_timeout(self):
+        farm = workers.WorkerFarm(1, max_queue=0)
+        self.addCleanup(farm._pool.shutdown)
+        started = time.monotonic()
+
+        with self.assertRaises(workers.Saturated):
+            farm.wait_for_room(timeout=0.2)
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+
+class SaturatedSpeechTests(SpeechTestCase):
+    # No room at all: every request is turned away before any work starts
+    speech_settings = {'TTS_QUEUE_MAX': 0}
+
+    def assertSaturated(self, response):
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_speech_endpoints_answer_503(self):
+        self.assertSaturated(self.client.get(reverse('chat:message_speech', args=[self.message.id])))
+        self.assertSaturated(self.client.get(reverse('chat:message_speech_stream', args=[self.message.id])))
+
+    def test_voice_profiles_answer_503(self):
+        response = self.client.post(reverse('chat:create_voice_profile'), {
+            'name': 'Me', 'audio': SimpleUploadedFile('me.wav', b'RIFF', content_type='audio/wav'),
+        })
+
+        self.assertSaturated(response)
+
+
+class SaturatedSpokenReplyTests(ChatTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        use_speech_workers(cls, TTS_QUEUE_MAX=0)
+
+    def test_spoken_replies_are_refused_before_calling_upstream(self):
+        response = self.client.post(reverse('chat:send_message_stream'), {'message': 'Hello', 'speak': 'default'})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.upstream_calls(), 0)
@@ -0,0 +1,157 @@
+"""Text front end for speech synthesis: cleanup, sentence splitting and letter-to-sound.
+
+Assistant replies are Markdown, so formatting marks, code fences and link
+targets are stripped before anything is spoken. Numbers are read out as
+words. The letter-to-sound rules cover regular English spelling plus a
+small list of common irregular words; they aim to be understandable rather
+than to pronounce every word correctly.
+"""
+import re
+from typing import List
+
+_CODE_BLOCK_RE = re.compile(r'```.*?(?:```|$)', re.DOTALL)
+_LINK_RE = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+_URL_RE = re.compile(r'https?://\S+')
+_MARKUP_RE = re.compile(r'[*_`#>|~]+')
+_BULLET_RE = re.compile(r'^\s*(?:[-*•]|\d+\.)\s+', re.MULTILINE)
+_SPACE_RE = re.compile(r'\s+')
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+# Split after . ! ? ; : followed by space, and at line breaks; long clauses are worth speaking on their own
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?;:])\s+|\n+')
+
+_ONES = 'zero one two three four five six seven eight nine ten eleven twelve thirteen fourteen fifteen sixteen seventeen eighteen nineteen'.split()
+_TENS = 'twenty thirty forty fifty sixty seventy eighty ninety'.split()
+
+
+def _number_words(n: int) -> str:
+    if n < 20:
+        return _ONES[n]
+    if n < 100:
+        return _TENS[n // 10 - 2] + ('' if n % 10 == 0 else ' ' + _ONES[n % 10])
+    if n < 1000:
+        return _ONES[n // 100] + ' hundred' + ('' if n % 100 == 0 else ' ' + _number_words(n % 100))
+    for size, name in ((10 ** 9, 'billion'), (10 ** 6, 'million'), (1000, 'thousand')):
+        if n >= size:
+            rest = n % size
+            return _number_words(n // size) + ' ' + name + ('' if rest == 0 else ' ' + _number_words(rest))
+    return str(n)
+
+
+def _say_number(match: re.Match) -> str:
+    whole, _, fraction = match.group(0).partition('.')
+    if len(whole) > 12:
+        words = ' '.join(_ONES[int(d)] for d in whole)
+    else:
+        words = _number_words(int(whole))
+    if fraction:
+        words += ' point ' + ' '.join(_ONES[int(d)] for d in fraction)
+    return f' {words} '
+
+
+def normalize(text: str) -> str:
+    """Plain, speakable text: no Markdown, no URLs, numbers as words."""
+    text = _CODE_BLOCK_RE.sub(' ', text)
+    text = _LINK_RE.sub(r'\1', text)
+    text = _URL_RE.sub(' link ', text)
+    text = _BULLET_RE.sub('', text)
+    text = _MARKUP_RE.sub(' ', text)
+    text = _NUMBER_RE.sub(_say_number, text)
+    text = text.replace('%', ' percent ').replace('&', ' and ')
+    return _SPACE_RE.sub(' ', text.replace('\n', '. ')).strip()
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split already-normalized text into sentences, keeping their final punctuation."""
+    return [s.strip() for s in _SENTENCE_END_RE.split(text) if s and s.strip(' .')]
+
+
+# Irregular words the spelling rules get wrong, as phoneme strings
+LEXICON = {
+    'a': 'ah', 'the': 'dh ah', 'of': 'ah v', 'to': 't uw', 'do': 'd uw', 'you': 'y uw', 'your': 'y ao r',
+    'i': 'aa iy', 'is': 'ih z', 'was': 'w ah z', 'are': 'aa r', 'were': 'w er', 'one': 'w ah n',
+    'two': 't uw', 'have': 'hh ae v', 'give': 'g ih v', 'live': 'l ih v', 'says': 's eh z',
+    'said': 's eh d', 'what': 'w ah t', 'who': 'hh uw', 'there': 'dh eh r', 'where': 'w eh r',
+    'their': 'dh eh r', 'they': 'dh eh iy', 'some': 's ah m', 'come': 'k ah m', 'done': 'd ah n',
+    'been': 'b ih n', 'could': 'k uh d', 'would': 'w uh d', 'should': 'sh uh d', 'does': 'd ah z',
+    'any': 'eh n iy', 'many': 'm eh n iy', 'only': 'ao uw n l iy', 'because': 'b ih k ah z',
+    'be': 'b iy', 'he': 'hh iy', 'she': 'sh iy', 'we': 'w iy', 'me': 'm iy', 'no': 'n ao uw',
+    'so': 's ao uw', 'go': 'g ao uw', 'hello': 'hh eh l ao uw', 'my': 'm aa iy', 'by': 'b aa iy',
+    'eye': 'aa iy', 'know': 'n ao uw', 'friend': 'f r eh n d', 'people': 'p iy p ah l',
+}
+
+# Longest spellings first; each maps to a phoneme string
+_RULES = sorted({
+    'tion': 'sh ah n', 'sion': 'zh ah n', 'ough': 'ao', 'augh': 'ao', 'eigh': 'eh iy', 'igh': 'aa iy',
+    'tch': 'ch', 'dge': 'jh', 'ee': 'iy', 'ea': 'iy', 'ie': 'iy', 'oo': 'uw', 'ou': 'aa uw', 'ow': 'aa uw',
+    'oa': 'ao uw', 'ai': 'eh iy', 'ay': 'eh iy', 'ey': 'eh iy', 'oi': 'ao iy', 'oy': 'ao iy', 'au': 'ao',
+    'aw': 'ao', 'ew': 'y uw', 'ar': 'aa r', 'er': 'er', 'ir': 'er', 'ur': 'er', 'or': 'ao r',
+    'th': 'th', 'sh': 'sh', 'ch': 'ch', 'ph': 'f', 'wh': 'w', 'ng': 'ng', 'ck': 'k', 'qu': 'k w',
+    'kn': 'n', 'wr': 'r', 'gh': '', 'x': 'k s',
+    'a': 'ae', 'e': 'eh', 'i': 'ih', 'o': 'aa', 'u': 'ah', 'y': 'iy',
+    'b': 'b', 'c': 'k', 'd': 'd', 'f': 'f', 'g': 'g', 'h': 'hh', 'j': 'jh', 'k': 'k', 'l': 'l', 'm': 'm',
+    'n': 'n', 'p': 'p', 'q': 'k', 'r': 'r', 's': 's', 't': 't', 'v': 'v', 'w': 'w', 'z': 'z',
+}.items(), key=lambda rule: -len(rule[0]))
+
+# Vowel + consonant + silent final e: "make", "time", "home", "use"
+_MAGIC_E_RE = re.compile(r'([aeiou])([bcdfgklmnprstvz])e$')
+_LONG_VOWELS = {'a': 'eh iy', 'e': 'iy', 'i': 'aa iy', 'o': 'ao uw', 'u': 'y uw'}
+_VOWELS = set('aeiouy')
+_RULE_MAP = dict(_RULES)
+
+
+def word_phonemes(word: str) -> List[str]:
+    """Phonemes for one lowercase word."""
+    if word in LEXICON:
+        return LEXICON[word].split()
+    phonemes: List[str] = []
+    tail: List[str] = []
+    magic = _MAGIC_E_RE.search(word) if len(word) > 3 else None
+    if magic:
+        tail = _LONG_VOWELS[magic.group(1)].split() + _RULE_MAP[magic.group(2)].split()
+        word = word[:magic.start()]
+    i = 0
+    while i < len(word):
+        ch = word[i]
+        # Soft c before e, i, y; a doubled consonant is said once
+        if ch == 'c' and word[i + 1:i + 2] in ('e', 'i', 'y'):
+            phonemes.append('s')
+            i += 1
+            continue
+        if ch == 'y' and i == 0:
+            phonemes.append('y')
+            i += 1
+            continue
+        if i and ch == word[i - 1] and ch not in _VOWELS:
+            i += 1
+            continue
+        for spelling, sounds in _RULES:
+            if word.startswith(spelling, i):
+                phonemes.extend(sounds.split())
+                i += len(spelling)
+                break
+        else:
+            i += 1
+    # Plural and verb -s after a voiced sound is a z
+    if len(phonemes) > 1 and phonemes[-1] == 's' and word.endswith('s') and phonemes[-2] not in ('p', 't', 'k', 'f', 'th', 's', 'sh', 'ch'):
+        phonemes[-1] = 'z'
+    return phonemes + tail
+
+
+_TOKEN_RE = re.compile(r"[a-z']+|[,;:]|[.!?]")
+
+
+def to_phonemes(text: str) -> List[str]:
+    """Phonemes for normalized text.
+
+    ``|`` marks a word boundary, ``_`` a short pause and ``__`` a sentence break.
+    """
+    phonemes: List[str] = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in (',', ';', ':'):
+            phonemes.append('_')
+        elif token in ('.', '!', '?'):
+            phonemes.append('__')
+        else:
+            phonemes.extend(word_phonemes(token.replace("'", '')))
+            phonemes.append('|')
+    return phonemes
@@ -0,0 +1,221 @@
+"""The speech worker farm: synthesis runs in a pool of processes, not in request threads.
+
+Synthesis is CPU-bound, so running it on request threads would starve them
+of the GIL. Jobs are queued here and handed to ``TTS_WORKERS`` processes,
+one job per idle process. The farm picks the next job itself rather than
+leaving it to the pool's FIFO:
+
+* interactive jobs (someone is waiting to hear them) always go before
+  pre-generation jobs (warming the audio cache);
+* within a priority, users take turns, so one long reply cannot hold up
+  everyone else's first sentence.
+
+The queue is bounded at ``TTS_QUEUE_MAX`` jobs. Pre-generation may only
+fill half of it, leaving room for interactive work. A submission past the
+bound raises :class:`Saturated`, which the views turn into a 503. A
+stream that has already started waits for room instead, on
+:meth:`WorkerFarm.wait_for_room`, for up to ``TTS_QUEUE_TIMEOUT`` seconds.
+Queue depth, busy workers, waits and outcomes go to ``chat.metrics`` for
+sizing.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict
+
+import django
+from django.conf import settings
+
+from chat import metrics
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+PREGENERATE = 'pregenerate'
+# In scheduling order
+PRIORITIES = (INTERACTIVE, PREGENERATE)
+
+
+class Saturated(Exception):
+    """The queue is full; ``retry_after`` is a hint in seconds."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass(eq=False)
+class _Job:
+    fn: Callable
+    args: tuple
+    user: Any
+    priority: str
+    future: Future = field(default_factory=Future)
+    queued_at: float = field(default_factory=time.perf_counter)
+
+
+def _init_worker() -> None:
+    # Workers are spawned, not forked, so they start without Django configured
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ttss.settings')
+    django.setup()
+
+
+class WorkerFarm:
+    def __init__(self, processes: int, max_queue: int):
+        self.processes = processes
+        self.max_queue = max_queue
+        self._queues: Dict[str, 'OrderedDict[Any, Deque[_Job]]'] = {p: OrderedDict() for p in PRIORITIES}
+        self._queued = {p: 0 for p in PRIORITIES}
+        self._busy = 0
+        lock = threading.RLock()
+        # Wakes the dispatcher: a job was queued or a worker freed up
+        self._cond = threading.Condition(lock)
+        # Wakes callers of wait_for_room: a job left the queue
+        self._room = threading.Condition(lock)
+        self._pool = self._new_pool()
+        metrics.TTS_WORKERS.inc(processes)
+        threading.Thread(target=self._dispatch, name='tts-dispatch', daemon=True).start()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # Forking a process that runs request threads is unsafe; spawn clean workers instead
+        return ProcessPoolExecutor(
+            self.processes, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker,
+        )
+
+    def _limit(self, priority: str) -> int:
+        return self.max_queue if priority == INTERACTIVE else self.max_queue // 2
+
+    def check(self, priority: str = INTERACTIVE) -> None:
+        """Raise :class:`Saturated` if a job of ``priority`` would be turned away right now."""
+        with self._cond:
+            self._check(priority)
+
+    def wait_for_room(self, priority: str = INTERACTIVE, timeout: float | None = None) -> None:
+        """Block until a job of ``priority`` would be accepted; raise :class:`Saturated` after ``timeout`` seconds."""
+        with self._cond:
+            if not self._room.wait_for(lambda: self._has_room(priority), timeout):
+                self._check(priority)
+
+    def _has_room(self, priority: str) -> bool:
+        return sum(self._queued.values()) < self._limit(priority)
+
+    def _check(self, priority: str) -> None:
+        if not self._has_room(priority):
+            metrics.TTS_JOBS.inc(priority=priority, outcome='rejected')
+            raise Saturated('Speech synthesis is at capacity, try again shortly')
+
+    def submit(self, fn: Callable, *args, user: Any = None, priority: str = INTERACTIVE) -> Future:
+        """Queue ``fn(*args)`` to run in a worker process; ``fn`` and its arguments must pickle."""
+        job = _Job(fn, args, user, priority)
+        with self._cond:
+            self._check(priority)
+            self._queues[priority].setdefault(user, deque()).append(job)
+            self._queued[priority] += 1
+            metrics.TTS_QUEUE_DEPTH.inc(priority=priority)
+            self._cond.notify()
+        job.future.add_done_callback(lambda f: f.cancelled() and self._withdraw(job))
+        return job.future
+
+    def _withdraw(self, job: _Job) -> None:
+        """Take a cancelled job out of the queue, unless the dispatcher already has."""
+        with self._cond:
+            jobs = self._queues[job.priority].get(job.user)
+            if jobs is None or job not in jobs:
+                return
+            jobs.remove(job)
+            if not jobs:
+                del self._queues[job.priority][job.user]
+            self._dequeued(job)
+        metrics.TTS_JOBS.inc(priority=job.priority, outcome='cancelled')
+
+    def _dequeued(self, job: _Job) -> None:
+        self._queued[job.priority] -= 1
+        metrics.TTS_QUEUE_DEPTH.dec(priority=job.priority)
+        self._room.notify_all()
+
+    def _next(self) -> _Job:
+        for priority in PRIORITIES:
+            users = self._queues[priority]
+            if users:
+                # Round robin: the user served goes to the back of the line
+                user, jobs = next(iter(users.items()))
+                job = jobs.popleft()
+                if jobs:
+                    users.move_to_end(user)
+                else:
+                    del users[user]
+                self._dequeued(job)
+                return job
+        raise LookupError('no queued jobs')
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._cond:
+                while self._busy >= self.processes or not any(self._queued.values()):
+                    self._cond.wait()
+                job = self._next()
+                self._busy += 1
+            if not job.future.set_running_or_notify_cancel():
+                # Cancelled between leaving the queue and starting
+                metrics.TTS_JOBS.inc(priority=job.priority, outcome='cancelled')
+                self._release()
+                continue
+            metrics.TTS_QUEUE_WAIT.observe(time.perf_counter() - job.queued_at, priority=job.priority)
+            metrics.TTS_WORKERS_BUSY.inc()
+            pool = self._pool
+            try:
+                try:
+                    running = pool.submit(job.fn, *job.args)
+                except BrokenProcessPool:
+                    pool = self._restart(pool)
+                    running = pool.submit(job.fn, *job.args)
+            except Exception as e:
+                # The dispatcher has to outlive any one job
+                running = Future()
+                running.set_exception(e)
+            running.add_done_callback(lambda f, job=job, pool=pool: self._finished(job, pool, f))
+
+    def _release(self) -> None:
+        with self._cond:
+            self._busy -= 1
+            self._cond.notify()
+
+    def _finished(self, job: _Job, pool: ProcessPoolExecutor, running: Future) -> None:
+        metrics.TTS_WORKERS_BUSY.dec()
+        self._release()
+        error = running.exception()
+        if isinstance(error, BrokenProcessPool):
+            self._restart(pool)
+        metrics.TTS_JOBS.inc(priority=job.priority, outcome='error' if error else 'ok')
+        if error:
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(running.result())
+
+    def _restart(self, broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        """Replace a pool that lost a worker (killed, out of memory); the jobs it was running fail."""
+        with self._cond:
+            if self._pool is broken:
+                logger.error('tts worker pool broke; starting a new one')
+                broken.shutdown(wait=False)
+                self._pool = self._new_pool()
+            return self._pool
+
+
+_farm: WorkerFarm | None = None
+_farm_lock = threading.Lock()
+
+
+def get_farm() -> WorkerFarm:
+    global _farm
+    if _farm is None:
+        with _farm_lock:
+            if _farm is None:
+                _farm = WorkerFarm(settings.TTS_WORKERS, settings.TTS_QUEUE_MAX)
+    return _farm
@@ -43,9 +43,12 @@ INSTALLED_APPS = [
     'rest_framework',
     'accounts',
     'chat',
+    'tts',
 ]
 
 MIDDLEWARE = [
+    # Outermost, so its timings cover every other middleware too
+    'chat.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,6 +86,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Writers queue for the lock instead of failing with "database is locked": transactions
+            # take the write lock up front, and wait up to this many seconds for it
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': int(os.getenv('SQLITE_TIMEOUT', '20')),
+        },
     }
 }
 
@@ -137,6 +146,106 @@ LOGIN_URL = 'accounts:login'
 LOGIN_REDIRECT_URL = 'chat:home'
 LOGOUT_REDIRECT_URL = 'home'
 
+# OpenAI upstream and pooled HTTP client (see chat/llm.py)
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
+OPENAI_API_URL = os.getenv('OPENAI_API_URL', 'https://api.openai.com/v1/chat/completions')
+LLM_POOL_SIZE = int(os.getenv('LLM_POOL_SIZE', '20'))
+# Async views multiplex many slow requests per process, so they get a larger pool
+LLM_ASYNC_POOL_SIZE = int(os.getenv('LLM_ASYNC_POOL_SIZE', '500'))
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', '5'))
+LLM_READ_TIMEOUT = float(os.getenv('LLM_READ_TIMEOUT', '90'))
+# Retries on 429/5xx and failed connects, with full-jitter exponential backoff (see chat/resilience.py)
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', '0.5'))
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', '8'))
+# Give up at once when the upstream asks us to wait longer than this
+LLM_RETRY_AFTER_MAX = float(os.getenv('LLM_RETRY_AFTER_MAX', '20'))
+# Per-model circuit breaker: open after N consecutive upstream failures, probe again after the cooldown
+LLM_BREAKER_THRESHOLD = int(os.getenv('LLM_BREAKER_THRESHOLD', '5'))
+LLM_BREAKER_COOLDOWN = float(os.getenv('LLM_BREAKER_COOLDOWN', '30'))
+# Send a duplicate non-streaming request when the first is slower than this many seconds (0 disables)
+LLM_HEDGE_AFTER = float(os.getenv('LLM_HEDGE_AFTER', '0'))
+
+# Context window packing (see chat/context.py)
+CHAT_CONTEXT_MAX_TOKENS = int(os.getenv('CHAT_CONTEXT_MAX_TOKENS', '8000'))
+CHAT_REPLY_RESERVE_TOKENS = int(os.getenv('CHAT_REPLY_RESERVE_TOKENS', '1024'))
+# Fold older turns into a rolling per-chat summary every N turns, keeping the latest messages verbatim
+CHAT_SUMMARY_EVERY_TURNS = int(os.getenv('CHAT_SUMMARY_EVERY_TURNS', '10'))
+CHAT_SUMMARY_KEEP_RECENT = int(os.getenv('CHAT_SUMMARY_KEEP_RECENT', '6'))
+
+# UserMemory / system prompt cache (see chat/memory.py)
+CHAT_MEMORY_LOCAL_CACHE_SIZE = int(os.getenv('CHAT_MEMORY_LOCAL_CACHE_SIZE', '2048'))
+CHAT_MEMORY_CACHE_TTL = int(os.getenv('CHAT_MEMORY_CACHE_TTL', '3600'))
+# How stale another process's memory may get when CACHES is process-local (the default)
+CHAT_MEMORY_LOCAL_TTL = float(os.getenv('CHAT_MEMORY_LOCAL_TTL', '5'))
+
+# Background jobs (memory extraction, title generation)
+CHAT_JOB_WORKERS = int(os.getenv('CHAT_JOB_WORKERS', '2'))
+# Seconds before a failed job's first retry; each further retry waits twice as long
+CHAT_JOB_RETRY_DELAY = float(os.getenv('CHAT_JOB_RETRY_DELAY', '5'))
+# Seconds a claimed job may stay 'running' before its worker is presumed dead and the job requeued;
+# keep it well above the longest a job can take (LLM timeouts times retries)
+CHAT_JOB_LEASE = float(os.getenv('CHAT_JOB_LEASE', '600'))
+# Fact extraction is batched: one LLM call per N messages or per window, whichever comes first
+CHAT_MEMORY_BATCH_SIZE = int(os.getenv('CHAT_MEMORY_BATCH_SIZE', '20'))
+CHAT_MEMORY_BATCH_WINDOW = float(os.getenv('CHAT_MEMORY_BATCH_WINDOW', '2.0'))
+
+# Duplicate send coalescing (see chat/singleflight.py); the wait must outlast LLM_READ_TIMEOUT
+CHAT_SINGLEFLIGHT_WAIT = float(os.getenv('CHAT_SINGLEFLIGHT_WAIT', '120'))
+CHAT_IDEMPOTENCY_TTL = int(os.getenv('CHAT_IDEMPOTENCY_TTL', str(24 * 3600)))
+
+# Response cache for deterministic LLM calls (see chat/llm_cache.py): 'locmem', 'file', 'db' or '' to disable
+LLM_CACHE_BACKEND = os.getenv('LLM_CACHE_BACKEND', 'locmem')
+LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '10000'))
+LLM_CACHE_DIR = os.getenv('LLM_CACHE_DIR', os.path.join(BASE_DIR, '.cache', 'llm'))
+
+# Server-Timing response header from chat.middleware.RequestTimingMiddleware; per-request log lines
+# go to the 'chat.timing' logger either way
+CHAT_SERVER_TIMING = os.getenv('CHAT_SERVER_TIMING', 'True') == 'True'
+
+# Per-process metric files merged by /metrics (see chat.metrics); empty it on deploy, ideally a tmpfs.
+# With CHAT_METRICS_TOKEN set, /metrics requires 'Authorization: Bearer <token>'; without it, only staff
+# users may read it (and localhost, under DEBUG). Set a token for Prometheus in production.
+CHAT_METRICS_DIR = os.getenv('CHAT_METRICS_DIR', os.path.join(BASE_DIR, '.metrics'))
+CHAT_METRICS_TOKEN = os.getenv('CHAT_METRICS_TOKEN', '')
+
+# Text to speech: a built-in engine name from tts.engine.ENGINES or the dotted path of an Engine subclass
+TTS_ENGINE = os.getenv('TTS_ENGINE', 'formant')
+TTS_DEFAULT_VOICE = os.getenv('TTS_DEFAULT_VOICE', 'alto')
+# Longest message text synthesized in one request; the rest is not spoken
+TTS_MAX_CHARS = int(os.getenv('TTS_MAX_CHARS', '5000'))
+# Speech worker processes per server process (see tts.workers), and how many jobs may wait for
+# one before requests get a 503; size TTS_WORKERS so that all servers on a node share its cores
+TTS_WORKERS = int(os.getenv('TTS_WORKERS', str(os.cpu_count() or 2)))
+TTS_QUEUE_MAX = int(os.getenv('TTS_QUEUE_MAX', '64'))
+# Seconds a stream already under way waits for room in a full queue before it gives up
+TTS_QUEUE_TIMEOUT = float(os.getenv('TTS_QUEUE_TIMEOUT', '10'))
+# How many sentences one stream may have rendering at once
+TTS_PIPELINE_DEPTH = int(os.getenv('TTS_PIPELINE_DEPTH', '3'))
+# Set to 1 to render every reply in its user's preferred voice in the background, ahead of Listen
+TTS_PREGENERATE = os.getenv('TTS_PREGENERATE', '0') == '1'
+# Cloned voices (see tts.profiles): upload limits, and how many embeddings each process keeps warm
+TTS_PROFILE_MAX_BYTES = int(os.getenv('TTS_PROFILE_MAX_BYTES', str(10 * 1024 * 1024)))
+TTS_PROFILE_MAX_SECONDS = float(os.getenv('TTS_PROFILE_MAX_SECONDS', '60'))
+TTS_PROFILES_PER_USER = int(os.getenv('TTS_PROFILES_PER_USER', '5'))
+TTS_PROFILE_CACHE_SIZE = int(os.getenv('TTS_PROFILE_CACHE_SIZE', '256'))
+# On-disk cache of rendered speech (see tts.cache), pruned least recently used first; 0 disables it
+TTS_CACHE_DIR = os.getenv('TTS_CACHE_DIR', os.path.join(BASE_DIR, '.cache', 'tts'))
+TTS_CACHE_MAX_BYTES = int(os.getenv('TTS_CACHE_MAX_BYTES', str(1024 ** 3)))
+
+# Logging: surface operational info from the chat app on the console
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'chat': {'handlers': ['console'], 'level': os.getenv('CHAT_LOG_LEVEL', 'INFO')},
+    },
+}
+
 # Email configuration
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
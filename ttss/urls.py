@@ -18,10 +18,13 @@ from django.contrib import admin
 from django.urls import path, include
 from django.views.generic import TemplateView
 
+from chat.views import prometheus_metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include(('accounts.urls', 'accounts'), namespace='accounts')),
     path('chat/', include(('chat.urls', 'chat'), namespace='chat')),
     path('', TemplateView.as_view(template_name='pages/home.html'), name='home'),
     path('about/', TemplateView.as_view(template_name='pages/about.html'), name='about'),
+    path('metrics', prometheus_metrics, name='metrics'),
 ]